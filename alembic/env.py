@@ -34,6 +34,7 @@ from app.models.message import Message  # noqa: E402
 from app.models.verification import Verification  # noqa: E402
 from app.models.report import Report  # noqa: E402
 from app.models.chat import ChatMessage, BlockedUser, ChatRoom, MessageReaction  # noqa: E402
+from app.models.broadcast import BroadcastPayload  # noqa: E402
 
 # Add your model's MetaData object here for 'autogenerate' support
 target_metadata = Base.metadata
@@ -82,11 +83,15 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        # Transactions are alembic's, one per migration, so a migration can step out
+        # of its transaction with autocommit_block() (e.g. CREATE INDEX CONCURRENTLY)
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
         )
 
-        with connection.begin():
+        with context.begin_transaction():
             context.run_migrations()
 
 
@@ -0,0 +1,72 @@
+"""Add indexes matching the hot query shapes
+
+Built with CREATE INDEX CONCURRENTLY so the tables stay writable while the
+indexes build; that cannot run inside a transaction, hence autocommit_block().
+
+Revision ID: a3c1e9d4f7b2
+Revises: 5112f5617f88
+Create Date: 2025-09-08 10:12:41.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c1e9d4f7b2'
+down_revision: Union[str, Sequence[str], None] = '5112f5617f88'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, partial-index predicate)
+INDEXES = [
+    # Chat history: one conversation (listing + ordered participant pair), newest first
+    ('ix_chat_messages_conversation', 'chat_messages',
+     ['listing_id', 'sender_id', 'receiver_id', sa.text('timestamp DESC')], None),
+    # Marking a conversation read only touches the unread rows
+    ('ix_chat_messages_unread', 'chat_messages', ['receiver_id', 'listing_id', 'sender_id'], 'read_at IS NULL'),
+    # Chat room list: rooms where the user is either participant
+    ('ix_chat_rooms_participant1', 'chat_rooms', ['participant1_id', sa.text('last_message_at DESC')], None),
+    ('ix_chat_rooms_participant2', 'chat_rooms', ['participant2_id', sa.text('last_message_at DESC')], None),
+    # Notification list (newest first) and the unread count / unread-only list
+    ('ix_notifications_user_created', 'notifications', ['user_id', sa.text('created_at DESC')], None),
+    ('ix_notifications_user_unread', 'notifications', ['user_id', sa.text('created_at DESC')], 'NOT is_read'),
+    # Browse (no filter), search/admin by status, and the ACTIVE-only search/trending paths
+    ('ix_listings_created_at', 'listings', [sa.text('created_at DESC')], None),
+    ('ix_listings_status_created_at', 'listings', ['status', sa.text('created_at DESC')], None),
+    ('ix_listings_active_created_at', 'listings', [sa.text('created_at DESC')], "status = 'ACTIVE'"),
+    # Reviews of a user
+    ('ix_reviews_reviewed_id', 'reviews', ['reviewed_id'], None),
+]
+
+# Left-prefixes of the composite indexes above; keeping them only costs writes
+REDUNDANT = [
+    ('ix_listings_status', 'listings', ['status']),
+    ('ix_notifications_user_id', 'notifications', ['user_id']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+        for name, table, _ in REDUNDANT:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+        for table in {table for _, table, _, _ in INDEXES}:
+            op.execute(f'ANALYZE {table}')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in REDUNDANT:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,61 @@
+"""Add per-room event sequence numbers: chat_rooms.last_seq and chat_messages.seq
+
+chat_messages.seq is the sequence number of the last event that touched the message,
+so a resuming client's gap is `room_id = ? AND seq > ?`. Existing messages keep a NULL
+seq: no client can hold a seq from before this revision. Both columns are added
+without a table rewrite (a constant default is metadata-only) and the index is built
+concurrently. The build runs outside a transaction, so after a failed upgrade the
+columns are already there: every step tolerates its own leftovers and the upgrade can
+simply be run again.
+
+Revision ID: a8d4e2f6c1b9
+Revises: f2a6d8c3b5e1
+Create Date: 2025-09-12 16:03:27.845190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d4e2f6c1b9'
+down_revision: Union[str, Sequence[str], None] = 'f2a6d8c3b5e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _drop_invalid_index(name: str) -> None:
+    # A CREATE INDEX CONCURRENTLY that failed leaves an invalid index that
+    # IF NOT EXISTS would happily keep
+    invalid = op.get_bind().scalar(sa.text(
+        'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE c.relname = :name AND NOT i.indisvalid'
+    ), {'name': name})
+    if invalid:
+        op.drop_index(name, table_name='chat_messages', postgresql_concurrently=True)
+
+
+def upgrade() -> None:
+    op.add_column(
+        'chat_rooms', sa.Column('last_seq', sa.Integer(), server_default='0', nullable=False), if_not_exists=True,
+    )
+    op.add_column('chat_messages', sa.Column('seq', sa.Integer(), nullable=True), if_not_exists=True)
+
+    with op.get_context().autocommit_block():
+        _drop_invalid_index('ix_chat_messages_room_seq')
+        op.create_index(
+            'ix_chat_messages_room_seq', 'chat_messages', ['room_id', 'seq'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_chat_messages_room_seq', table_name='chat_messages',
+            postgresql_concurrently=True, if_exists=True,
+        )
+    op.drop_column('chat_messages', 'seq', if_exists=True)
+    op.drop_column('chat_rooms', 'last_seq', if_exists=True)
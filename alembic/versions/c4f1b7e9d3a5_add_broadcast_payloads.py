@@ -0,0 +1,37 @@
+"""Add broadcast_payloads: events too large for NOTIFY, published by reference
+
+The Postgres broadcast backend stores an event over the NOTIFY payload limit here and
+notifies its id; receivers read it back. Rows are only needed for a few seconds, so
+the table is UNLOGGED and publishers delete rows older than a minute.
+
+Revision ID: c4f1b7e9d3a5
+Revises: a8d4e2f6c1b9
+Create Date: 2025-09-15 11:22:40.318562
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f1b7e9d3a5'
+down_revision: Union[str, Sequence[str], None] = 'a8d4e2f6c1b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'broadcast_payloads',
+        sa.Column('id', sa.BigInteger(), primary_key=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        prefixes=['UNLOGGED'],
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('broadcast_payloads', if_exists=True)
@@ -0,0 +1,122 @@
+"""Add chat_messages.room_id, backfilled from the conversation columns
+
+Messages older than their room (or from conversations that never got a room row)
+get a room created first. The backfill runs in id-range batches, each committed on
+its own, and the constraints are added NOT VALID and validated afterwards, so no
+step holds a lock on chat_messages for the length of a table scan.
+
+Everything from the backfill on runs outside a transaction, so a failed upgrade
+leaves its finished steps behind; every step checks for its own leftovers and the
+upgrade can simply be run again.
+
+Revision ID: e4b7c1f9a2d6
+Revises: a3c1e9d4f7b2
+Create Date: 2025-09-10 14:27:05.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7c1f9a2d6'
+down_revision: Union[str, Sequence[str], None] = 'a3c1e9d4f7b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH = 10_000
+
+
+def _constraint_exists(name: str) -> bool:
+    return bool(op.get_bind().scalar(sa.text('SELECT 1 FROM pg_constraint WHERE conname = :name'), {'name': name}))
+
+
+def _drop_invalid_index(name: str) -> None:
+    # A CREATE INDEX CONCURRENTLY that failed leaves an invalid index that
+    # IF NOT EXISTS would happily keep
+    invalid = op.get_bind().scalar(sa.text(
+        'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE c.relname = :name AND NOT i.indisvalid'
+    ), {'name': name})
+    if invalid:
+        op.drop_index(name, table_name='chat_messages', postgresql_concurrently=True)
+
+
+def upgrade() -> None:
+    op.add_column('chat_messages', sa.Column('room_id', sa.Integer(), nullable=True), if_not_exists=True)
+
+    # Rooms for conversations that only exist as messages; participants stored ordered
+    op.execute("""
+        INSERT INTO chat_rooms (listing_id, participant1_id, participant2_id, created_at, last_message_at, status)
+        SELECT m.listing_id, LEAST(m.sender_id, m.receiver_id), GREATEST(m.sender_id, m.receiver_id),
+               MIN(m.timestamp), MAX(m.timestamp), 'active'
+        FROM chat_messages m
+        WHERE NOT EXISTS (
+            SELECT 1 FROM chat_rooms r
+            WHERE r.listing_id = m.listing_id
+              AND ((r.participant1_id = m.sender_id AND r.participant2_id = m.receiver_id)
+                OR (r.participant1_id = m.receiver_id AND r.participant2_id = m.sender_id))
+        )
+        GROUP BY m.listing_id, LEAST(m.sender_id, m.receiver_id), GREATEST(m.sender_id, m.receiver_id)
+    """)
+
+    # Each batch and each constraint step commits on its own
+    with op.get_context().autocommit_block():
+        max_id = op.get_bind().scalar(sa.text('SELECT COALESCE(MAX(id), 0) FROM chat_messages'))
+        for start in range(0, max_id + 1, BATCH):
+            op.execute(f"""
+                UPDATE chat_messages m SET room_id = r.id
+                FROM chat_rooms r
+                WHERE m.id >= {start} AND m.id < {start + BATCH}
+                  AND m.room_id IS NULL
+                  AND r.listing_id = m.listing_id
+                  AND ((r.participant1_id = m.sender_id AND r.participant2_id = m.receiver_id)
+                    OR (r.participant1_id = m.receiver_id AND r.participant2_id = m.sender_id))
+            """)
+
+        if not _constraint_exists('fk_chat_messages_room_id'):
+            op.execute(
+                'ALTER TABLE chat_messages ADD CONSTRAINT fk_chat_messages_room_id '
+                'FOREIGN KEY (room_id) REFERENCES chat_rooms (id) ON DELETE CASCADE NOT VALID'
+            )
+        # A no-op once validated
+        op.execute('ALTER TABLE chat_messages VALIDATE CONSTRAINT fk_chat_messages_room_id')
+
+        # A validated CHECK lets SET NOT NULL skip its own full-table scan
+        op.execute('ALTER TABLE chat_messages DROP CONSTRAINT IF EXISTS ck_chat_messages_room_id_not_null')
+        op.execute(
+            'ALTER TABLE chat_messages ADD CONSTRAINT ck_chat_messages_room_id_not_null '
+            'CHECK (room_id IS NOT NULL) NOT VALID'
+        )
+        op.execute('ALTER TABLE chat_messages VALIDATE CONSTRAINT ck_chat_messages_room_id_not_null')
+        op.execute('ALTER TABLE chat_messages ALTER COLUMN room_id SET NOT NULL')
+        op.execute('ALTER TABLE chat_messages DROP CONSTRAINT ck_chat_messages_room_id_not_null')
+
+        _drop_invalid_index('ix_chat_messages_room_id')
+        op.create_index(
+            'ix_chat_messages_room_id', 'chat_messages', ['room_id', 'id'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        # History is read by room now
+        op.drop_index(
+            'ix_chat_messages_conversation', table_name='chat_messages',
+            postgresql_concurrently=True, if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        _drop_invalid_index('ix_chat_messages_conversation')
+        op.create_index(
+            'ix_chat_messages_conversation', 'chat_messages',
+            ['listing_id', 'sender_id', 'receiver_id', sa.text('timestamp DESC')],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_chat_messages_room_id', table_name='chat_messages',
+            postgresql_concurrently=True, if_exists=True,
+        )
+    op.drop_constraint('fk_chat_messages_room_id', 'chat_messages', type_='foreignkey', if_exists=True)
+    op.drop_column('chat_messages', 'room_id', if_exists=True)
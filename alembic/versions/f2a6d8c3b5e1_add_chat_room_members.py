@@ -0,0 +1,86 @@
+"""Add chat_room_members: per-participant read watermark and unread count
+
+Backfilled from chat_messages: the watermark is the newest message the participant
+has read, the count is what they haven't. Reads are marked by room up to the watermark
+now, so the unread index keyed on listing/sender is replaced by one on (room_id,
+receiver_id, id).
+
+Revision ID: f2a6d8c3b5e1
+Revises: e4b7c1f9a2d6
+Create Date: 2025-09-11 09:41:52.604719
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6d8c3b5e1'
+down_revision: Union[str, Sequence[str], None] = 'e4b7c1f9a2d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _drop_invalid_index(name: str) -> None:
+    # A CREATE INDEX CONCURRENTLY that failed leaves an invalid index that
+    # IF NOT EXISTS would happily keep
+    invalid = op.get_bind().scalar(sa.text(
+        'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE c.relname = :name AND NOT i.indisvalid'
+    ), {'name': name})
+    if invalid:
+        op.drop_index(name, table_name='chat_messages', postgresql_concurrently=True)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'chat_room_members',
+        sa.Column('room_id', sa.Integer(), sa.ForeignKey('chat_rooms.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('user_id', sa.String(length=100), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('last_read_message_id', sa.Integer(), nullable=True),
+        sa.Column('unread_count', sa.Integer(), server_default='0', nullable=False),
+        if_not_exists=True,
+    )
+    op.create_index('ix_chat_room_members_user_id', 'chat_room_members', ['user_id'], if_not_exists=True)
+
+    op.execute("""
+        INSERT INTO chat_room_members (room_id, user_id, last_read_message_id, unread_count)
+        SELECT r.id, p.user_id,
+               (SELECT MAX(m.id) FROM chat_messages m
+                WHERE m.room_id = r.id AND m.receiver_id = p.user_id AND m.read_at IS NOT NULL),
+               (SELECT COUNT(*) FROM chat_messages m
+                WHERE m.room_id = r.id AND m.receiver_id = p.user_id AND m.read_at IS NULL)
+        FROM chat_rooms r
+        CROSS JOIN LATERAL (VALUES (r.participant1_id), (r.participant2_id)) AS p (user_id)
+        ON CONFLICT DO NOTHING
+    """)
+
+    with op.get_context().autocommit_block():
+        _drop_invalid_index('ix_chat_messages_room_unread')
+        op.create_index(
+            'ix_chat_messages_room_unread', 'chat_messages', ['room_id', 'receiver_id', 'id'],
+            postgresql_where=sa.text('read_at IS NULL'),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_chat_messages_unread', table_name='chat_messages',
+            postgresql_concurrently=True, if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        _drop_invalid_index('ix_chat_messages_unread')
+        op.create_index(
+            'ix_chat_messages_unread', 'chat_messages', ['receiver_id', 'listing_id', 'sender_id'],
+            postgresql_where=sa.text('read_at IS NULL'),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_chat_messages_room_unread', table_name='chat_messages',
+            postgresql_concurrently=True, if_exists=True,
+        )
+    op.drop_index('ix_chat_room_members_user_id', table_name='chat_room_members', if_exists=True)
+    op.drop_table('chat_room_members', if_exists=True)
@@ -1,9 +1,13 @@
-from typing import Annotated
-from fastapi import Depends, HTTPException, status
+from typing import Annotated, Optional
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.db import statements
+from app.db.routing import replica_router
+from app.db.session import AsyncSessionLocal, SessionLocal
 from app.core.security import decode_token
+from app.core.context import current_request
 from app.models.user import User
 
 # Use HTTPBearer to show only a token field in Swagger
@@ -17,26 +21,80 @@ def get_db():
     finally:
         db.close()
 
+# Async DB session for handlers that run on the event loop
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _reader(request: Request) -> Optional[str]:
+    """Who is reading, for read-your-writes; a cheap token decode, no DB lookup"""
+    ctx = current_request()
+    if ctx is not None and ctx.user_id:
+        return ctx.user_id
+    auth = request.headers.get("authorization")
+    if not auth or not auth.lower().startswith("bearer "):
+        return None
+    payload = decode_token(auth[7:])
+    return payload.get("sub") if payload else None
+
+# Read-only DB session: a healthy replica when configured, otherwise the primary.
+# Only for handlers that never write; users who just wrote stay on the primary briefly.
+def get_read_db(request: Request):
+    replica = replica_router.pick(_reader(request))
+    db = replica.session_factory() if replica else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_read_db_async(request: Request):
+    replica = replica_router.pick(_reader(request))
+    async with (replica.async_session_factory if replica else AsyncSessionLocal)() as db:
+        yield db
+
 # Type annotations for cleaner reuse
 TokenDep = Annotated[HTTPAuthorizationCredentials, Depends(bearer_scheme)]
 DbDep = Annotated[Session, Depends(get_db)]
+AsyncDbDep = Annotated[AsyncSession, Depends(get_async_db)]
+ReadDbDep = Annotated[Session, Depends(get_read_db)]
+AsyncReadDbDep = Annotated[AsyncSession, Depends(get_read_db_async)]
+
+def _user_id_from_token(credentials: HTTPAuthorizationCredentials) -> str:
+    payload = decode_token(credentials.credentials)
+    if not payload or "sub" not in payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials"
+        )
+    return payload["sub"]
+
+def _remember_user(user: User) -> User:
+    ctx = current_request()
+    if ctx is not None:
+        ctx.user_id = user.id
+    return user
 
 # Get the current user from token
 def get_current_user(credentials: TokenDep, db: DbDep) -> User:
-    token = credentials.credentials  # Extract the raw token string
-    payload = decode_token(token)
-    if not payload or "sub" not in payload:
+    user_id = _user_id_from_token(credentials)
+    user = db.scalar(statements.user_by_id(user_id))
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
-    user = db.query(User).filter(User.id == payload["sub"]).first()
+    return _remember_user(user)
+
+# Same as get_current_user, for handlers using AsyncDbDep
+async def get_current_user_async(credentials: TokenDep, db: AsyncDbDep) -> User:
+    user_id = _user_id_from_token(credentials)
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
-    return user
+    return _remember_user(user)
 
 # Ensure current user is admin
 def get_current_admin(user: User = Depends(get_current_user)) -> User:
@@ -4,7 +4,7 @@ from sqlalchemy import func, desc, and_, or_, text
 from typing import Optional, List
 from datetime import datetime, timedelta
 
-from app.api.deps import get_db, get_current_admin
+from app.api.deps import get_db, get_read_db, get_current_admin
 from app.models.user import User
 from app.models.listing import Listing
 from app.models.chat import ChatMessage, BlockedUser, ChatRoom
@@ -14,15 +14,17 @@ from app.schemas.admin import (
     AdminUserOut, AdminListingOut, AdminStatsOut, 
     AdminReportOut, AdminVerificationOut, UserUpdateRequest,
     ListingModerationRequest, SystemHealthOut, PaginatedUsersResponse,
-    PaginatedListingsResponse, PaginatedReportsResponse, PaginatedVerificationsResponse
+    PaginatedListingsResponse, PaginatedReportsResponse, PaginatedVerificationsResponse,
+    SlowQueryOut
 )
+from app.db.slowlog import slow_query_log
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
 @router.get("/stats", response_model=AdminStatsOut)
 def get_admin_stats(
     days: int = Query(30, ge=1, le=365, description="Number of days for stats"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     admin: User = Depends(get_current_admin)
 ):
     """Get comprehensive admin dashboard statistics"""
@@ -80,7 +82,7 @@ def list_users(
     search: Optional[str] = Query(None, description="Search by email or university"),
     verified_only: Optional[bool] = Query(None),
     admin_only: Optional[bool] = Query(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     admin: User = Depends(get_current_admin)
 ):
     """Get paginated list of users with filtering options"""
@@ -166,7 +168,7 @@ def list_listings(
     status: Optional[str] = Query(None, description="Filter by status"),
     category: Optional[str] = Query(None, description="Filter by category"),
     search: Optional[str] = Query(None, description="Search in title/description"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     admin: User = Depends(get_current_admin)
 ):
     """Get paginated list of listings with filtering"""
@@ -243,7 +245,7 @@ def list_reports(
     page_size: int = Query(20, ge=1, le=100),
     status: Optional[str] = Query(None, description="Filter by status"),
     report_type: Optional[str] = Query(None, description="Filter by report type"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     admin: User = Depends(get_current_admin)
 ):
     """Get paginated list of reports"""
@@ -297,7 +299,7 @@ def list_verifications(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     status: Optional[str] = Query(None, description="Filter by status"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     admin: User = Depends(get_current_admin)
 ):
     """Get paginated list of verification requests"""
@@ -379,6 +381,20 @@ def get_system_health(
         timestamp=datetime.utcnow()
     )
 
+@router.get("/system/slow-queries", response_model=List[SlowQueryOut])
+def list_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    admin: User = Depends(get_current_admin)
+):
+    """Most recent slow SQL statements captured by this worker, newest first"""
+    return slow_query_log.snapshot(limit)
+
+@router.delete("/system/slow-queries")
+def clear_slow_queries(admin: User = Depends(get_current_admin)):
+    """Empty this worker's slow query buffer"""
+    slow_query_log.clear()
+    return {"message": "Slow query log cleared"}
+
 @router.post("/system/maintenance")
 def toggle_maintenance_mode(
     enabled: bool = Query(..., description="Enable or disable maintenance mode"),
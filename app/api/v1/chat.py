@@ -1,25 +1,35 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status, HTTPException, UploadFile, File, Form, Query
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
-from starlette.websockets import WebSocketState
 from jose import JWTError, jwt
 from app.core.config import settings
 
-from app.api.deps import get_db, get_current_user
+from app.api.deps import AsyncDbDep, get_db, get_current_user, get_current_user_async
+from app.db import statements
+from app.db.session import AsyncSessionLocal
+from app.db.uow import UnitOfWork
 from app.models.chat import ChatMessage, BlockedUser, ChatRoom, MessageReaction
-from app.models.listing import Listing
 from app.models.user import User
-from app.schemas.chat import ChatMessageOut, ChatRoomOut, MessageReactionOut
+from app.schemas.chat import ChatInboxOut, ChatMessageOut, ChatRoomOut, MessageReactionOut, PresenceOut
 from app.utils.storage import save_upload
+from app.services import chat_inbox, chat_reads, chat_replay
+from app.services.broadcast import broadcast, publish_from_thread
+from app.services.message_ingest import message_ingestor
+from app.services.notification_service import user_channel
+from app.services.presence import presence
+from app.services.ws_connections import Connection, connections
 from typing import Dict, List, Optional
+from dataclasses import dataclass
+from datetime import datetime
 import html
+import asyncio
 import logging
 import json
-from datetime import datetime
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
-active_connections: Dict[str, List[WebSocket]] = {}
-
 JWT_SECRET = settings.JWT_SECRET
 JWT_ALGORITHM = settings.JWT_ALGORITHM
 
@@ -28,32 +38,105 @@ logger = logging.getLogger("chat_ws")
 def room_id(listing_id: int, u1: int, u2: int):
     return f"{listing_id}-{min(u1, u2)}-{max(u1, u2)}"
 
+@dataclass
+class RoomContext:
+    """A chat room as a socket uses it, resolved once when the socket joins the room"""
+    pk: int
+    listing_id: int
+    user_id: str
+    peer_id: str
+
+    @property
+    def channel(self) -> str:
+        # Keyed by listing and participants, as the per-room sockets always were
+        return f"chat:{room_id(self.listing_id, self.user_id, self.peer_id)}"
+
+def room_event(room: RoomContext, data: dict, exclude: Optional[str] = None, seq: Optional[int] = None) -> dict:
+    event = {"room": room.pk, "data": data, "exclude": exclude}
+    if seq is not None:
+        # Part of the room's history: numbered, and replayable to resuming clients
+        event["seq"] = data["seq"] = seq
+    return event
+
+async def publish_to_room(room: RoomContext, data: dict, exclude: Optional[str] = None, seq: Optional[int] = None):
+    """Send to every socket in the room on any worker; `exclude` skips the sending socket"""
+    await broadcast.publish(room.channel, room_event(room, data, exclude, seq))
+
+def publish_to_room_from_thread(room: RoomContext, data: dict, seq: Optional[int] = None):
+    """publish_to_room() for the sync endpoints"""
+    publish_from_thread(room.channel, room_event(room, data, seq=seq))
+
+def presence_out(status: dict) -> dict:
+    return {**status, "last_seen": status["last_seen"].isoformat() if status["last_seen"] else None}
+
+# Presence changes go to the sockets that have a room with that user open
+presence.add_listener(
+    lambda user_id, status: connections.send_to_watchers(user_id, {"presence": presence_out(status)})
+)
+
+def watch_peer(conn: Connection, room: RoomContext) -> None:
+    """Send the peer's presence now and whenever it changes"""
+    connections.watch(conn, room.peer_id)
+    reply(conn, room, {"presence": presence_out(presence.status(room.peer_id))})
+
+async def next_seq(db: AsyncSession, room: RoomContext) -> int:
+    """The room's next event sequence number (committed with the caller's transaction)"""
+    return await db.scalar(statements.next_chat_room_seq(room.pk), execution_options={"synchronize_session": False})
+
+async def resume(db: AsyncSession, conn: Connection, room: RoomContext, after: int) -> None:
+    """Replay what the client missed since seq `after`, then tell it where the room stands"""
+    source, frames, caught_up = await chat_replay.replay(db, room.pk, after)
+    for frame in frames:
+        reply(conn, room, frame)
+    reply(conn, room, {"resync": {"from": after, "to": caught_up, "source": source}})
+
+def reply(conn: Connection, room: RoomContext, data: dict) -> None:
+    """Send to this socket only, tagged with the room on a per-user socket"""
+    conn.send_json({"room": room.pk, **data} if conn.multiplexed else data)
+
 def create_message(db: Session, data: dict):
-    msg = ChatMessage(**data)
-    db.add(msg)
-    db.commit()
-    db.refresh(msg)
-    
-    # Update chat room last message timestamp
-    room = db.query(ChatRoom).filter(
-        ChatRoom.listing_id == data["listing_id"],
-        ((ChatRoom.participant1_id == data["sender_id"]) & (ChatRoom.participant2_id == data["receiver_id"])) |
-        ((ChatRoom.participant1_id == data["receiver_id"]) & (ChatRoom.participant2_id == data["sender_id"]))
-    ).first()
-    
-    if room:
-        room.last_message_at = msg.timestamp
-        db.commit()
-    
+    # One transaction: UPDATE room (seq and id), INSERT ... RETURNING message, unread count, COMMIT
+    with UnitOfWork(db) as uow:
+        seq, message_id = db.execute(
+            statements.touch_chat_room(data["room_id"]),
+            execution_options={"synchronize_session": False},
+        ).one()
+        msg = ChatMessage(**data, id=message_id, seq=seq)
+        db.add(msg)
+        uow.flush()
+        chat_reads.add_unread_sync(db, [{"room_id": msg.room_id, "receiver_id": msg.receiver_id, "id": msg.id}])
     return msg
 
-def user_blocked(db: Session, user_id: str, blocked_by: str):
-    return db.query(BlockedUser).filter(
-        BlockedUser.user_id == user_id,
-        BlockedUser.blocked_by == blocked_by
-    ).first() is not None
+async def publish_saved_messages(rows: List[dict]) -> None:
+    """Broadcast the messages of a committed write-behind batch, in seq order"""
+    for row in rows:
+        room = RoomContext(row["room_id"], row["listing_id"], row["sender_id"], row["receiver_id"])
+        msg_out = ChatMessageOut(**row).dict()
+        msg_out["timestamp"] = msg_out["timestamp"].isoformat()
+        await publish_to_room(room, msg_out, seq=row["seq"])
+
+message_ingestor.add_listener(publish_saved_messages)
 
-async def get_current_user_websocket(websocket: WebSocket, db: Session):
+async def ack_when_saved(conn: Connection, room: RoomContext, client_id, saved: asyncio.Future):
+    """Durable ack to the sender once the message's batch has committed (and been broadcast)"""
+    try:
+        row = await saved
+        ack = {"ack": row["id"], "client_id": client_id}
+    except Exception as e:
+        logger.error(f"Chat message from {room.user_id} in room {room.pk} could not be saved: {e}")
+        # Never broadcast, so there is nothing to take back; it has no id either
+        ack = {"nack": None, "client_id": client_id, "error": "Message could not be saved"}
+    reply(conn, room, ack)  # no-op if the socket closed while the batch was being written
+
+async def users_blocked(db: AsyncSession, user_a: str, user_b: str) -> bool:
+    """Whether either user has blocked the other"""
+    blocked = await db.scalar(select(BlockedUser.id).where(
+        ((BlockedUser.user_id == user_a) & (BlockedUser.blocked_by == user_b)) |
+        ((BlockedUser.user_id == user_b) & (BlockedUser.blocked_by == user_a))
+    ).limit(1))
+    return blocked is not None
+
+async def get_current_user_websocket(websocket: WebSocket, db: AsyncSession):
     auth = websocket.headers.get("authorization")
     if not auth or not auth.lower().startswith("bearer "):
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
@@ -66,7 +149,7 @@ async def get_current_user_websocket(websocket: WebSocket, db: Session):
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             raise Exception("Invalid token: no subject")
         # Optionally verify user in DB
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.scalar(statements.user_by_id(user_id))
         if not user:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             raise Exception("User not found")
@@ -76,69 +159,125 @@ async def get_current_user_websocket(websocket: WebSocket, db: Session):
         raise Exception("Token decode error")
 
 @router.get("/rooms", response_model=List[ChatRoomOut])
-def get_user_chat_rooms(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_user_chat_rooms(
+    db: AsyncDbDep,
+    current_user: User = Depends(get_current_user_async)
 ):
     """Get all chat rooms for the current user"""
-    rooms = db.query(ChatRoom).options(
-        joinedload(ChatRoom.listing),
-        joinedload(ChatRoom.participant1),
-        joinedload(ChatRoom.participant2)
-    ).filter(
+    # ChatRoomOut only carries ids, so the listing/participants aren't loaded
+    rooms = (await db.scalars(select(ChatRoom).where(
         (ChatRoom.participant1_id == current_user.id) | 
         (ChatRoom.participant2_id == current_user.id)
-    ).order_by(ChatRoom.last_message_at.desc().nullslast()).all()
+    ).order_by(ChatRoom.last_message_at.desc().nullslast()))).all()
     
     return rooms
 
+@router.get("/inbox", response_model=ChatInboxOut)
+async def get_chat_inbox(
+    db: AsyncDbDep,
+    before_at: Optional[datetime] = Query(None, description="Cursor: next_before_at of the previous page"),
+    before_id: Optional[int] = Query(None, description="Cursor: next_before_id of the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user_async)
+):
+    """The conversation list, newest first: peer, listing, last message and unread count per room"""
+    if (before_at is None) != (before_id is None):
+        raise HTTPException(status_code=400, detail="before_at and before_id must be given together")
+    before = (before_at, before_id) if before_at is not None else None
+    # One extra row tells whether there is another page
+    rows = (await db.execute(chat_inbox.inbox_query(current_user.id, limit + 1, before))).all()
+    has_more = len(rows) > limit
+    rooms = [chat_inbox.inbox_entry(row) for row in rows[:limit]]
+    # Online / last seen for every peer on the page, from the in-memory registry
+    statuses = presence.lookup({room["peer"]["id"] for room in rooms})
+    for room in rooms:
+        status = statuses[room["peer"]["id"]]
+        room["peer"].update(online=status["online"], last_seen=status["last_seen"])
+    return {
+        "rooms": rooms,
+        "has_more": has_more,
+        "next_before_at": rooms[-1]["last_message_at"] if has_more else None,
+        "next_before_id": rooms[-1]["id"] if has_more else None,
+    }
+
+@router.get("/presence", response_model=PresenceOut)
+async def get_presence(
+    user_ids: List[str] = Query(..., max_length=200, description="Users to look up; repeat the parameter"),
+    current_user: User = Depends(get_current_user_async)
+):
+    """Online status and last seen of up to 200 users at once"""
+    return {"users": list(presence.lookup(dict.fromkeys(user_ids)).values())}
+
+@router.get("/unread")
+async def get_unread_counts(
+    db: AsyncDbDep,
+    current_user: User = Depends(get_current_user_async)
+):
+    """Unread message badges: per room and in total"""
+    rooms = await chat_reads.unread_counts(db, current_user.id)
+    return {"total": sum(rooms.values()), "rooms": rooms}
+
 @router.get("/rooms/{room_id}/messages")
-def get_chat_messages(
+async def get_chat_messages(
+    db: AsyncDbDep,
     room_id: int,
-    page: int = 1,
-    page_size: int = 50,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    before_id: Optional[int] = Query(None, description="Older messages than this id (scrolling back)"),
+    after_id: Optional[int] = Query(None, description="Newer messages than this id (catching up)"),
+    page_size: int = Query(50, ge=1, le=200),
+    page: int = Query(1, ge=1, description="Deprecated offset paging, ignored when a cursor is given"),
+    current_user: User = Depends(get_current_user_async)
 ):
-    """Get messages for a specific chat room"""
-    room = db.query(ChatRoom).filter(ChatRoom.id == room_id).first()
+    """Get messages for a specific chat room, oldest first.
+
+    Without a cursor this is the newest page; pass `next_before_id` back as before_id
+    to scroll further into the history. Ids are the cursor because within a room they
+    grow in send order (app.services.message_ingest); a message gets its id in the
+    same transaction that stores it, so none can appear behind a cursor later.
+    """
+    room = await db.get(ChatRoom, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Chat room not found")
     
     if current_user.id not in [room.participant1_id, room.participant2_id]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    messages = db.query(ChatMessage).options(
-        joinedload(ChatMessage.sender),
-        joinedload(ChatMessage.reply_to)
-    ).filter(
-        ChatMessage.listing_id == room.listing_id,
-        ((ChatMessage.sender_id == room.participant1_id) & (ChatMessage.receiver_id == room.participant2_id)) |
-        ((ChatMessage.sender_id == room.participant2_id) & (ChatMessage.receiver_id == room.participant1_id)),
-        ChatMessage.deleted == False
-    ).order_by(ChatMessage.timestamp.desc()).offset((page - 1) * page_size).limit(page_size).all()
-    
-    # Mark messages as read
-    unread_messages = db.query(ChatMessage).filter(
-        ChatMessage.listing_id == room.listing_id,
-        ChatMessage.receiver_id == current_user.id,
-        ChatMessage.read_at.is_(None)
-    ).all()
-    
-    for msg in unread_messages:
-        msg.read_at = datetime.utcnow()
-    
-    db.commit()
+    query = select(ChatMessage).where(ChatMessage.room_id == room.id, ChatMessage.deleted == False)
+    if after_id is not None:
+        query = query.where(ChatMessage.id > after_id).order_by(ChatMessage.id.asc())
+    else:
+        if before_id is not None:
+            query = query.where(ChatMessage.id < before_id)
+        elif page > 1:
+            query = query.offset((page - 1) * page_size)
+        query = query.order_by(ChatMessage.id.desc())
+    # One extra row tells whether there is another page without a second query
+    messages = (await db.scalars(query.limit(page_size + 1))).all()
+    has_more = len(messages) > page_size
+    messages = list(messages[:page_size])
+    if after_id is None:
+        messages.reverse()
+
+    total = await db.scalar(
+        select(func.count()).select_from(ChatMessage).where(ChatMessage.room_id == room.id, ChatMessage.deleted == False)
+    )
+
+    # Everything up to the newest message shown is now read
+    if messages:
+        await chat_reads.mark_read(db, room.id, current_user.id, max(msg.id for msg in messages))
+        await db.commit()
     
     return {
-        "messages": [msg.to_dict() if hasattr(msg, 'to_dict') else ChatMessageOut.from_orm(msg).dict() for msg in reversed(messages)],
+        "messages": [ChatMessageOut.model_validate(msg).model_dump() for msg in messages],
         "page": page,
         "page_size": page_size,
-        "total": len(messages)
+        "total": total,
+        "has_more": has_more,
+        "next_before_id": messages[0].id if messages and has_more and after_id is None else None,
+        "next_after_id": messages[-1].id if messages and has_more and after_id is not None else None,
     }
 
 @router.post("/rooms/{room_id}/messages/file")
-async def upload_file_message(
+def upload_file_message(
     room_id: int,
     file: UploadFile = File(...),
     caption: Optional[str] = Form(None),
@@ -165,12 +304,13 @@ async def upload_file_message(
     other_participant = room.participant2_id if current_user.id == room.participant1_id else room.participant1_id
     
     message_data = {
+        "room_id": room.id,
         "listing_id": room.listing_id,
         "sender_id": current_user.id,
         "receiver_id": other_participant,
         "content": caption or f"Shared a {message_type}",
         "message_type": message_type,
-        "metadata": {
+        "message_metadata": {
             "file_url": file_url,
             "file_name": file.filename,
             "file_size": file.size,
@@ -179,7 +319,10 @@ async def upload_file_message(
     }
     
     message = create_message(db, message_data)
-    return ChatMessageOut.from_orm(message)
+    msg_out = ChatMessageOut.from_orm(message)
+    room_ctx = RoomContext(room.id, room.listing_id, current_user.id, other_participant)
+    publish_to_room_from_thread(room_ctx, msg_out.model_dump(mode="json"), seq=message.seq)
+    return msg_out
 
 @router.post("/messages/{message_id}/reactions")
 def add_reaction(
@@ -204,10 +347,18 @@ def add_reaction(
         MessageReaction.reaction == reaction
     ).first()
     
+    # Reactions are room events too: numbered, broadcast and replayable
+    seq = db.scalar(statements.next_chat_room_seq(message.room_id), execution_options={"synchronize_session": False})
+    message.seq = seq
+    peer_id = message.receiver_id if current_user.id == message.sender_id else message.sender_id
+    room = RoomContext(message.room_id, message.listing_id, current_user.id, peer_id)
+    event = {"message_id": message_id, "user_id": current_user.id, "reaction": reaction}
+
     if existing_reaction:
         # Remove reaction if it exists
         db.delete(existing_reaction)
         db.commit()
+        publish_to_room_from_thread(room, {"reaction": {**event, "added": False}}, seq=seq)
         return {"message": "Reaction removed"}
     else:
         # Add new reaction
@@ -218,6 +369,7 @@ def add_reaction(
         )
         db.add(new_reaction)
         db.commit()
+        publish_to_room_from_thread(room, {"reaction": {**event, "added": True}}, seq=seq)
         
         return {"message": "Reaction added"}
 
@@ -294,161 +446,279 @@ def get_blocked_users(
         for block in blocked
     ]
 
-@router.websocket("/{listing_id}/{peer_id}")
-async def chat_ws(websocket: WebSocket, listing_id: int, peer_id: str, db: Session = Depends(get_db)):
-    try:
-        # 🔐 Authenticate the user
-        try:
-            user_id = await get_current_user_websocket(websocket, db)
-        except Exception as e:
-            logger.error(f"Auth failed: {e}")
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return
+async def resolve_room(db: AsyncSession, user_id: str, listing_id: int, peer_id: str) -> Optional[RoomContext]:
+    """The user's room with the peer about the listing, created if needed.
 
-        # 🏷️ Check listing
-        listing = db.query(Listing).filter(Listing.id == listing_id).first()
-        if not listing:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return
+    None when they may not chat there: unknown listing, either one blocked the other,
+    self-chat, or neither of them is the seller.
+    """
+    # 🏷️ Check listing
+    listing = await db.scalar(statements.listing_by_id(listing_id))
+    if not listing:
+        return None
 
-        # 🚫 Check if user is blocked
-        if user_blocked(db, user_id, peer_id) or user_blocked(db, peer_id, user_id):
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return
+    # 🚫 Check if user is blocked, prevent self-chat
+    if peer_id == user_id or await users_blocked(db, user_id, peer_id):
+        return None
 
-        # 🚫 Prevent self-chat
-        if peer_id == user_id:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+    # ❌ One of the two must be the seller
+    if str(listing.owner_id) not in (user_id, peer_id):
+        return None
+
+    # 💬 Both participants may connect at once, so a lost race just reads the winner's row
+    room = await db.scalar(statements.chat_room_for(listing_id, user_id, peer_id))
+    if room:
+        room_pk = room.id
+    else:
+        room_pk = await db.scalar(
+            pg_insert(ChatRoom)
+            .values(listing_id=listing_id, participant1_id=min(user_id, peer_id), participant2_id=max(user_id, peer_id))
+            .on_conflict_do_nothing(constraint="uq_chat_room")
+            .returning(ChatRoom.id)
+        )
+        await db.commit()
+        if room_pk is None:
+            room_pk = (await db.scalar(statements.chat_room_for(listing_id, user_id, peer_id))).id
+    return RoomContext(room_pk, listing_id, user_id, peer_id)
+
+async def room_for_member(db: AsyncSession, user_id: str, pk: int) -> Optional[RoomContext]:
+    """An existing room by id, if the user is in it and neither participant blocked the other"""
+    room = await db.get(ChatRoom, pk)
+    if not room or user_id not in (room.participant1_id, room.participant2_id):
+        return None
+    peer_id = room.participant2_id if user_id == room.participant1_id else room.participant1_id
+    if await users_blocked(db, user_id, peer_id):
+        return None
+    return RoomContext(room.id, room.listing_id, user_id, peer_id)
+
+async def handle_room_frame(db: AsyncSession, conn: Connection, room: RoomContext, data: dict, pending_acks: set):
+    """One client frame for a room: typing, read receipt, edit, delete or a new message"""
+    user_id = room.user_id
+    if "typing" in data and data["typing"]:
+        await publish_to_room(room, {"typing": True, "user": user_id}, exclude=conn.id)
+
+    elif "delivery_receipt" in data:
+        # A watermark: everything up to this message has been read
+        message_id = int(data["delivery_receipt"])
+        await chat_reads.mark_read(db, room.pk, user_id, message_id)
+        await db.commit()
+
+        await publish_to_room(room, {"delivery_receipt": message_id, "user": user_id}, exclude=conn.id)
+
+    elif "edit_message" in data:
+        edit_data = data["edit_message"]
+        msg_db = await db.get(ChatMessage, int(edit_data["message_id"]))
+        if msg_db and msg_db.sender_id == user_id and msg_db.room_id == room.pk:
+            new_text = html.escape(edit_data["new_content"].strip())
+            if new_text:
+                msg_db.content = new_text
+                msg_db.edited = True
+                msg_db.seq = await next_seq(db, room)
+                await db.commit()
+                msg_out = ChatMessageOut.from_orm(msg_db).dict()
+                msg_out["timestamp"] = msg_out["timestamp"].isoformat()
+                await publish_to_room(room, {"edit_message": msg_out}, seq=msg_db.seq)
+
+    elif "delete_message" in data:
+        message_id = int(data["delete_message"])
+        msg_db = await db.get(ChatMessage, message_id)
+        if msg_db and msg_db.sender_id == user_id and msg_db.room_id == room.pk:
+            msg_db.deleted = True
+            msg_db.seq = await next_seq(db, room)
+            await db.commit()
+            await publish_to_room(room, {"delete_message": message_id}, seq=msg_db.seq)
+
+    elif "content" in data:
+        content = html.escape(data["content"].strip())
+        if not content:
             return
+        msg_in = {
+            "room_id": room.pk,
+            "listing_id": room.listing_id,
+            "sender_id": user_id,
+            "receiver_id": room.peer_id,
+            "content": content
+        }
+        if "reply_to" in data:
+            msg_in["reply_to_id"] = data["reply_to"]
+        # No database round trip here: the next write-behind batch numbers, stores and
+        # broadcasts it (publish_saved_messages), then it is acked
+        saved = await message_ingestor.submit(msg_in)
+        ack = asyncio.get_running_loop().create_task(
+            ack_when_saved(conn, room, data.get("client_id"), saved)
+        )
+        pending_acks.add(ack)
+        ack.add_done_callback(pending_acks.discard)
 
-        is_seller = user_id == str(listing.owner_id)
-        is_buyer_chatting_with_owner = peer_id == str(listing.owner_id)
+    else:
+        reply(conn, room, {"error": "Invalid payload."})
+
+@router.websocket("/ws")
+async def chat_user_ws(websocket: WebSocket):
+    """One socket per user for all of their conversations, and their notifications.
+
+    Client frames:
+      {"subscribe": <room id>}                                   join an existing room
+      {"subscribe": {"listing_id": <id>, "peer_id": <user id>}}  join, creating the room if needed
+        either one with "resume_from": <seq> replays what was missed (see app.services.chat_replay)
+      {"unsubscribe": <room id>}
+      {"room": <room id>, ...}   any frame of the per-room socket: content, reply_to,
+                                 typing, delivery_receipt, edit_message, delete_message
+      {"pong": ...}              answer to the server's {"ping": <unix time>}
+    Server frames that belong to a room carry its "room" id; notifications arrive as
+    {"notification": {...}} and peers going online/offline as {"presence": {...}}.
+    """
+    user_id = None
+    conn = None
+    rooms: Dict[int, RoomContext] = {}
+    pending_acks = set()
 
-        # ❌ Invalid access check
-        if not (is_seller or is_buyer_chatting_with_owner):
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return
+    try:
+        async with AsyncSessionLocal() as db:
+            # 🔐 Authenticate once for every conversation on this socket
+            try:
+                user_id = await get_current_user_websocket(websocket, db)
+            except Exception as e:
+                logger.error(f"Auth failed: {e}")
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+
+        await websocket.accept()
+        conn = connections.connect(websocket, multiplexed=True)
+        await connections.join(conn, user_channel(user_id))
+        await presence.connected(user_id)
+        logger.info(f"User {user_id} connected")
+
+        while True:
+            data = await websocket.receive_json()
+            conn.touch()
+            if "pong" in data:
+                continue
+
+            async with AsyncSessionLocal() as db:
+                try:
+                    if "subscribe" in data:
+                        target = data["subscribe"]
+                        if isinstance(target, dict):
+                            room = await resolve_room(db, user_id, int(target["listing_id"]), str(target["peer_id"]))
+                        else:
+                            room_id = int(target)  # "12" and 12 name the same room
+                            room = rooms.get(room_id) or await room_for_member(db, user_id, room_id)
+                        if room is None:
+                            conn.send_json({"error": "Chat room not available", "subscribe": target})
+                            continue
+                        rooms[room.pk] = room
+                        await connections.join(conn, room.channel)
+                        conn.send_json({"subscribed": room.pk, "listing_id": room.listing_id, "peer_id": room.peer_id})
+                        watch_peer(conn, room)
+                        if data.get("resume_from") is not None:
+                            await resume(db, conn, room, int(data["resume_from"]))
+
+                    elif "unsubscribe" in data:
+                        room_id = int(data["unsubscribe"])
+                        room = rooms.pop(room_id, None)
+                        if room is not None:
+                            await connections.leave(conn, room.channel)
+                            if all(other.peer_id != room.peer_id for other in rooms.values()):
+                                connections.unwatch(conn, room.peer_id)
+                        conn.send_json({"unsubscribed": room_id})
+
+                    elif "room" in data:
+                        room_id = int(data["room"])
+                        room = rooms.get(room_id)
+                        if room is None:
+                            conn.send_json({"room": room_id, "error": "Not subscribed to this room"})
+                            continue
+                        await handle_room_frame(db, conn, room, data, pending_acks)
+
+                    else:
+                        conn.send_json({"error": "Invalid payload."})
+
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    # A malformed frame must not drop every conversation on the socket
+                    conn.send_json({"error": f"Invalid payload: {e!r}"})
+
+    except WebSocketDisconnect:
+        logger.info(f"User {user_id} disconnected")
+
+    except Exception as e:
+        logger.error(f"Unexpected error in websocket: {e}", exc_info=True)
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # Connection already closed
+
+    finally:
+        if conn is not None:
+            await connections.disconnect(conn)
+            await presence.disconnected(user_id)
+
+@router.websocket("/{listing_id}/{peer_id}")
+async def chat_ws(
+    websocket: WebSocket, listing_id: int, peer_id: str, resume_from: Optional[int] = None, presence_updates: bool = False,
+):
+    """One socket per conversation; see chat_user_ws for one socket per user.
+
+    Reconnecting with ?resume_from=<seq> replays the events missed since then, and
+    ?presence_updates=true adds the peer's {"presence": {...}} frames. There are no
+    server pings here; idle sockets are detected with websocket protocol pings.
+    """
+    room = None
+    user_id = None
+    conn = None
+    pending_acks = set()
+
+    try:
+        # The handshake checks share one short-lived session; nothing holds a pooled
+        # connection while the socket sits idle
+        async with AsyncSessionLocal() as db:
+            # 🔐 Authenticate the user
+            try:
+                user_id = await get_current_user_websocket(websocket, db)
+            except Exception as e:
+                logger.error(f"Auth failed: {e}")
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+
+            room = await resolve_room(db, user_id, listing_id, peer_id)
+            if room is None:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
 
         # ✅ Accept the connection now
         await websocket.accept()
 
-        # 💬 Create or fetch chat room
-        room = db.query(ChatRoom).filter(
-            ChatRoom.listing_id == listing_id,
-            ((ChatRoom.participant1_id == user_id) & (ChatRoom.participant2_id == peer_id)) |
-            ((ChatRoom.participant1_id == peer_id) & (ChatRoom.participant2_id == user_id))
-        ).first()
-
-        if not room:
-            room = ChatRoom(
-                listing_id=listing_id,
-                participant1_id=min(user_id, peer_id),
-                participant2_id=max(user_id, peer_id)
-            )
-            db.add(room)
-            db.commit()
-
-        rid = room_id(listing_id, user_id, peer_id)
-        active_connections.setdefault(rid, []).append(websocket)
-        logger.info(f"User {user_id} connected to room {rid}")
+        # Everything sent to this socket from here on goes through its send queue
+        conn = connections.connect(websocket)
+        await connections.join(conn, room.channel)
+        await presence.connected(user_id)
+        if presence_updates:
+            watch_peer(conn, room)
+        logger.info(f"User {user_id} connected to room {room.pk}")
+
+        if resume_from is not None:
+            # Subscribed first, so nothing published meanwhile falls between replay and live
+            async with AsyncSessionLocal() as db:
+                await resume(db, conn, room, resume_from)
 
         while True:
             data = await websocket.receive_json()
 
-            if "typing" in data and data["typing"]:
-                for conn in active_connections.get(rid, []):
-                    if conn != websocket and conn.application_state == WebSocketState.CONNECTED:
-                        await conn.send_json({"typing": True, "user": user_id})
-
-            elif "delivery_receipt" in data:
-                message_id = data["delivery_receipt"]
-                msg = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
-                if msg and msg.receiver_id == user_id:
-                    msg.read_at = datetime.utcnow()
-                    db.commit()
-
-                for conn in active_connections.get(rid, []):
-                    if conn != websocket and conn.application_state == WebSocketState.CONNECTED:
-                        await conn.send_json({"delivery_receipt": message_id, "user": user_id})
-
-            elif "edit_message" in data:
-                edit_data = data["edit_message"]
-                msg_db = db.query(ChatMessage).filter(ChatMessage.id == edit_data["message_id"]).first()
-                if msg_db and msg_db.sender_id == user_id:
-                    new_text = html.escape(edit_data["new_content"].strip())
-                    if new_text:
-                        msg_db.content = new_text
-                        msg_db.edited = True
-                        db.commit()
-                        msg_out = ChatMessageOut.from_orm(msg_db).dict()
-                        msg_out["timestamp"] = msg_out["timestamp"].isoformat()
-                        for conn in active_connections.get(rid, []):
-                            if conn.application_state == WebSocketState.CONNECTED:
-                                await conn.send_json({"edit_message": msg_out})
-
-            elif "delete_message" in data:
-                message_id = data["delete_message"]
-                msg_db = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
-                if msg_db and msg_db.sender_id == user_id:
-                    msg_db.deleted = True
-                    db.commit()
-                    for conn in active_connections.get(rid, []):
-                        if conn.application_state == WebSocketState.CONNECTED:
-                            await conn.send_json({"delete_message": message_id})
-
-            elif "reply_to" in data:
-                content = html.escape(data["content"].strip())
-                reply_to_id = data["reply_to"]
-                if not content:
-                    continue
-                msg_in = {
-                    "listing_id": listing_id,
-                    "sender_id": user_id,
-                    "receiver_id": peer_id,
-                    "content": content,
-                    "reply_to_id": reply_to_id
-                }
-                msg = create_message(db, msg_in)
-                msg_out = ChatMessageOut.from_orm(msg).dict()
-                msg_out["timestamp"] = msg_out["timestamp"].isoformat()
-                for conn in list(active_connections.get(rid, [])):
-                    if conn.application_state == WebSocketState.CONNECTED:
-                        await conn.send_json(msg_out)
-
-            elif "content" in data:
-                content = html.escape(data["content"].strip())
-                if not content:
-                    continue
-                msg_in = {
-                    "listing_id": listing_id,
-                    "sender_id": user_id,
-                    "receiver_id": peer_id,
-                    "content": content
-                }
-                msg = create_message(db, msg_in)
-                msg_out = ChatMessageOut.from_orm(msg).dict()
-                msg_out["timestamp"] = msg_out["timestamp"].isoformat()
-                for conn in list(active_connections.get(rid, [])):
-                    if conn.application_state == WebSocketState.CONNECTED:
-                        await conn.send_json(msg_out)
-
-            else:
-                await websocket.send_json({"error": "Invalid payload."})
+            # A session per frame; it only checks out a connection if the frame needs the DB
+            async with AsyncSessionLocal() as db:
+                await handle_room_frame(db, conn, room, data, pending_acks)
 
     except WebSocketDisconnect:
-        if rid in active_connections and websocket in active_connections[rid]:
-            active_connections[rid].remove(websocket)
-            if not active_connections[rid]:
-                del active_connections[rid]
-        logger.info(f"User {user_id} disconnected from room {rid}")
+        logger.info(f"User {user_id} disconnected from room {room.pk if room else None}")
 
     except Exception as e:
         logger.error(f"Unexpected error in websocket: {e}", exc_info=True)
-        if rid in active_connections and websocket in active_connections[rid]:
-            active_connections[rid].remove(websocket)
-            if not active_connections[rid]:
-                del active_connections[rid]
         try:
             await websocket.close()
         except RuntimeError:
             pass  # Connection already closed
+
+    finally:
+        if conn is not None:
+            await connections.disconnect(conn)
+            await presence.disconnected(user_id)
@@ -3,10 +3,12 @@ from typing import List, Optional, Any
 from decimal import Decimal
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 
 from app.api import deps
 from app.core.config import settings
+from app.db import statements
+from app.db.uow import UnitOfWork
 from app.models.listing import Listing
 from app.models.user import User
 from app.schemas.listing import ListingOut, ListingUpdate, ListingStatusPatch
@@ -14,7 +16,7 @@ from app.utils.storage import (
     save_upload,
     gen_object_key,
     public_url_for_key,
-    get_s3_client,
+    upload_to_s3,
 )
 from app.services.notification_service import NotificationService
 
@@ -44,10 +46,9 @@ async def create_listing(
             urls.append(url)
     elif settings.STORAGE_BACKEND == "S3":
         # Upload files to S3 directly
-        s3_client = get_s3_client()
         for f in images or []:
             key = gen_object_key("listings", f.filename)
-            s3_client.upload_fileobj(f.file, settings.S3_BUCKET, key)
+            upload_to_s3(f.file, key)
             urls.append(public_url_for_key(key))
     else:
         raise HTTPException(status_code=500, detail="Invalid storage backend")
@@ -65,31 +66,31 @@ async def create_listing(
     search_text = f"{title} {description} {category}"
     obj.search_vector = func.to_tsvector("english", search_text)
 
-    db.add(obj)
-    db.commit()
-    db.refresh(obj)
-
-    NotificationService.notify_listing_created(db, obj, user.id)
+    with UnitOfWork(db) as uow:
+        db.add(obj)
+        uow.flush()  # the notification needs the listing id
+        NotificationService.notify_listing_created(db, obj, user.id, commit=False)
 
     return obj
 
 
 # -------- Get all listings (paginated) --------
 @router.get("", response_model=dict)
-def get_listings(
+async def get_listings(
+    db: deps.AsyncReadDbDep,
     limit: int = Query(5, ge=1, le=50, description="Number of items per page"),
     offset: int = Query(0, ge=0, description="Starting offset"),
-    db: Session = Depends(deps.get_db),
 ) -> Any:
-    total = db.query(Listing).count()
+    total = await db.scalar(select(func.count()).select_from(Listing))
 
     listings = (
-        db.query(Listing)
-        .order_by(Listing.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+        await db.scalars(
+            select(Listing)
+            .order_by(Listing.created_at.desc())
+            .offset(offset)
+            .limit(limit)
+        )
+    ).all()
 
     next_offset = offset + limit if offset + limit < total else None
 
@@ -103,8 +104,8 @@ def get_listings(
 
 # -------- Get listing by ID --------
 @router.get("/{listing_id}", response_model=ListingOut)
-def get_listing(listing_id: int, db: Session = Depends(deps.get_db)):
-    obj = db.query(Listing).filter(Listing.id == listing_id).first()
+async def get_listing(listing_id: int, db: deps.AsyncReadDbDep):
+    obj = await db.scalar(statements.listing_by_id(listing_id))
     if not obj:
         raise HTTPException(status_code=404, detail="Listing not found")
     return obj
@@ -118,7 +119,7 @@ def update_listing(
     db: Session = Depends(deps.get_db),
     user: User = Depends(deps.get_current_user),
 ):
-    obj = db.query(Listing).filter(Listing.id == listing_id).first()
+    obj = db.scalar(statements.listing_by_id(listing_id))
     if not obj:
         raise HTTPException(status_code=404, detail="Listing not found")
     if obj.owner_id != user.id:
@@ -142,18 +143,16 @@ def update_listing(
         elif field == "images" and value is not None:
             filtered_update_data[field] = value
 
-    for field, value in filtered_update_data.items():
-        setattr(obj, field, value)
+    with UnitOfWork(db):
+        for field, value in filtered_update_data.items():
+            setattr(obj, field, value)
 
-    if any(field in filtered_update_data for field in ["title", "description", "category"]):
-        search_text = f"{obj.title} {obj.description} {obj.category}"
-        obj.search_vector = func.to_tsvector("english", search_text)
+        if any(field in filtered_update_data for field in ["title", "description", "category"]):
+            search_text = f"{obj.title} {obj.description} {obj.category}"
+            obj.search_vector = func.to_tsvector("english", search_text)
 
-    db.commit()
-    db.refresh(obj)
-
-    if filtered_update_data:
-        NotificationService.notify_listing_updated(db, obj, user.id)
+        if filtered_update_data:
+            NotificationService.notify_listing_updated(db, obj, user.id, commit=False)
 
     return obj
 
@@ -166,7 +165,7 @@ def patch_status(
     db: Session = Depends(deps.get_db),
     user: User = Depends(deps.get_current_user),
 ):
-    obj = db.query(Listing).filter(Listing.id == listing_id).first()
+    obj = db.scalar(statements.listing_by_id(listing_id))
     if not obj:
         raise HTTPException(status_code=404, detail="Listing not found")
     if obj.owner_id != user.id:
@@ -174,9 +173,8 @@ def patch_status(
     if payload.status not in {"ACTIVE", "SOLD", "ARCHIVED"}:
         raise HTTPException(status_code=422, detail="Invalid status")
 
-    obj.status = payload.status
-    db.commit()
-    db.refresh(obj)
+    with UnitOfWork(db):
+        obj.status = payload.status
     return obj
 
 
@@ -187,7 +185,7 @@ def delete_listing(
     db: Session = Depends(deps.get_db),
     user: User = Depends(deps.get_current_user),
 ):
-    obj = db.query(Listing).filter(Listing.id == listing_id).first()
+    obj = db.scalar(statements.listing_by_id(listing_id))
     if not obj:
         raise HTTPException(status_code=404, detail="Listing not found")
     if obj.owner_id != user.id:
@@ -1,26 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from typing import List
-from app.api.deps import get_db, get_current_user
+from app.api.deps import AsyncDbDep, get_db, get_current_user, get_current_user_async
 from app.models.notification import Notification
 from app.schemas.notification import NotificationResponse, NotificationUpdate
 
 router = APIRouter(prefix="/notifications", tags=["Notifications"])
 
 @router.get("", response_model=List[NotificationResponse])
-def list_notifications(
+async def list_notifications(
+    db: AsyncDbDep,
     skip: int = 0, 
     limit: int = 50, 
     unread_only: bool = False,
-    db: Session = Depends(get_db), 
-    user=Depends(get_current_user)
+    user=Depends(get_current_user_async)
 ):
-    query = db.query(Notification).filter(Notification.user_id == user.id)
+    query = select(Notification).where(Notification.user_id == user.id)
     
     if unread_only:
-        query = query.filter(Notification.is_read == False)
+        query = query.where(Notification.is_read == False)
     
-    notifications = query.order_by(Notification.created_at.desc()).offset(skip).limit(limit).all()
+    notifications = (await db.scalars(query.order_by(Notification.created_at.desc()).offset(skip).limit(limit))).all()
     return notifications
 
 @router.patch("/{notification_id}", response_model=NotificationResponse)
@@ -53,9 +54,9 @@ def mark_all_read(db: Session = Depends(get_db), user=Depends(get_current_user))
     return {"status": "ok", "message": "All notifications marked as read"}
 
 @router.get("/unread-count")
-def get_unread_count(db: Session = Depends(get_db), user=Depends(get_current_user)):
-    count = db.query(Notification).filter(
+async def get_unread_count(db: AsyncDbDep, user=Depends(get_current_user_async)):
+    count = await db.scalar(select(func.count()).select_from(Notification).where(
         Notification.user_id == user.id,
         Notification.is_read == False
-    ).count()
+    ))
     return {"unread_count": count}
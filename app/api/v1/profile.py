@@ -7,7 +7,7 @@ from app.models.user import User
 from app.schemas.profile import ProfileOut, ProfileUpdate, DeleteAccountIn
 from app.core.security import verify_password
 from app.core.config import settings
-from app.utils.storage import save_upload, gen_object_key, public_url_for_key, get_s3_client
+from app.utils.storage import save_upload, gen_object_key, public_url_for_key, upload_to_s3
 
 router = APIRouter(prefix="/profile", tags=["Profile"])
 
@@ -40,9 +40,8 @@ async def update_me(
         if settings.STORAGE_BACKEND == "LOCAL":
             url = save_upload(profile_picture, subdir="profiles")
         elif settings.STORAGE_BACKEND == "S3":
-            s3_client = get_s3_client()
             key = gen_object_key("profiles", profile_picture.filename)
-            s3_client.upload_fileobj(profile_picture.file, settings.S3_BUCKET, key)
+            upload_to_s3(profile_picture.file, key)
             url = public_url_for_key(key)
         else:
             raise HTTPException(status_code=500, detail="Invalid storage backend")
@@ -1,10 +1,11 @@
 # app/api/v1/reviews.py
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, update
 from typing import List
 
-from app.api.deps import get_db, get_current_user
+from app.api.deps import get_db, get_read_db, get_current_user
+from app.db.uow import UnitOfWork
 from app.models.review import Review
 from app.models.user import User
 from app.schemas.review import ReviewIn, ReviewOut
@@ -22,25 +23,25 @@ def leave_review(payload: ReviewIn, db: Session = Depends(get_db), user: User =
         rating=payload.rating,
         comment=payload.comment,
     )
-    db.add(review)
-    db.commit()
-    db.refresh(review)
-
-    # ✅ Update reviewed user's stats
-    stats = db.query(
-        func.avg(Review.rating).label("avg_rating"),
-        func.count(Review.id).label("count_reviews")
-    ).filter(Review.reviewed_id == payload.reviewed_id).first()
-
-    reviewed_user = db.query(User).filter(User.id == payload.reviewed_id).first()
-    if reviewed_user:
-        reviewed_user.rating = float(stats.avg_rating or 0.0)
-        reviewed_user.reviews_count = stats.count_reviews or 0
-        db.add(reviewed_user)
-        db.commit()
+    with UnitOfWork(db) as uow:
+        db.add(review)
+        uow.flush()  # the aggregate below has to see the new review
+
+        # ✅ Update reviewed user's stats in the same statement that computes them
+        db.execute(
+            update(User)
+            .where(User.id == payload.reviewed_id)
+            .values(
+                rating=select(func.coalesce(func.avg(Review.rating), 0.0))
+                .where(Review.reviewed_id == payload.reviewed_id).scalar_subquery(),
+                reviews_count=select(func.count(Review.id))
+                .where(Review.reviewed_id == payload.reviewed_id).scalar_subquery(),
+            ),
+            execution_options={"synchronize_session": False},
+        )
 
     return review
 
 @router.get("/{user_id}", response_model=List[ReviewOut])
-def get_reviews(user_id: str, db: Session = Depends(get_db)):
+def get_reviews(user_id: str, db: Session = Depends(get_read_db)):
     return db.query(Review).filter(Review.reviewed_id == user_id).all()
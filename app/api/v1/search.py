@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, text, and_, or_
+from fastapi import APIRouter, Query, HTTPException
+from sqlalchemy import Select, func, select, text, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 from datetime import datetime, timedelta
 
-from app.api.deps import get_db
+from app.api.deps import AsyncReadDbDep
 from app.models.listing import Listing
 from app.models.user import User
 
 router = APIRouter(tags=["Search"])
 
+
+async def _count(db: AsyncSession, stmt: Select) -> int:
+    return await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+
+
 @router.get("/listings/search")
-def search_listings(
+async def search_listings(
+    db: AsyncReadDbDep,
     q: Optional[str] = Query(None, description="Search keyword"),
     category: Optional[str] = Query(None, description="Filter by category"),
     min_price: Optional[float] = Query(None, ge=0, description="Minimum price"),
@@ -22,18 +28,18 @@ def search_listings(
     sort_order: str = Query("desc", regex="^(asc|desc)$", description="Sort order"),
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(10, ge=1, le=100, description="Page size"),
-    db: Session = Depends(get_db)
 ):
-    query = db.query(Listing).options(joinedload(Listing.owner))
+    # to_dict() doesn't touch the owner, so there is nothing to eager-load
+    query = select(Listing)
     
     if status:
-        query = query.filter(Listing.status == status)
+        query = query.where(Listing.status == status)
     else:
-        query = query.filter(Listing.status == "ACTIVE")
+        query = query.where(Listing.status == "ACTIVE")
 
     if q:
         search_term = f"%{q}%"
-        query = query.filter(
+        query = query.where(
             or_(
                 Listing.title.ilike(search_term),
                 Listing.description.ilike(search_term),
@@ -43,13 +49,13 @@ def search_listings(
 
     # Enhanced filters
     if category:
-        query = query.filter(Listing.category.ilike(f"%{category}%"))
+        query = query.where(Listing.category.ilike(f"%{category}%"))
     if university:
-        query = query.join(User).filter(User.university_name.ilike(f"%{university}%"))
+        query = query.join(Listing.owner).where(User.university_name.ilike(f"%{university}%"))
     if min_price is not None:
-        query = query.filter(Listing.price >= min_price)
+        query = query.where(Listing.price >= min_price)
     if max_price is not None:
-        query = query.filter(Listing.price <= max_price)
+        query = query.where(Listing.price <= max_price)
 
     valid_sort_fields = ['created_at', 'updated_at', 'price', 'title']
     if sort_by not in valid_sort_fields:
@@ -62,8 +68,8 @@ def search_listings(
         query = query.order_by(sort_column.asc())
 
     # Pagination with performance optimization
-    total = query.count()
-    listings = query.offset((page - 1) * page_size).limit(page_size).all()
+    total = await _count(db, query)
+    listings = (await db.scalars(query.offset((page - 1) * page_size).limit(page_size))).all()
 
     return {
         "total": total,
@@ -76,7 +82,8 @@ def search_listings(
     }
 
 @router.get("/listings/advanced-search")
-def advanced_search_listings(
+async def advanced_search_listings(
+    db: AsyncReadDbDep,
     keywords: Optional[List[str]] = Query(None, description="Multiple search keywords"),
     categories: Optional[List[str]] = Query(None, description="Multiple categories"),
     price_ranges: Optional[List[str]] = Query(None, description="Price ranges (e.g., '0-50', '50-100')"),
@@ -86,13 +93,12 @@ def advanced_search_listings(
     exclude_sold: bool = Query(True, description="Exclude sold items"),
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
-    db: Session = Depends(get_db)
 ):
-    query = db.query(Listing).options(joinedload(Listing.owner))
+    query = select(Listing)
     
     # Status filter
     if exclude_sold:
-        query = query.filter(Listing.status.in_(["ACTIVE"]))
+        query = query.where(Listing.status.in_(["ACTIVE"]))
     
     # Multiple keyword search
     if keywords:
@@ -106,15 +112,15 @@ def advanced_search_listings(
                     Listing.category.ilike(search_term)
                 )
             )
-        query = query.filter(or_(*keyword_conditions))
+        query = query.where(or_(*keyword_conditions))
     
     # Multiple category filter
     if categories:
-        query = query.filter(Listing.category.in_(categories))
+        query = query.where(Listing.category.in_(categories))
     
     # Multiple university filter
     if universities:
-        query = query.join(User).filter(User.university_name.in_(universities))
+        query = query.join(Listing.owner).where(User.university_name.in_(universities))
     
     # Price range filters
     if price_ranges:
@@ -126,28 +132,28 @@ def advanced_search_listings(
             except ValueError:
                 continue
         if price_conditions:
-            query = query.filter(or_(*price_conditions))
+            query = query.where(or_(*price_conditions))
     
     # Date range filters
     if date_from:
         try:
             from_date = datetime.strptime(date_from, '%Y-%m-%d')
-            query = query.filter(Listing.created_at >= from_date)
+            query = query.where(Listing.created_at >= from_date)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date_from format. Use YYYY-MM-DD")
     
     if date_to:
         try:
             to_date = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
-            query = query.filter(Listing.created_at < to_date)
+            query = query.where(Listing.created_at < to_date)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date_to format. Use YYYY-MM-DD")
     
     # Default sorting by relevance/date
     query = query.order_by(Listing.created_at.desc())
     
-    total = query.count()
-    listings = query.offset((page - 1) * page_size).limit(page_size).all()
+    total = await _count(db, query)
+    listings = (await db.scalars(query.offset((page - 1) * page_size).limit(page_size))).all()
     
     return {
         "total": total,
@@ -158,53 +164,53 @@ def advanced_search_listings(
     }
 
 @router.get("/listings/suggestions")
-def get_search_suggestions(
+async def get_search_suggestions(
+    db: AsyncReadDbDep,
     q: str = Query(..., min_length=2, description="Search query for suggestions"),
     limit: int = Query(10, ge=1, le=20, description="Number of suggestions"),
-    db: Session = Depends(get_db)
 ):
     # Get title suggestions
-    title_suggestions = db.query(Listing.title).filter(
+    title_suggestions = (await db.scalars(select(Listing.title).where(
         and_(
             Listing.title.ilike(f"%{q}%"),
             Listing.status == "ACTIVE"
         )
-    ).distinct().limit(limit//2).all()
+    ).distinct().limit(limit//2))).all()
     
     # Get category suggestions
-    category_suggestions = db.query(Listing.category).filter(
+    category_suggestions = (await db.scalars(select(Listing.category).where(
         and_(
             Listing.category.ilike(f"%{q}%"),
             Listing.status == "ACTIVE"
         )
-    ).distinct().limit(limit//2).all()
+    ).distinct().limit(limit//2))).all()
     
     suggestions = []
-    suggestions.extend([title[0] for title in title_suggestions])
-    suggestions.extend([cat[0] for cat in category_suggestions])
+    suggestions.extend(title_suggestions)
+    suggestions.extend(category_suggestions)
     
     return {
         "suggestions": list(set(suggestions))[:limit]
     }
 
 @router.get("/listings/trending")
-def get_trending_searches(
+async def get_trending_searches(
+    db: AsyncReadDbDep,
     days: int = Query(7, ge=1, le=30, description="Number of days to look back"),
     limit: int = Query(10, ge=1, le=20),
-    db: Session = Depends(get_db)
 ):
     # Get most popular categories in the last N days
     cutoff_date = datetime.now() - timedelta(days=days)
     
-    popular_categories = db.query(
+    popular_categories = (await db.execute(select(
         Listing.category,
         func.count(Listing.id).label('count')
-    ).filter(
+    ).where(
         and_(
             Listing.created_at >= cutoff_date,
             Listing.status == "ACTIVE"
         )
-    ).group_by(Listing.category).order_by(text('count DESC')).limit(limit).all()
+    ).group_by(Listing.category).order_by(text('count DESC')).limit(limit))).all()
     
     return {
         "trending_categories": [
@@ -5,6 +5,7 @@ from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session
 from app.api.deps import get_db, get_current_user, get_current_admin
 from app.core.config import settings, allowed_domains
+from app.db.uow import UnitOfWork
 from app.models.user import User
 from app.models.verification import Verification
 from app.schemas.verification import OTPVerify, VerificationRequest, AdminReviewAction
@@ -87,17 +88,17 @@ def approve(user_id: str, review_action: AdminReviewAction, db: Session = Depend
     if not ver or not user:
         raise HTTPException(status_code=404, detail="Verification or user not found")
     
-    ver.status = "verified"
-    ver.admin_notes = review_action.admin_notes
-    ver.reviewed_at = datetime.now(timezone.utc)
-    user.is_verified = True
-    db.commit()
-    
-    NotificationService.notify_verification_status(db, user_id, "APPROVED")
-    
-    subject = "Your Verification Has Been Approved"
-    body = f"Hello {user.email},\n\nYour university email verification has been approved. You are now a verified member of Campus Exchange.\n\nThank you,\nThe Campus Exchange Team"
-    send_email(user.email, subject, body) # 📧
+    with UnitOfWork(db) as uow:
+        ver.status = "verified"
+        ver.admin_notes = review_action.admin_notes
+        ver.reviewed_at = datetime.now(timezone.utc)
+        user.is_verified = True
+
+        NotificationService.notify_verification_status(db, user_id, "APPROVED", commit=False)
+
+        subject = "Your Verification Has Been Approved"
+        body = f"Hello {user.email},\n\nYour university email verification has been approved. You are now a verified member of Campus Exchange.\n\nThank you,\nThe Campus Exchange Team"
+        uow.after_commit(send_email, user.email, subject, body) # 📧
     
     return {"message": "User verified"}
 
@@ -109,17 +110,17 @@ def reject(user_id: str, review_action: AdminReviewAction, db: Session = Depends
         raise HTTPException(status_code=404, detail="Verification not found")
         
     user = db.query(User).filter(User.id == user_id).first() # Fetch user to get email for notification
-    ver.status = "rejected"
-    ver.admin_notes = review_action.admin_notes
-    ver.reviewed_at = datetime.now(timezone.utc)
-    db.commit()
+    with UnitOfWork(db) as uow:
+        ver.status = "rejected"
+        ver.admin_notes = review_action.admin_notes
+        ver.reviewed_at = datetime.now(timezone.utc)
 
-    if user:
-        NotificationService.notify_verification_status(db, user.id, "REJECTED")
+        if user:
+            NotificationService.notify_verification_status(db, user.id, "REJECTED", commit=False)
 
-    if user: # Only attempt to send email if user was found
-        subject = "Your Verification Has Been Rejected"
-        body = f"Hello {user.email},\n\nYour university email verification has been rejected. Please review your submission and try again if necessary.\n\nThank you,\nThe Campus Exchange Team"
-        send_email(user.email, subject, body) # 📧
+        if user: # Only attempt to send email if user was found
+            subject = "Your Verification Has Been Rejected"
+            body = f"Hello {user.email},\n\nYour university email verification has been rejected. Please review your submission and try again if necessary.\n\nThank you,\nThe Campus Exchange Team"
+            uow.after_commit(send_email, user.email, subject, body) # 📧
 
     return {"message": "Verification rejected"}
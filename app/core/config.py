@@ -60,6 +60,87 @@ class Settings(BaseSettings):
     AI_DUPLICATE_CHECK_ENABLED: bool = True
     AI_RECOMMEND_ENABLED: bool = True
 
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_FILE: str = "app.log"  # written in production only
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT: int = 5
+    ACCESS_LOG_FILE: Optional[str] = None  # JSON lines; stdout when unset
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0  # fraction of fast successful requests to log
+    ACCESS_LOG_SLOW_MS: int = 1000  # requests at least this slow are always logged
+
+    # Read replicas (comma-separated URLs); read-only endpoints are spread across them
+    DATABASE_REPLICA_URLS: str = ""
+    READ_YOUR_WRITES_SECONDS: float = 5.0  # a user's reads stay on the primary this long after they write
+    REPLICA_MAX_LAG_SECONDS: float = 5.0  # replicas further behind are taken out of rotation
+    REPLICA_HEALTH_CHECK_INTERVAL: float = 10.0
+
+    # Connection pool (per engine; the sync and async engines each get their own)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 5.0  # seconds to wait for a connection before failing with 503
+    DB_POOL_RECYCLE: int = 1800  # seconds; replace connections older than this at checkout
+    DB_POOL_PRE_PING: bool = True  # one extra round trip per checkout; False relies on recycle + disconnect detection
+    DB_POOL_WARMUP: int = 2  # connections opened per engine at startup
+    # Server-side timeouts in ms (0 disables)
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    DB_LOCK_TIMEOUT_MS: int = 5000
+    DB_IDLE_IN_TRANSACTION_TIMEOUT_MS: int = 60000
+    # PgBouncer transaction pooling: no prepared statement caches, timeouts applied per transaction
+    DB_PGBOUNCER: bool = False
+    # Server-side prepared statements kept per asyncpg connection (ignored with DB_PGBOUNCER)
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
+
+    # Query accounting: flag a statement repeated this many times with different parameters
+    DB_N_PLUS_ONE_THRESHOLD: int = 5
+
+    # Slow query log (ring buffer, visible at /api/v1/admin/system/slow-queries)
+    SLOW_QUERY_MS: int = 200
+    SLOW_QUERY_BUFFER_SIZE: int = 200
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = 0.1  # fraction of slow SELECTs re-run under EXPLAIN ANALYZE
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS: int = 5000
+
+    # Metrics
+    METRICS_ENABLED: bool = True  # exposes /metrics in Prometheus text format
+
+    # Tracing (NONE disables span export entirely)
+    TRACE_EXPORTER: Literal["NONE", "JSONL", "OTLP"] = "NONE"
+    TRACE_SAMPLE_RATE: float = 0.1  # fraction of root requests traced; children inherit the decision
+    TRACE_JSONL_PATH: str = "traces.jsonl"
+    OTLP_ENDPOINT: Optional[str] = None  # collector base URL, e.g. http://otel-collector:4318
+
+    # Rate limiting (LOCAL = per process, REDIS = shared across workers/nodes)
+    RATE_LIMIT_BACKEND: Literal["LOCAL", "REDIS"] = "LOCAL"
+    REDIS_URL: Optional[str] = None  # any Redis-protocol server, e.g. redis://localhost:6379/0
+    RATE_LIMIT_BATCH_SIZE: int = 5  # units reserved per store round trip
+    RATE_LIMIT_STORE_TIMEOUT: float = 0.25
+
+    # Realtime fan-out between workers (MEMORY = single process only)
+    BROADCAST_BACKEND: Literal["MEMORY", "POSTGRES", "REDIS"] = "MEMORY"
+    BROADCAST_URL: Optional[str] = None  # defaults to DATABASE_URL (POSTGRES, required with DB_PGBOUNCER) or REDIS_URL (REDIS)
+
+    # Chat write-behind: messages are acked and persisted in batches
+    CHAT_INGEST_BATCH_SIZE: int = 200
+    CHAT_INGEST_FLUSH_MS: float = 5.0
+    CHAT_INGEST_MAX_PENDING: int = 5000  # senders wait for a flush beyond this
+
+    # Websocket sends: a bounded queue and a writer task per socket
+    WS_SEND_QUEUE_SIZE: int = 256  # frames
+    WS_SEND_TIMEOUT: float = 10.0  # seconds one frame may take before the socket is closed
+    WS_SLOW_CONSUMER_POLICY: Literal["CLOSE", "DROP"] = "CLOSE"  # when a socket's queue is full
+    WS_PING_INTERVAL: float = 20.0  # seconds between server pings on /chat/ws
+    WS_IDLE_TIMEOUT: float = 60.0  # close /chat/ws sockets that sent nothing (not even a pong) for this long
+
+    # Presence, shared between workers over the broadcast backplane
+    PRESENCE_HEARTBEAT_INTERVAL: float = 15.0
+    PRESENCE_WORKER_TIMEOUT: float = 60.0  # a worker silent this long is presumed dead, its users offline
+    PRESENCE_LAST_SEEN_TTL: float = 7 * 24 * 3600  # seconds last-seen times are kept
+
+    # Chat resume: recent events per room kept in memory for reconnecting clients
+    CHAT_REPLAY_EVENTS_PER_ROOM: int = 256
+    CHAT_REPLAY_ROOMS: int = 10000  # least recently active rooms are dropped beyond this
+    CHAT_REPLAY_DB_LIMIT: int = 500  # changed messages replayed from the DB before asking for a reload
+
     @field_validator("CORS_ORIGINS", mode="before")
     @classmethod
     def parse_cors(cls, v):
@@ -78,11 +159,32 @@ class Settings(BaseSettings):
             uri = uri.replace("postgres://", "postgresql://", 1)
         return uri
 
+    @property
+    def SQLALCHEMY_REPLICA_URIS(self) -> List[str]:
+        return [
+            u.strip().replace("postgres://", "postgresql://", 1)
+            for u in self.DATABASE_REPLICA_URLS.split(",")
+            if u.strip()
+        ]
+
+    @property
+    def SQLALCHEMY_ASYNC_DATABASE_URI(self) -> str:
+        return async_database_uri(self.SQLALCHEMY_DATABASE_URI)
+
     class Config:
         env_file = ".env"
         extra = "ignore"
 
 
+def async_database_uri(uri: str) -> str:
+    """Same database through asyncpg; libpq's sslmode query parameter is spelled ssl there"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://"):
+        if uri.startswith(prefix):
+            uri = "postgresql+asyncpg://" + uri[len(prefix):]
+            break
+    return uri.replace("sslmode=", "ssl=")
+
+
 settings = Settings()
 
 
@@ -0,0 +1,35 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass
+class RequestContext:
+    """Per-request facts collected while the request runs (read by the access log).
+
+    The object is mutated in place, so updates made from threadpool workers (sync
+    routes and dependencies run in a copy of the request's context) are still seen
+    by the middleware that created it.
+    """
+    method: str
+    path: str
+    scope: Optional[dict] = field(default=None, repr=False)
+    user_id: Optional[str] = None
+    db_time: float = 0.0
+    db_queries: int = 0
+    # statement text -> [executions, first parameters, parameters differed]
+    statements: Dict[str, list] = field(default_factory=dict)
+    n_plus_one: List[str] = field(default_factory=list)
+
+    @property
+    def route(self) -> str:
+        """Route template once routing has happened, e.g. /api/v1/listings/{listing_id}"""
+        route = self.scope.get("route") if self.scope else None
+        return route.path if route is not None else self.path
+
+
+request_context: ContextVar[Optional[RequestContext]] = ContextVar("request_context", default=None)
+
+
+def current_request() -> Optional[RequestContext]:
+    return request_context.get()
@@ -0,0 +1,106 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List
+from app.core.config import settings
+
+APP_LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+access_logger = logging.getLogger("app.access")
+
+_listeners: List[QueueListener] = []
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line. Dict messages are merged into the record as fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+        }
+        if isinstance(record.msg, dict):
+            payload.update(record.msg)
+        else:
+            payload["logger"] = record.name
+            payload["message"] = record.getMessage()
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, separators=(",", ":"))
+
+
+def _file_handler(path: str) -> RotatingFileHandler:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return RotatingFileHandler(
+        path, maxBytes=settings.LOG_MAX_BYTES, backupCount=settings.LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+
+
+class _RecordQueueHandler(QueueHandler):
+    """Enqueues the record as it is, for loggers whose messages are fresh dicts: the
+    listener-side formatter renders them, so no formatting happens on the event loop"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _queued(logger: logging.Logger, handlers: List[logging.Handler], structured: bool = False) -> None:
+    """Route `logger` through an in-memory queue drained by a background thread.
+
+    The event loop only pays for putting the record on the queue (and, for plain
+    loggers, for rendering its message, so the listener never reads arguments that
+    may have changed since); formatting for the target handlers and all file/stream
+    I/O happen on the listener thread.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.handlers = [_RecordQueueHandler(log_queue) if structured else QueueHandler(log_queue)]
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+
+def setup_logging() -> None:
+    """Configure application and access logging; safe to call more than once"""
+    if _listeners:
+        return
+
+    app_formatter = logging.Formatter(APP_LOG_FORMAT)
+    app_handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if settings.ENV == "production":
+        app_handlers.append(_file_handler(settings.LOG_FILE))
+    for handler in app_handlers:
+        handler.setFormatter(app_formatter)
+
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL)
+    _queued(root, app_handlers)
+
+    access_handler = _file_handler(settings.ACCESS_LOG_FILE) if settings.ACCESS_LOG_FILE else logging.StreamHandler(sys.stdout)
+    access_handler.setFormatter(JsonFormatter())
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+    _queued(access_logger, [access_handler], structured=True)
+
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer threads"""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def should_log_access(status_code: int, latency: float) -> bool:
+    """Errors and slow requests are always logged; successful ones are sampled"""
+    if status_code >= 400 or latency * 1000 >= settings.ACCESS_LOG_SLOW_MS:
+        return True
+    rate = settings.ACCESS_LOG_SAMPLE_RATE
+    return rate >= 1.0 or random.random() < rate
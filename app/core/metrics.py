@@ -0,0 +1,207 @@
+import abc
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Sharded:
+    """Per-thread storage so the hot path never takes a lock.
+
+    Each thread writes only to its own dict; the scraper copies and sums all shards.
+    A lock is taken once per thread, when its shard is first created. Shards of
+    threads that have exited are kept so counters never go backwards.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _snapshots(self) -> List[dict]:
+        with self._lock:
+            shards = list(self._shards)
+        # dict.copy() runs without releasing the GIL, so it is safe against concurrent writers
+        return [shard.copy() for shard in shards]
+
+
+class Metric(_Sharded, abc.ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, values: LabelValues, extra: Iterable[Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    @abc.abstractmethod
+    def collect(self) -> List[str]:
+        ...
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0.0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        totals: Dict[LabelValues, float] = {}
+        for shard in self._snapshots():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def collect(self) -> List[str]:
+        return [f"{self.name}{self._labels(key)} {_fmt(value)}" for key, value in sorted(self.values().items())]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        shard = self._shard()
+        state = shard.get(labelvalues)
+        if state is None:
+            # [per-bucket counts (+Inf last), sum]
+            state = shard[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def collect(self) -> List[str]:
+        merged: Dict[LabelValues, list] = {}
+        for shard in self._snapshots():
+            for key, (counts, total) in shard.items():
+                acc = merged.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+                acc[0] = [a + b for a, b in zip(acc[0], counts)]
+                acc[1] += total
+
+        lines = []
+        for key, (counts, total) in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else _fmt(bound)
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class GaugeFunc(Metric):
+    """Gauge whose value is read from a callback at scrape time; free on the hot path"""
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        func: Callable[[], Union[float, Dict[LabelValues, float]]],
+        labelnames: Sequence[str] = (),
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def collect(self) -> List[str]:
+        value = self.func()
+        if isinstance(value, dict):
+            return [f"{self.name}{self._labels(key)} {_fmt(v)}" for key, v in sorted(value.items())]
+        return [f"{self.name} {_fmt(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Re-registering (e.g. on module reload) replaces the old instrument
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        out = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = metric.collect()
+            except Exception as e:  # a broken callback must not break the whole scrape
+                out.append(f"# {metric.name} collection failed: {_escape(str(e))}")
+                continue
+            out.append(f"# HELP {metric.name} {metric.documentation}")
+            out.append(f"# TYPE {metric.name} {metric.type}")
+            out.extend(samples)
+        return "\n".join(out) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def gauge_func(name: str, documentation: str, func, labelnames: Sequence[str] = ()) -> GaugeFunc:
+    return registry.register(GaugeFunc(name, documentation, func, labelnames))
+
+
+# Instruments shared across modules
+HTTP_REQUEST_DURATION = histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+CACHE_REQUESTS = counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit/miss); hit ratio = hit / (hit + miss)",
+    ("cache", "result"),
+)
+DB_N_PLUS_ONE = counter(
+    "db_n_plus_one_total",
+    "Requests in which one statement ran repeatedly with different parameters",
+    ("method", "route"),
+)
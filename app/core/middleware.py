@@ -1,85 +1,215 @@
+import json
 import time
 import logging
-from typing import Dict, Optional
-from fastapi import Request, Response, HTTPException
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from collections import defaultdict, deque
-import asyncio
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.config import settings
+from app.core.context import RequestContext, request_context
+from app.core.logging_config import access_logger, should_log_access
+from app.core.metrics import DB_N_PLUS_ONE, HTTP_REQUEST_DURATION
+from app.core.ratelimit import (
+    LimiterBackend,
+    RateLimitPolicy,
+    RateLimitResult,
+    RouteLimit,
+    RouteMatcher,
+    build_limiter_backend,
+)
+from app.core.security import decode_token
+from app.core.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, calls: int = 100, period: int = 60):
-        super().__init__(app)
-        self.calls = calls
-        self.period = period
-        self.clients: Dict[str, deque] = defaultdict(deque)
-        
-    def get_client_ip(self, request: Request) -> str:
+Headers = List[Tuple[bytes, bytes]]
+
+SECURITY_HEADERS: Headers = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+]
+CSP_HEADER = (
+    b"content-security-policy",
+    b"default-src 'self'; script-src 'self'; style-src 'self' 'unsafe-inline'",
+)
+# Swagger/Redoc load their assets from a CDN, so they don't get the CSP
+CSP_EXEMPT_PREFIXES = ("/docs", "/redoc", "/openapi.json")
+
+
+class RateLimiter:
+    """Resolves a request to its policy and charges the matching limiter"""
+
+    def __init__(
+        self,
+        calls: int = 100,
+        period: int = 60,
+        policies: Optional[Dict[str, RateLimitPolicy]] = None,
+        routes: Optional[Iterable[RouteLimit]] = None,
+        backend_factory: Callable[[int, float, str], LimiterBackend] = build_limiter_backend,
+    ):
+        self.policies = dict(policies or {})
+        self.policies.setdefault("default", RateLimitPolicy(calls=calls, period=period))
+        # One limiter per policy; local GCRA by default, shared store when RATE_LIMIT_BACKEND=REDIS
+        self.limiters = {
+            name: backend_factory(policy.calls, policy.period, name)
+            for name, policy in self.policies.items()
+        }
+        self.matcher = RouteMatcher(routes or [], default=RouteLimit("*", "/*"))
+
+    async def check(
+        self, method: str, path: str, client_ip: str, authorization: Optional[str]
+    ) -> Optional[RateLimitResult]:
+        """Return the limiter verdict, or None for exempt routes"""
+        rule = self.matcher.match(method, path)
+        if rule.policy is None:
+            return None
+
+        policy = self.policies[rule.policy]
+        user_id = get_user_id(authorization) if policy.key == "principal" else None
+        key = f"user:{user_id}" if user_id else f"ip:{client_ip}"
+        result = await self.limiters[rule.policy].hit(key, rule.cost)
+        if not result.allowed:
+            logger.warning(f"Rate limit '{rule.policy}' exceeded for {key}")
+        return result
+
+
+def get_user_id(authorization: Optional[str]) -> Optional[str]:
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    payload = decode_token(authorization[7:])
+    return payload.get("sub") if payload else None
+
+
+class EdgeMiddleware:
+    """Security headers, request timing, tracing, access logging and rate limiting in one pure-ASGI layer.
+
+    Replaces three BaseHTTPMiddleware subclasses, each of which wrapped every request
+    in an extra task and response stream. Here the request passes straight through
+    and we only intercept `http.response.start` to append precomputed header tuples.
+    """
+
+    def __init__(self, app: ASGIApp, rate_limiter: Optional[RateLimiter] = None, expose_db_stats: Optional[bool] = None):
+        self.app = app
+        self.rate_limiter = rate_limiter
+        # Per-request SQL counts/time as response headers; off in production
+        self.expose_db_stats = settings.ENV != "production" if expose_db_stats is None else expose_db_stats
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        path = scope["path"]
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+
+        # Single pass over the raw headers for the few we care about
+        authorization = forwarded_for = real_ip = traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+            elif name == b"traceparent":
+                traceparent = value.decode("latin-1")
+            elif name == b"x-forwarded-for":
+                forwarded_for = value.decode("latin-1")
+            elif name == b"x-real-ip":
+                real_ip = value.decode("latin-1")
+
         # Check for forwarded headers first (for reverse proxy setups)
-        forwarded_for = request.headers.get("X-Forwarded-For")
         if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
-        
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
-            
-        return request.client.host if request.client else "unknown"
-    
-    async def dispatch(self, request: Request, call_next):
-        client_ip = self.get_client_ip(request)
-        now = time.time()
-        
-        # Clean old entries
-        client_calls = self.clients[client_ip]
-        while client_calls and client_calls[0] <= now - self.period:
-            client_calls.popleft()
-        
-        # Check rate limit
-        if len(client_calls) >= self.calls:
-            logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-            return JSONResponse(
-                status_code=429,
-                content={"detail": "Rate limit exceeded. Please try again later."}
-            )
-        
-        # Add current request
-        client_calls.append(now)
-        
-        response = await call_next(request)
-        return response
-
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        if not request.url.path.startswith(("/docs", "/redoc", "/openapi.json")):
-            response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self'; style-src 'self' 'unsafe-inline'"
-
-
-        
-        return response
-
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        # Log request
-        logger.info(f"Request: {request.method} {request.url.path} from {request.client.host if request.client else 'unknown'}")
-        
-        response = await call_next(request)
-        
-        # Log response
-        process_time = time.time() - start_time
-        logger.info(f"Response: {response.status_code} in {process_time:.4f}s")
-        
-        response.headers["X-Process-Time"] = str(process_time)
-        return response
+            limit_ip = forwarded_for.split(",")[0].strip()
+        else:
+            limit_ip = real_ip or client_ip
+
+        ctx = RequestContext(method=scope["method"], path=path, scope=scope)
+        token = request_context.set(ctx)
+
+        extra_headers = list(SECURITY_HEADERS)
+        if not path.startswith(CSP_EXEMPT_PREFIXES):
+            extra_headers.append(CSP_HEADER)
+
+        # Root span; renamed to the route template once routing has happened
+        span = tracer.start(f"HTTP {ctx.method}", {"http.method": ctx.method, "http.target": path},
+                            kind="server", traceparent=traceparent)
+        span_token = tracer.activate(span)
+        if span.sampled:
+            extra_headers.append((b"x-trace-id", span.trace_id.encode("latin-1")))
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                process_time = time.perf_counter() - start_time
+                headers = list(message.get("headers", [])) + extra_headers
+                headers.append((b"x-process-time", str(process_time).encode("latin-1")))
+                if self.expose_db_stats:
+                    headers.append((b"x-db-queries", str(ctx.db_queries).encode("latin-1")))
+                    headers.append((b"x-db-time", f"{ctx.db_time:.6f}".encode("latin-1")))
+                    if ctx.n_plus_one:
+                        headers.append((b"x-db-n-plus-one", str(len(ctx.n_plus_one)).encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            if self.rate_limiter is not None:
+                result = await self.rate_limiter.check(scope["method"], path, limit_ip, authorization)
+                if result is not None:
+                    extra_headers.extend(
+                        (name.lower().encode("latin-1"), value.encode("latin-1"))
+                        for name, value in result.headers().items()
+                    )
+                    if not result.allowed:
+                        await self._send_json(
+                            send_wrapper, 429, {"detail": "Rate limit exceeded. Please try again later."}
+                        )
+                        return
+
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            request_context.reset(token)
+            tracer.deactivate(span_token)
+            latency = time.perf_counter() - start_time
+            route = scope.get("route")
+            route_path = route.path if route is not None else "<unmatched>"
+            span.name = f"{ctx.method} {route_path}"
+            span.set_attribute("http.route", route_path)
+            span.set_attribute("http.status_code", status_code)
+            if status_code >= 500:
+                span.status = "ERROR"
+            span.end()
+            HTTP_REQUEST_DURATION.observe(latency, ctx.method, route_path, str(status_code))
+            if ctx.n_plus_one:
+                DB_N_PLUS_ONE.inc(ctx.method, route_path)
+            if should_log_access(status_code, latency):
+                access_logger.info({
+                    "method": ctx.method,
+                    "route": route_path,
+                    "path": path,
+                    "status": status_code,
+                    "latency_ms": round(latency * 1000, 2),
+                    "db_time_ms": round(ctx.db_time * 1000, 2),
+                    "db_queries": ctx.db_queries,
+                    "user_id": ctx.user_id,
+                    "client_ip": limit_ip,
+                    "trace_id": span.trace_id,
+                })
+
+    @staticmethod
+    async def _send_json(send: Send, status_code: int, content: dict) -> None:
+        body = json.dumps(content).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
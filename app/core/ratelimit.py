@@ -0,0 +1,416 @@
+import abc
+import math
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Literal, Optional
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # seconds until the bucket is completely full again
+    retry_after: float  # seconds until the request would be allowed (0 if allowed)
+
+    def headers(self) -> dict:
+        """Standard RateLimit-* headers (IETF draft) plus Retry-After when throttled"""
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class GCRALimiter:
+    """Generic Cell Rate Algorithm limiter.
+
+    Instead of remembering every request timestamp, GCRA keeps a single float per
+    key: the theoretical arrival time (TAT) of the next request. A key whose TAT is
+    in the past is indistinguishable from a key we have never seen, so idle keys
+    can be dropped at any time without changing behaviour.
+
+    Keys live in a bounded LRU; once `max_keys` is reached the least recently used
+    key is evicted, so memory stays flat no matter how many distinct clients show up.
+    """
+
+    def __init__(self, calls: int, period: float, max_keys: int = 100_000, sweep_every: int = 1024):
+        if calls <= 0 or period <= 0:
+            raise ValueError("calls and period must be positive")
+        self.calls = calls
+        self.period = float(period)
+        self.emission_interval = self.period / calls
+        self.max_keys = max_keys
+        self.sweep_every = sweep_every
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+        self._ops = 0
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    def hit(self, key: str, cost: int = 1, now: Optional[float] = None) -> RateLimitResult:
+        """Consume `cost` units for `key` and report whether the request is allowed"""
+        if now is None:
+            now = time.monotonic()
+
+        tats = self._tats
+        tat = tats.get(key, now)
+        if tat < now:
+            tat = now
+
+        new_tat = tat + cost * self.emission_interval
+        allow_at = new_tat - self.period
+
+        if allow_at > now:
+            # Denied: leave the stored TAT untouched so throttled clients don't dig deeper
+            return RateLimitResult(
+                allowed=False,
+                limit=self.calls,
+                remaining=0,
+                reset_after=tat - now,
+                retry_after=allow_at - now,
+            )
+
+        tats[key] = new_tat
+        tats.move_to_end(key)
+        if len(tats) > self.max_keys:
+            tats.popitem(last=False)
+
+        self._ops += 1
+        if self._ops >= self.sweep_every:
+            self._ops = 0
+            self.evict_idle(now)
+
+        return RateLimitResult(
+            allowed=True,
+            limit=self.calls,
+            remaining=int((now - allow_at) / self.emission_interval + 1e-9),
+            reset_after=new_tat - now,
+            retry_after=0.0,
+        )
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop keys from the cold end of the LRU whose bucket has fully refilled"""
+        if now is None:
+            now = time.monotonic()
+        tats = self._tats
+        evicted = 0
+        while tats:
+            key, tat = next(iter(tats.items()))
+            if tat > now:
+                break
+            del tats[key]
+            evicted += 1
+        return evicted
+
+
+class LimiterBackend(abc.ABC):
+    """Interface for rate limiter storage; implementations decide where the state lives"""
+
+    calls: int
+    period: float
+
+    @abc.abstractmethod
+    async def hit(self, key: str, cost: int = 1) -> RateLimitResult:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalBackend(LimiterBackend):
+    """Per-process limiter. Cheap, but every worker has its own budget"""
+
+    def __init__(self, calls: int, period: float, max_keys: int = 100_000):
+        self.calls = calls
+        self.period = period
+        self.limiter = GCRALimiter(calls=calls, period=period, max_keys=max_keys)
+
+    async def hit(self, key: str, cost: int = 1) -> RateLimitResult:
+        return self.limiter.hit(key, cost)
+
+
+# GCRA executed atomically inside the store. Reserves up to ARGV[3] units in one go
+# (never fewer than ARGV[4]) so callers can hand them out locally. Floats are returned
+# as strings because Redis truncates Lua numbers to integers.
+GCRA_RESERVE_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local available = math.floor((now + period - tat) / interval + 1e-9)
+if available < cost then
+  return {0, 0, tostring(tat - now), tostring(tat + cost * interval - period - now)}
+end
+local granted = math.min(want, available)
+local new_tat = tat + granted * interval
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {granted, available - granted, tostring(new_tat - now), '0'}
+"""
+
+
+class InMemoryStore:
+    """In-process stand-in for a Redis-protocol client, used by scripts/check_ratelimit_store.py.
+
+    Only understands GCRA_RESERVE_SCRIPT, which it evaluates in Python with the
+    same semantics the Lua version has inside Redis (the script checks both).
+    """
+
+    def __init__(self):
+        self.data: dict = {}
+        self.available = True  # flip to False to simulate an outage
+
+    async def eval(self, script: str, numkeys: int, *args):
+        if not self.available:
+            raise ConnectionError("store unavailable")
+        key = args[0]
+        interval, period, want, cost = (float(a) for a in args[numkeys:numkeys + 4])
+        now = time.time()
+        tat = max(self.data.get(key, now), now)
+        available = math.floor((now + period - tat) / interval + 1e-9)
+        if available < cost:
+            return [0, 0, str(tat - now), str(tat + cost * interval - period - now)]
+        granted = int(min(want, available))
+        new_tat = tat + granted * interval
+        self.data[key] = new_tat
+        return [granted, int(available - granted), str(new_tat - now), "0"]
+
+    async def aclose(self) -> None:
+        pass
+
+
+class SharedStoreBackend(LimiterBackend):
+    """Limiter whose state lives in a Redis-protocol store shared by all workers and nodes.
+
+    To avoid a network hop per request, each worker reserves `batch_size` units per key
+    from the store at once and spends them locally until they run out or the lease
+    expires. If the store is unreachable we fall back to a per-process limiter and
+    retry the store after `retry_after` seconds.
+    """
+
+    def __init__(
+        self,
+        client,
+        calls: int,
+        period: float,
+        batch_size: int = 5,
+        lease_seconds: float = 1.0,
+        prefix: str = "ratelimit:",
+        retry_after: float = 5.0,
+        max_keys: int = 100_000,
+    ):
+        self.client = client
+        self.calls = calls
+        self.period = float(period)
+        self.emission_interval = self.period / calls
+        self.batch_size = max(1, min(batch_size, calls))
+        self.lease_seconds = lease_seconds
+        self.prefix = prefix
+        self.retry_after = retry_after
+        self.max_keys = max_keys
+        # key -> [tokens_left, lease_expires_at, store_remaining, reset_at]
+        self._leases: "OrderedDict[str, list]" = OrderedDict()
+        self._fallback = LocalBackend(calls, period, max_keys=max_keys)
+        self._store_down_until = 0.0
+
+    async def hit(self, key: str, cost: int = 1) -> RateLimitResult:
+        now = time.monotonic()
+        lease = self._leases.get(key)
+        if lease is not None and lease[0] >= cost and lease[1] > now:
+            CACHE_REQUESTS.inc("ratelimit_lease", "hit")
+            lease[0] -= cost
+            return RateLimitResult(
+                allowed=True,
+                limit=self.calls,
+                remaining=lease[2] + lease[0],
+                reset_after=max(0.0, lease[3] - now),
+                retry_after=0.0,
+            )
+
+        CACHE_REQUESTS.inc("ratelimit_lease", "miss")
+        if now < self._store_down_until:
+            return await self._fallback.hit(key, cost)
+
+        try:
+            granted, store_remaining, reset_after, retry_after = await self.client.eval(
+                GCRA_RESERVE_SCRIPT,
+                1,
+                self.prefix + key,
+                self.emission_interval,
+                self.period,
+                max(self.batch_size, cost),
+                cost,
+            )
+        except Exception as e:
+            logger.warning(f"Rate limit store unavailable, falling back to local limiting: {e}")
+            self._store_down_until = now + self.retry_after
+            return await self._fallback.hit(key, cost)
+
+        granted = int(granted)
+        reset_after = float(reset_after)
+        if granted < cost:
+            self._leases.pop(key, None)
+            return RateLimitResult(
+                allowed=False,
+                limit=self.calls,
+                remaining=0,
+                reset_after=reset_after,
+                retry_after=float(retry_after),
+            )
+
+        leftover = granted - cost
+        self._leases[key] = [leftover, now + self.lease_seconds, int(store_remaining), now + reset_after]
+        self._leases.move_to_end(key)
+        if len(self._leases) > self.max_keys:
+            self._leases.popitem(last=False)
+
+        return RateLimitResult(
+            allowed=True,
+            limit=self.calls,
+            remaining=int(store_remaining) + leftover,
+            reset_after=reset_after,
+            retry_after=0.0,
+        )
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def build_limiter_backend(calls: int, period: float, name: str = "default") -> LimiterBackend:
+    """Create the limiter backend selected by RATE_LIMIT_BACKEND"""
+    if settings.RATE_LIMIT_BACKEND == "REDIS":
+        if not settings.REDIS_URL:
+            raise RuntimeError("RATE_LIMIT_BACKEND=REDIS requires REDIS_URL")
+        import redis.asyncio as redis  # optional dependency, only needed for the shared store
+
+        client = redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.RATE_LIMIT_STORE_TIMEOUT,
+            socket_connect_timeout=settings.RATE_LIMIT_STORE_TIMEOUT,
+        )
+        return SharedStoreBackend(
+            client, calls, period, batch_size=settings.RATE_LIMIT_BATCH_SIZE, prefix=f"ratelimit:{name}:"
+        )
+    return LocalBackend(calls, period)
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """A named budget. `key` decides who shares it: the authenticated user when
+    there is one ("principal"), or always the client IP ("ip")"""
+    calls: int
+    period: int
+    key: Literal["principal", "ip"] = "principal"
+
+
+@dataclass(frozen=True)
+class RouteLimit:
+    """Maps requests to a policy and a cost.
+
+    `path` is matched segment by segment: `{name}` matches any single segment and a
+    trailing `/*` matches everything below. `policy=None` exempts the route.
+    """
+    method: str  # "GET", "POST", ... or "*"
+    path: str
+    policy: Optional[str] = "default"
+    cost: int = 1
+
+
+class _Node:
+    __slots__ = ("children", "exact", "prefix")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.exact: Dict[str, RouteLimit] = {}
+        self.prefix: Dict[str, RouteLimit] = {}
+
+
+class RouteMatcher:
+    """Route rules precompiled into a segment trie.
+
+    A lookup walks the request path once, so its cost depends only on the path depth,
+    not on how many rules there are. Literal segments win over `{param}` segments, the
+    deepest `/*` rule wins over shallower ones, and an exact method wins over "*".
+    """
+
+    PARAM = "{}"
+
+    def __init__(self, routes: Iterable[RouteLimit], default: RouteLimit):
+        self.default = default
+        self.root = _Node()
+        for route in routes:
+            node = self.root
+            segments = [s for s in route.path.split("/") if s]
+            wildcard = bool(segments) and segments[-1] == "*"
+            if wildcard:
+                segments = segments[:-1]
+            for seg in segments:
+                if seg.startswith("{") and seg.endswith("}"):
+                    seg = self.PARAM
+                node = node.children.setdefault(seg, _Node())
+            (node.prefix if wildcard else node.exact)[route.method.upper()] = route
+
+    @staticmethod
+    def _pick(rules: Dict[str, RouteLimit], method: str) -> Optional[RouteLimit]:
+        return rules.get(method) or rules.get("*")
+
+    def match(self, method: str, path: str) -> RouteLimit:
+        node = self.root
+        best = self._pick(node.prefix, method) if node.prefix else None
+        for seg in path.split("/"):
+            if not seg:
+                continue
+            node = node.children.get(seg) or node.children.get(self.PARAM)
+            if node is None:
+                return best or self.default
+            if node.prefix:
+                best = self._pick(node.prefix, method) or best
+        if node.exact:
+            exact = self._pick(node.exact, method)
+            if exact:
+                return exact
+        return best or self.default
+
+
+# Budgets and per-endpoint costs for this API. Expensive endpoints (AI, uploads,
+# search) draw more from the shared budget; credential endpoints get their own
+# strict per-IP budget; health checks are exempt.
+RATE_LIMIT_POLICIES: Dict[str, RateLimitPolicy] = {
+    "default": RateLimitPolicy(calls=100, period=60),
+    "auth": RateLimitPolicy(calls=10, period=60, key="ip"),
+    "ai": RateLimitPolicy(calls=20, period=60),
+}
+
+RATE_LIMIT_ROUTES = [
+    RouteLimit("*", "/", policy=None),
+    RouteLimit("*", "/healthz", policy=None),
+    RouteLimit("*", "/health/detailed", policy=None),
+    RouteLimit("GET", "/metrics", policy=None),
+    RouteLimit("POST", "/api/v1/auth/login", policy="auth"),
+    RouteLimit("POST", "/api/v1/auth/signup", policy="auth"),
+    RouteLimit("POST", "/api/v1/auth/forgot-password", policy="auth"),
+    RouteLimit("POST", "/api/v1/auth/reset-password", policy="auth"),
+    RouteLimit("POST", "/api/v1/verification/request", policy="auth"),
+    RouteLimit("POST", "/api/v1/verification/verify-otp", policy="auth"),
+    RouteLimit("*", "/api/v1/ai/*", policy="ai"),
+    RouteLimit("GET", "/api/v1/ai/health"),
+    RouteLimit("POST", "/api/v1/listings", cost=5),
+    RouteLimit("PATCH", "/api/v1/profile/me", cost=5),
+    RouteLimit("POST", "/api/v1/verification/upload-id", cost=5),
+    RouteLimit("POST", "/api/v1/chat/rooms/{room_id}/messages/file", cost=5),
+    RouteLimit("GET", "/api/v1/listings/search", cost=3),
+    RouteLimit("GET", "/api/v1/listings/advanced-search", cost=5),
+]
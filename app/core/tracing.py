@@ -0,0 +1,309 @@
+import os
+import abc
+import json
+import time
+import queue
+import random
+import logging
+import secrets
+import functools
+import threading
+import inspect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status", "sampled")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, kind: str = "internal"):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = "OK"
+        self.sampled = sampled
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.sampled:
+            self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status = "ERROR"
+        self.set_attribute("exception.type", type(exc).__name__)
+        self.set_attribute("exception.message", str(exc)[:500])
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.sampled:
+                tracer.processor.on_end(self)
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header value for propagating this span downstream"""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+# ---- exporters ----
+
+class SpanExporter(abc.ABC):
+    @abc.abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        ...
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonLinesExporter(SpanExporter):
+    """Appends one JSON object per span to a file; handy for tests and local debugging"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, spans: List[Span]) -> None:
+        for span in spans:
+            self._file.write(json.dumps(span.to_dict(), default=str) + "\n")
+        self._file.flush()
+
+    def shutdown(self) -> None:
+        self._file.close()
+
+
+class OTLPHttpExporter(SpanExporter):
+    """Sends spans to an OpenTelemetry collector using OTLP/HTTP with the JSON encoding"""
+
+    KINDS = {"internal": 1, "server": 2, "client": 3}
+
+    def __init__(self, endpoint: str, service_name: str, headers: Optional[Dict[str, str]] = None, timeout: float = 5.0):
+        import httpx
+
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=timeout, headers=headers or {})
+
+    @staticmethod
+    def _value(value: Any) -> dict:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def export(self, spans: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "app.core.tracing"},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "kind": self.KINDS.get(span.kind, 1),
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": [{"key": k, "value": self._value(v)} for k, v in span.attributes.items()],
+                            "status": {"code": 2 if span.status == "ERROR" else 1},
+                        }
+                        for span in spans
+                    ],
+                }],
+            }]
+        }
+        response = self.client.post(self.url, json=payload)
+        response.raise_for_status()
+
+    def shutdown(self) -> None:
+        self.client.close()
+
+
+class BatchSpanProcessor:
+    """Hands finished spans to a background thread that exports them in batches"""
+
+    def __init__(self, exporter: Optional[SpanExporter], max_batch: int = 256, interval: float = 2.0, max_queue: int = 10_000):
+        self.exporter = exporter
+        self.max_batch = max_batch
+        self.interval = interval
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        if exporter is not None:
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def on_end(self, span: Span) -> None:
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass  # drop rather than block the request
+
+    def _run(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.interval
+        while True:
+            try:
+                span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if span is None:
+                    break
+                batch.append(span)
+            except queue.Empty:
+                pass
+            if len(batch) >= self.max_batch or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.interval
+        self._flush(batch)
+
+    def _flush(self, batch: List[Span]) -> None:
+        if not batch:
+            return
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.warning(f"Span export failed ({len(batch)} spans dropped): {e}")
+
+    def shutdown(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+            self.exporter.shutdown()
+
+
+# ---- tracer ----
+
+class Tracer:
+    """Context-var propagated spans with head-based sampling.
+
+    The sampling decision is made once, at the root span, and inherited by every
+    child, so a trace is either recorded completely or not at all. Unsampled spans
+    still carry ids (for log correlation) but skip attributes and export.
+    """
+
+    def __init__(self, processor: BatchSpanProcessor, sample_rate: float):
+        self.processor = processor
+        self.sample_rate = sample_rate
+        self.enabled = processor.exporter is not None
+
+    def start(self, name: str, attributes: Optional[Dict[str, Any]] = None, kind: str = "internal",
+              traceparent: Optional[str] = None) -> Span:
+        """Create a span as a child of the current one; the caller must call end()"""
+        parent = _current_span.get()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, parent.sampled, kind)
+        else:
+            remote = _parse_traceparent(traceparent) if traceparent else None
+            if remote:
+                span = Span(name, remote[0], remote[1], remote[2] and self.enabled, kind)
+            else:
+                sampled = self.enabled and random.random() < self.sample_rate
+                span = Span(name, secrets.token_hex(16), None, sampled, kind)
+        if attributes and span.sampled:
+            span.attributes.update(attributes)
+        return span
+
+    @staticmethod
+    def activate(span: Span):
+        """Make `span` the parent of spans started in this context; returns a token for deactivate()"""
+        return _current_span.set(span)
+
+    @staticmethod
+    def deactivate(token) -> None:
+        _current_span.reset(token)
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None, kind: str = "internal",
+             traceparent: Optional[str] = None) -> Iterator[Span]:
+        span = self.start(name, attributes, kind, traceparent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+
+def _parse_traceparent(value: str):
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], parts[3] == "01"
+
+
+def _build_exporter() -> Optional[SpanExporter]:
+    if settings.TRACE_EXPORTER == "JSONL":
+        return JsonLinesExporter(settings.TRACE_JSONL_PATH)
+    if settings.TRACE_EXPORTER == "OTLP":
+        if not settings.OTLP_ENDPOINT:
+            raise RuntimeError("TRACE_EXPORTER=OTLP requires OTLP_ENDPOINT")
+        return OTLPHttpExporter(settings.OTLP_ENDPOINT, service_name=settings.APP_NAME)
+    return None
+
+
+tracer = Tracer(BatchSpanProcessor(_build_exporter()), sample_rate=settings.TRACE_SAMPLE_RATE)
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: str = "internal"):
+    """`with start_span("storage.upload", {"key": key}):` - child of the current span"""
+    return tracer.span(name, attributes, kind)
+
+
+def traced(name: str):
+    """Decorator wrapping a sync or async function in a span"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,118 @@
+import time
+import logging
+from typing import Dict
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+from app.core.config import settings
+from app.core.context import RequestContext, current_request
+from app.core import metrics
+from app.core.tracing import current_span, tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+    parent = current_span()
+    if parent is not None and parent.sampled:
+        context._span = tracer.start("db.query", {
+            "db.system": conn.dialect.name,
+            "db.statement": " ".join(statement.split())[:1000],
+        }, kind="client")
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_span", None)
+    if span is not None:
+        span.set_attribute("db.rowcount", cursor.rowcount)
+        span.end()
+
+    # SQLAlchemy's compiled-statement cache: a miss means the statement was recompiled
+    cache_hit = getattr(context, "cache_hit", None)
+    if cache_hit is CACHE_HIT:
+        metrics.CACHE_REQUESTS.inc("sqlalchemy_compiled", "hit")
+    elif cache_hit is CACHE_MISS:
+        metrics.CACHE_REQUESTS.inc("sqlalchemy_compiled", "miss")
+
+    ctx = current_request()
+    if ctx is None:
+        return
+    ctx.db_time += time.perf_counter() - context._query_start
+    ctx.db_queries += 1
+    if not executemany:
+        _track_repeats(ctx, statement, parameters)
+
+
+def _handle_error(exception_context) -> None:
+    span = getattr(exception_context.execution_context, "_span", None)
+    if span is not None:
+        span.record_exception(exception_context.original_exception)
+        span.end()
+
+
+def _track_repeats(ctx: RequestContext, statement: str, parameters) -> None:
+    """Flag N+1 patterns: the same SQL issued again and again with different parameters"""
+    seen = ctx.statements.get(statement)
+    if seen is None:
+        if len(ctx.statements) < 500:  # bound memory on pathological requests
+            ctx.statements[statement] = [1, parameters, False]
+        return
+    seen[0] += 1
+    if not seen[2] and parameters != seen[1]:
+        seen[2] = True
+    if seen[2] and seen[0] == settings.DB_N_PLUS_ONE_THRESHOLD:
+        ctx.n_plus_one.append(statement)
+        logger.warning(
+            f"Possible N+1 in {ctx.method} {ctx.route}: statement ran {seen[0]}+ times with different parameters: "
+            f"{' '.join(statement.split())[:300]}"
+        )
+
+
+_engines: Dict[str, Engine] = {}
+
+
+def _pool_stat(attr: str):
+    def read() -> Dict[tuple, float]:
+        values = {}
+        for name, engine in list(_engines.items()):
+            fn = getattr(engine.pool, attr, None)
+            if fn is not None:
+                values[(name,)] = float(fn())
+        return values
+    return read
+
+
+for _attr, _doc in (
+    ("checkedout", "Connections currently checked out of the pool"),
+    ("checkedin", "Idle connections held by the pool"),
+    ("overflow", "Connections opened beyond pool_size (negative while the pool is not full)"),
+    ("size", "Configured pool size"),
+):
+    metrics.gauge_func(f"db_pool_{_attr}", _doc, _pool_stat(_attr), ("engine",))
+
+
+def instrument_engine(engine: Engine, name: str = "primary") -> None:
+    """Attribute time spent in SQL statements to the current request (and its trace) and export pool gauges"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    engine.pool.engine_name = name  # label for the pool wait-time histogram
+    _engines[name] = engine
+
+
+def assert_query_budget(response, max_queries: int, allow_n_plus_one: bool = False) -> None:
+    """Fail if an endpoint response exceeded its statement budget.
+
+    Reads the X-DB-Queries / X-DB-N-Plus-One headers that EdgeMiddleware adds outside
+    production, so it works with TestClient responses (scripts/check_query_budgets.py):
+        assert_query_budget(client.get("/api/v1/admin/stats"), max_queries=14)
+    """
+    if "x-db-queries" not in response.headers:
+        raise AssertionError("Response has no X-DB-Queries header (query accounting is disabled in production)")
+    used = int(response.headers["x-db-queries"])
+    route = f"{response.request.method} {response.request.url.path}"
+    assert used <= max_queries, f"{route} ran {used} SQL statements, budget is {max_queries}"
+    if not allow_n_plus_one:
+        repeated = int(response.headers.get("x-db-n-plus-one", "0"))
+        assert repeated == 0, f"{route} has {repeated} N+1 statement pattern(s), see the app log"
@@ -0,0 +1,155 @@
+import time
+import uuid
+import logging
+from typing import Any, Dict
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from app.core.config import settings
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+POOL_WAIT = metrics.histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting for a pooled connection (including opening a new one)",
+    ("engine",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+POOL_TIMEOUTS = metrics.counter(
+    "db_pool_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT because the pool was exhausted",
+    ("engine",),
+)
+
+
+class _TimedPoolMixin:
+    """Records how long each checkout waited; `engine_name` is set by instrument_engine"""
+
+    engine_name = "default"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.inc(self.engine_name)
+            logger.error(
+                f"DB pool '{self.engine_name}' exhausted: no connection within {self._timeout}s "
+                f"(size={self.size()}, overflow={self.overflow()}, checked out={self.checkedout()})"
+            )
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start, self.engine_name)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.engine_name = self.engine_name
+        return pool
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _timeouts() -> Dict[str, str]:
+    values = {
+        "statement_timeout": settings.DB_STATEMENT_TIMEOUT_MS,
+        "lock_timeout": settings.DB_LOCK_TIMEOUT_MS,
+        "idle_in_transaction_session_timeout": settings.DB_IDLE_IN_TRANSACTION_TIMEOUT_MS,
+    }
+    return {name: str(int(ms)) for name, ms in values.items() if ms}
+
+
+def _pool_options() -> Dict[str, Any]:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def sync_engine_options(url: str) -> Dict[str, Any]:
+    """create_engine() keyword arguments for the psycopg2 engine"""
+    if not url.startswith("postgresql"):
+        return {}
+    options = {"poolclass": TimedQueuePool, **_pool_options()}
+    timeouts = _timeouts()
+    if timeouts and not settings.DB_PGBOUNCER:
+        # Session-level settings sent in the startup packet; no extra round trip
+        options["connect_args"] = {"options": " ".join(f"-c {k}={v}" for k, v in timeouts.items())}
+    return options
+
+
+def async_engine_options(url: str) -> Dict[str, Any]:
+    """create_async_engine() keyword arguments for the asyncpg engine"""
+    if not url.startswith("postgresql"):
+        return {}
+    options = {"poolclass": TimedAsyncQueuePool, **_pool_options()}
+    if settings.DB_PGBOUNCER:
+        # Prepared statements live on a server connection, which PgBouncer in transaction
+        # mode hands to someone else after every transaction: disable both statement caches
+        # and use unique names so a stale name can never collide.
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    else:
+        # asyncpg prepares every statement server-side; keep enough of them per connection
+        # that the hot queries never fall out and get re-parsed and re-planned
+        options["connect_args"] = {
+            "server_settings": _timeouts(),
+            "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
+def _set_local_timeouts(session, transaction, connection) -> None:
+    if connection.dialect.name == "postgresql":
+        # set_config(..., true) is SET LOCAL: it ends with the transaction, so nothing
+        # leaks to the next client PgBouncer gives this server connection to
+        connection.exec_driver_sql(_SET_LOCAL_SQL)
+
+
+_SET_LOCAL_SQL = "SELECT " + ", ".join(
+    f"set_config('{name}', '{value}', true)" for name, value in _timeouts().items()
+)
+
+if settings.DB_PGBOUNCER and _timeouts():
+    # PgBouncer rejects startup parameters and would share session-level SETs
+    # across clients, so timeouts are applied per transaction instead
+    event.listen(Session, "after_begin", _set_local_timeouts)
+
+
+def warm_up(engine: Engine, connections: int) -> None:
+    """Open `connections` pooled connections now rather than on the first requests"""
+    held = []
+    try:
+        for _ in range(min(connections, settings.DB_POOL_SIZE)):
+            held.append(engine.connect())
+    except Exception as e:
+        logger.warning(f"DB pool warm-up stopped after {len(held)} connections: {e}")
+    finally:
+        for conn in held:
+            conn.close()
+
+
+async def warm_up_async(engine: AsyncEngine, connections: int) -> None:
+    held = []
+    try:
+        for _ in range(min(connections, settings.DB_POOL_SIZE)):
+            held.append(await engine.connect())
+    except Exception as e:
+        logger.warning(f"Async DB pool warm-up stopped after {len(held)} connections: {e}")
+    finally:
+        for conn in held:
+            await conn.close()
@@ -0,0 +1,181 @@
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import async_database_uri, settings
+from app.core import metrics
+from app.core.context import current_request
+from app.db.instrumentation import instrument_engine
+from app.db.pool import async_engine_options, sync_engine_options
+from app.db.slowlog import slow_query_log
+
+logger = logging.getLogger(__name__)
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+
+READS_ROUTED = metrics.counter(
+    "db_reads_routed_total",
+    "Read-only sessions by target (replica name or primary) and reason",
+    ("target", "reason"),
+)
+
+
+@dataclass
+class Replica:
+    name: str
+    engine: Engine
+    async_engine: AsyncEngine
+    session_factory: sessionmaker
+    async_session_factory: async_sessionmaker
+    healthy: bool = True
+    lag: float = 0.0
+
+
+class RecentWriters:
+    """Principals that wrote to the primary in the last `window` seconds.
+
+    Per process: with several workers a follow-up read can land on a worker that
+    didn't see the write, which is why replicas lagging more than
+    REPLICA_MAX_LAG_SECONDS are taken out of rotation as well.
+    """
+
+    def __init__(self, window: float, max_entries: int = 100_000):
+        self.window = window
+        self.max_entries = max_entries
+        self._until: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def note(self, principal: str) -> None:
+        with self._lock:
+            self._until[principal] = time.monotonic() + self.window
+            self._until.move_to_end(principal)
+            while len(self._until) > self.max_entries:
+                self._until.popitem(last=False)
+
+    def is_recent(self, principal: str) -> bool:
+        until = self._until.get(principal)
+        if until is None:
+            return False
+        if until < time.monotonic():
+            with self._lock:
+                self._until.pop(principal, None)
+            return False
+        return True
+
+
+class ReplicaRouter:
+    """Round-robin over healthy read replicas, with read-your-writes stickiness"""
+
+    def __init__(self, urls: List[str], sticky_seconds: float, max_lag: float, check_interval: float):
+        self.replicas: List[Replica] = [self._build(f"replica{i}", url) for i, url in enumerate(urls)]
+        self.recent_writers = RecentWriters(sticky_seconds)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _build(name: str, url: str) -> Replica:
+        async_url = async_database_uri(url)
+        engine = create_engine(url, future=True, **sync_engine_options(url))
+        async_engine = create_async_engine(async_url, **async_engine_options(async_url))
+        instrument_engine(engine, name=name)
+        instrument_engine(async_engine.sync_engine, name=f"{name}_async")
+        slow_query_log.install(engine)
+        slow_query_log.install(async_engine.sync_engine, explain_engine=engine)
+        return Replica(
+            name=name,
+            engine=engine,
+            async_engine=async_engine,
+            session_factory=sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True),
+            async_session_factory=async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False),
+        )
+
+    def watch_writes(self, engine: Engine) -> None:
+        """Remember who wrote through `engine` (the primary) so their next reads stay on it"""
+        def after(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip()[:6].upper() in _WRITE_PREFIXES:
+                ctx = current_request()
+                if ctx is not None and ctx.user_id:
+                    self.recent_writers.note(ctx.user_id)
+
+        event.listen(engine, "after_cursor_execute", after)
+
+    def pick(self, principal: Optional[str]) -> Optional[Replica]:
+        """A healthy replica for this reader, or None to use the primary"""
+        if not self.replicas:
+            return None
+        if principal and self.recent_writers.is_recent(principal):
+            READS_ROUTED.inc("primary", "recent_write")
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            READS_ROUTED.inc("primary", "no_healthy_replica")
+            return None
+        replica = healthy[next(self._next) % len(healthy)]
+        READS_ROUTED.inc(replica.name, "round_robin")
+        return replica
+
+    async def check(self) -> None:
+        for replica in self.replicas:
+            try:
+                async with replica.async_engine.connect() as conn:
+                    lag = float(await asyncio.wait_for(conn.scalar(REPLICA_LAG_SQL), timeout=2))
+                replica.lag = lag
+                healthy = lag <= self.max_lag
+                reason = f"lag {lag:.1f}s"
+            except Exception as e:
+                healthy = False
+                reason = str(e).splitlines()[0] if str(e) else type(e).__name__
+            if healthy != replica.healthy:
+                log = logger.info if healthy else logger.warning
+                log(f"Read replica {replica.name} is now {'healthy' if healthy else 'unhealthy'} ({reason})")
+            replica.healthy = healthy
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for replica in self.replicas:
+            await replica.async_engine.dispose()
+            replica.engine.dispose()
+
+
+replica_router = ReplicaRouter(
+    settings.SQLALCHEMY_REPLICA_URIS,
+    sticky_seconds=settings.READ_YOUR_WRITES_SECONDS,
+    max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.REPLICA_HEALTH_CHECK_INTERVAL,
+)
+
+metrics.gauge_func(
+    "db_replica_healthy", "1 while the read replica is in rotation",
+    lambda: {(r.name,): float(r.healthy) for r in replica_router.replicas}, ("replica",),
+)
+metrics.gauge_func(
+    "db_replica_lag_seconds", "Replication lag seen by the last health check",
+    lambda: {(r.name,): r.lag for r in replica_router.replicas}, ("replica",),
+)
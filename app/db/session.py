@@ -1,8 +1,31 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
+from app.db.instrumentation import instrument_engine
+from app.db.pool import async_engine_options, sync_engine_options
+from app.db.routing import replica_router
+from app.db.slowlog import slow_query_log
 
 # Use normalized URI so Railway's postgres:// works
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True, future=True)
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URI, future=True, **sync_engine_options(settings.SQLALCHEMY_DATABASE_URI)
+)
+instrument_engine(engine)
+slow_query_log.install(engine)
+replica_router.watch_writes(engine)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+
+# asyncpg engine for handlers that run on the event loop. Statement events fire on
+# its sync_engine, so query accounting, tracing and the slow log apply unchanged.
+# Sampled EXPLAINs run on the psycopg2 engine, with the $n binds re-rendered for it.
+async_engine = create_async_engine(
+    settings.SQLALCHEMY_ASYNC_DATABASE_URI, **async_engine_options(settings.SQLALCHEMY_ASYNC_DATABASE_URI)
+)
+instrument_engine(async_engine.sync_engine, name="primary_async")
+slow_query_log.install(async_engine.sync_engine, explain_engine=engine)
+replica_router.watch_writes(async_engine.sync_engine)
+# expire_on_commit=False: attribute access after commit would need an implicit (sync) refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
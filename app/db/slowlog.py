@@ -0,0 +1,176 @@
+import re
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from typing import Any, Deque, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.core.config import settings
+from app.core.context import current_request
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_BIND_PARAM = re.compile(r"%\(\w+\)s|%s|\$\d+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_DOLLAR_PARAM = re.compile(r"\$(\d+)")
+# SELECTs that lock rows or call side-effecting functions: running them again under
+# ANALYZE would take the locks or repeat the effect, so they only get a plain EXPLAIN
+_NOT_REPEATABLE = re.compile(
+    r"\bFOR\s+(?:NO\s+KEY\s+)?UPDATE\b|\bFOR\s+(?:KEY\s+)?SHARE\b"
+    r"|\b(?:nextval|setval|pg_notify|set_config|pg_(?:try_)?advisory_\w+|pg_sleep\w*|dblink\w*|lo_\w+)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def normalize_sql(statement: str) -> str:
+    """Replace literals and bind markers with ? so equivalent statements group together"""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _BIND_PARAM.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("(?, ...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def dollar_to_pyformat(statement: str, parameters: Any) -> Tuple[str, dict]:
+    """Re-render an asyncpg statement ($1, $2, ...) with psycopg2 binds (%(p1)s, ...)"""
+    sql = _DOLLAR_PARAM.sub(lambda m: f"%(p{m.group(1)})s", statement.replace("%", "%%"))
+    return sql, {f"p{i}": value for i, value in enumerate(parameters, 1)}
+
+
+def parameter_shapes(parameters: Any) -> Any:
+    """Types (and collection sizes) of the bind parameters, never their values"""
+    def shape(value):
+        if isinstance(value, (list, tuple, set)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    if isinstance(parameters, dict):
+        return {key: shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [shape(value) for value in parameters]
+    return shape(parameters)
+
+
+@dataclass
+class SlowQuery:
+    fingerprint: str
+    statement: str
+    duration_ms: float
+    parameter_shapes: Any
+    route: Optional[str]
+    method: Optional[str]
+    captured_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    explain: Optional[str] = None
+    explain_error: Optional[str] = None
+
+
+class SlowQueryLog:
+    """Ring buffer of statements slower than SLOW_QUERY_MS.
+
+    A sample of slow SELECTs is re-run under EXPLAIN (ANALYZE, BUFFERS) on a separate
+    connection by a single background thread, so the request that hit the slow
+    statement doesn't pay for the plan. Writes are never re-executed, and SELECTs that
+    lock rows or call side-effecting functions only get a plain EXPLAIN.
+    """
+
+    def __init__(self, threshold_ms: float, size: int, explain_sample_rate: float, explain_timeout_ms: int):
+        self.threshold = threshold_ms / 1000
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_timeout_ms = explain_timeout_ms
+        self.entries: Deque[SlowQuery] = deque(maxlen=size)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def install(self, engine: Engine, explain_engine: Optional[Engine] = None) -> None:
+        """Watch `engine`; EXPLAINs run on `explain_engine` (defaults to the same engine)"""
+        explain_engine = explain_engine or engine
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            context._slowlog_start = time.perf_counter()
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context._slowlog_start
+            if elapsed >= self.threshold and not statement.startswith("EXPLAIN"):
+                self.record(statement, parameters, elapsed, context, explain_engine)
+
+        event.listen(engine, "before_cursor_execute", before)
+        event.listen(engine, "after_cursor_execute", after)
+
+    def record(self, statement: str, parameters, elapsed: float, context, explain_engine: Engine) -> None:
+        normalized = normalize_sql(statement)
+        ctx = current_request()
+        entry = SlowQuery(
+            fingerprint=hashlib.sha1(normalized.encode()).hexdigest()[:12],
+            statement=normalized,
+            duration_ms=round(elapsed * 1000, 2),
+            parameter_shapes=parameter_shapes(parameters),
+            route=ctx.route if ctx else None,
+            method=ctx.method if ctx else None,
+        )
+        self.entries.append(entry)
+        logger.warning(
+            f"Slow query ({entry.duration_ms}ms) in {entry.method} {entry.route} [{entry.fingerprint}]: {normalized[:300]}"
+        )
+
+        if (
+            statement.lstrip()[:6].upper() == "SELECT"
+            and context.dialect.name == "postgresql"
+            and random.random() < self.explain_sample_rate
+        ):
+            paramstyles = (context.dialect.paramstyle, explain_engine.dialect.paramstyle)
+            if paramstyles == ("numeric_dollar", "pyformat") and isinstance(parameters, (list, tuple)):
+                # asyncpg statement, EXPLAINed on the psycopg2 engine
+                statement, parameters = dollar_to_pyformat(statement, parameters)
+            elif paramstyles[0] != paramstyles[1]:
+                return
+            self._schedule_explain(entry, statement, parameters, explain_engine)
+
+    def _schedule_explain(self, entry: SlowQuery, statement: str, parameters, engine: Engine) -> None:
+        with self._lock:
+            if self._pending >= 10:  # don't let EXPLAINs pile up behind a slow database
+                return
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slowlog-explain")
+        self._executor.submit(self._explain, entry, statement, parameters, engine)
+
+    def _explain(self, entry: SlowQuery, statement: str, parameters, engine: Engine) -> None:
+        try:
+            with engine.connect() as conn:
+                # Anything that would write (nextval included) fails instead of running
+                conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}")
+                explain = "EXPLAIN " if _NOT_REPEATABLE.search(statement) else "EXPLAIN (ANALYZE, BUFFERS) "
+                rows = conn.exec_driver_sql(explain + statement, parameters).fetchall()
+                entry.explain = "\n".join(row[0] for row in rows)
+                conn.rollback()
+        except Exception as e:
+            entry.explain_error = str(e).splitlines()[0] if str(e) else type(e).__name__
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def snapshot(self, limit: int = 50) -> List[dict]:
+        """Most recent entries first"""
+        return [asdict(entry) for entry in list(self.entries)[-limit:][::-1]]
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.SLOW_QUERY_MS,
+    size=settings.SLOW_QUERY_BUFFER_SIZE,
+    explain_sample_rate=settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE,
+    explain_timeout_ms=settings.SLOW_QUERY_EXPLAIN_TIMEOUT_MS,
+)
@@ -0,0 +1,55 @@
+"""
+Cached statements for the hottest lookups.
+
+Each helper returns a lambda_stmt: SQLAlchemy keys its compiled-SQL cache on the
+lambda's code location and turns the closure variables into bind parameters, so a
+call costs a cache lookup instead of building a Query/select(), generating its cache
+key and walking the expression tree. On the asyncpg engine the resulting SQL string
+is also the key of the connection's server-side prepared statement, so Postgres
+parses and plans it once per connection.
+
+Rules for adding one: only plain values in the closure (no ORM objects, lists or
+expressions), and no Python branching inside the lambda.
+"""
+from sqlalchemy import func, lambda_stmt, or_, and_, select, update
+from sqlalchemy.sql import StatementLambdaElement
+from app.models.chat import ChatRoom
+from app.models.listing import Listing
+from app.models.user import User
+
+
+def user_by_id(user_id: str) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(User).where(User.id == user_id).limit(1))
+
+
+def listing_by_id(listing_id: int) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(Listing).where(Listing.id == listing_id).limit(1))
+
+
+def chat_room_for(listing_id: int, user_a: str, user_b: str) -> StatementLambdaElement:
+    """The room for a listing between two users, whichever order they were stored in"""
+    return lambda_stmt(lambda: select(ChatRoom).where(
+        ChatRoom.listing_id == listing_id,
+        or_(
+            and_(ChatRoom.participant1_id == user_a, ChatRoom.participant2_id == user_b),
+            and_(ChatRoom.participant1_id == user_b, ChatRoom.participant2_id == user_a),
+        ),
+    ).limit(1))
+
+
+def touch_chat_room(room_id: int) -> StatementLambdaElement:
+    """Bump the room's last_message_at to now(), the transaction start - i.e. the
+    timestamp server default of a message inserted in the same transaction - and
+    return the message's (sequence number, id). The id is drawn while the room row is
+    locked, as the write-behind batches do (app.services.message_ingest), so ids grow
+    in send order within a room whichever path stores the message."""
+    return lambda_stmt(lambda: update(ChatRoom).where(ChatRoom.id == room_id).values(
+        last_message_at=func.now(), last_seq=ChatRoom.last_seq + 1,
+    ).returning(ChatRoom.last_seq, func.nextval(func.pg_get_serial_sequence("chat_messages", "id"))))
+
+
+def next_chat_room_seq(room_id: int) -> StatementLambdaElement:
+    """Take the room's next event sequence number"""
+    return lambda_stmt(lambda: update(ChatRoom).where(ChatRoom.id == room_id).values(
+        last_seq=ChatRoom.last_seq + 1,
+    ).returning(ChatRoom.last_seq))
@@ -0,0 +1,65 @@
+import logging
+from typing import Any, Callable, List, Tuple
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    """All writes of a request in one transaction, side effects only once it committed.
+
+        with UnitOfWork(db) as uow:
+            db.add(listing)
+            uow.flush()  # INSERT ... RETURNING: id and server defaults, no refresh
+            NotificationService.notify_listing_created(db, listing, user.id, commit=False)
+            uow.after_commit(send_email, user.email, subject, body)
+        return listing
+
+    Leaving the block commits (or rolls back on an exception, dropping the callbacks).
+    expire_on_commit is off inside the block, so objects keep the values the INSERT /
+    UPDATE statements returned and serializing them afterwards doesn't SELECT them again.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._callbacks: List[Tuple[Callable[..., Any], tuple, dict]] = []
+        self._expire_on_commit = db.expire_on_commit
+
+    def __enter__(self) -> "UnitOfWork":
+        self.db.expire_on_commit = False
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.db.expire_on_commit = self._expire_on_commit
+
+    def flush(self) -> None:
+        """Send pending writes now, e.g. when a later write needs a generated id"""
+        self.db.flush()
+
+    def after_commit(self, fn: Callable[..., Any], *args, **kwargs) -> None:
+        """Run fn(*args, **kwargs) after a successful commit; never on rollback"""
+        self._callbacks.append((fn, args, kwargs))
+
+    def commit(self) -> None:
+        try:
+            self.db.commit()
+        except Exception:
+            self.rollback()
+            raise
+        callbacks, self._callbacks = self._callbacks, []
+        for fn, args, kwargs in callbacks:
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                # The data is committed; a failed side effect must not turn the request into an error
+                logger.exception(f"Post-commit side effect {getattr(fn, '__qualname__', fn)} failed")
+
+    def rollback(self) -> None:
+        self._callbacks.clear()
+        self.db.rollback()
@@ -2,25 +2,30 @@ import logging
 import sys
 import time
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy import text
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import exc as sa_exc, text
 from app.core.config import settings
-from app.core.middleware import RateLimitMiddleware, SecurityHeadersMiddleware, LoggingMiddleware
+from app.core.logging_config import setup_logging, shutdown_logging
+from app.core.metrics import registry as metrics_registry
+from app.core.middleware import EdgeMiddleware, RateLimiter
+from app.core.ratelimit import RATE_LIMIT_POLICIES, RATE_LIMIT_ROUTES
+from app.core.tracing import tracer
 from app.api.v1 import auth, reports, verification, listings, search, favorites, notifications, admin, ai, chat, profile, review
-from app.db.session import SessionLocal
+from app.db.pool import warm_up, warm_up_async
+from app.db.routing import replica_router
+from app.db.session import SessionLocal, async_engine, engine
+from app.services.broadcast import broadcast
+from app.services.message_ingest import message_ingestor
+from app.services.presence import presence
+from app.services.ws_connections import connections
 from app.models.user import User
 from app.core.security import hash_password
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('app.log') if settings.ENV == 'production' else logging.StreamHandler()
-    ]
-)
+# Log records are handed to background writer threads so file/stream I/O stays off the event loop
+setup_logging()
 
 log = logging.getLogger("uvicorn.error")
 
@@ -36,9 +41,10 @@ app = FastAPI(
 def read_root():
     return {"message": "Welcome to the campus_exchange API"}
 
-app.add_middleware(SecurityHeadersMiddleware)
-app.add_middleware(LoggingMiddleware)
-app.add_middleware(RateLimitMiddleware, calls=100, period=60)
+app.add_middleware(
+    EdgeMiddleware,
+    rate_limiter=RateLimiter(policies=RATE_LIMIT_POLICIES, routes=RATE_LIMIT_ROUTES),
+)
 
 if settings.ENV == "production":
     app.add_middleware(
@@ -65,6 +71,29 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": "Internal server error"}
     )
 
+@app.exception_handler(sa_exc.TimeoutError)
+async def pool_timeout_handler(request: Request, exc: sa_exc.TimeoutError):
+    # Pool exhausted for DB_POOL_TIMEOUT seconds: shed load instead of hanging
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service temporarily overloaded, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.on_event("startup")
+async def warm_db_pools():
+    if settings.DB_POOL_WARMUP > 0:
+        await run_in_threadpool(warm_up, engine, settings.DB_POOL_WARMUP)
+        await warm_up_async(async_engine, settings.DB_POOL_WARMUP)
+    replica_router.start()
+
+@app.on_event("startup")
+async def connect_broadcast():
+    await broadcast.connect()
+    message_ingestor.start()
+    await presence.start()
+    connections.start()
+
 @app.on_event("startup")
 def create_single_admin():
     print("DEBUG: Entering create_single_admin startup event.") 
@@ -97,6 +126,22 @@ def create_single_admin():
         traceback.print_exc(file=sys.stderr) 
         raise e 
 
+@app.on_event("shutdown")
+async def stop_replica_checks():
+    await replica_router.stop()
+
+@app.on_event("shutdown")
+async def disconnect_broadcast():
+    connections.stop()
+    await presence.stop()  # the other workers take this one's users offline now
+    await message_ingestor.stop()  # write the messages still queued
+    await broadcast.disconnect()
+
+@app.on_event("shutdown")
+def flush_logs():
+    tracer.processor.shutdown()
+    shutdown_logging()
+
 app.include_router(admin.router, prefix="/api/v1")
 app.include_router(auth.router, prefix="/api/v1")
 app.include_router(profile.router, prefix="/api/v1")
@@ -114,6 +159,13 @@ app.include_router(reports.router, prefix="/api/v1")
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint"""
+    if not settings.METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health/detailed", tags=["Health"])
 async def detailed_health():
     """Detailed health check for monitoring"""
@@ -0,0 +1,18 @@
+from sqlalchemy import BigInteger, DateTime, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+from datetime import datetime
+from app.db.session import Base
+
+class BroadcastPayload(Base):
+    """Events too large for a NOTIFY payload, published by reference (app.services.broadcast).
+
+    UNLOGGED: rows only need to live until the other workers have read them, so they
+    skip the WAL and are not replicated.
+    """
+    __tablename__ = "broadcast_payloads"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
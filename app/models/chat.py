@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, Text, DateTime, Boolean, UniqueConstraint, String, JSON
+from sqlalchemy import Column, Integer, ForeignKey, Text, DateTime, Boolean, UniqueConstraint, String, JSON, Index
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
 from app.db.session import Base
@@ -9,6 +9,7 @@ class ChatMessage(Base):
     __tablename__ = "chat_messages"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    room_id: Mapped[int] = mapped_column(Integer, ForeignKey('chat_rooms.id', ondelete="CASCADE"), nullable=False)
     listing_id: Mapped[int] = mapped_column(Integer, ForeignKey('listings.id'), nullable=False)
     sender_id: Mapped[str] = mapped_column(String(100), ForeignKey('users.id'), nullable=False)
     receiver_id: Mapped[str] = mapped_column(String(100), ForeignKey("users.id"), nullable=False)
@@ -20,12 +21,24 @@ class ChatMessage(Base):
     message_metadata: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)  # For file info, image dimensions, etc.
     read_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
     reply_to_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('chat_messages.id'), nullable=True)
+    seq: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # room seq of the last event that touched it
 
     listing = relationship("Listing", back_populates="messages")
     sender = relationship("User", foreign_keys=[sender_id])
     receiver = relationship("User", foreign_keys=[receiver_id])
     reply_to = relationship("ChatMessage", remote_side=[id], backref="replies")
 
+# A room's history, paged by id (ids grow in send order within a room)
+Index("ix_chat_messages_room_id", ChatMessage.room_id, ChatMessage.id)
+# Resuming a room: messages changed since a seq
+Index("ix_chat_messages_room_seq", ChatMessage.room_id, ChatMessage.seq)
+# Marking a room read up to the watermark only touches its unread rows
+Index(
+    "ix_chat_messages_room_unread",
+    ChatMessage.room_id, ChatMessage.receiver_id, ChatMessage.id,
+    postgresql_where=ChatMessage.read_at.is_(None),
+)
+
 class ChatRoom(Base):
     __tablename__ = "chat_rooms"
     
@@ -37,6 +50,7 @@ class ChatRoom(Base):
     last_message_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
     status: Mapped[str] = mapped_column(String(20), default="active", nullable=False)  # active, archived, blocked
     settings: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)  # Room-specific settings
+    last_seq: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)  # see app.services.chat_replay
     
     listing = relationship("Listing")
     participant1 = relationship("User", foreign_keys=[participant1_id])
@@ -44,6 +58,23 @@ class ChatRoom(Base):
     
     __table_args__ = (UniqueConstraint('listing_id', 'participant1_id', 'participant2_id', name='uq_chat_room'),)
 
+# Room list: rooms where the user is either participant
+Index("ix_chat_rooms_participant1", ChatRoom.participant1_id, ChatRoom.last_message_at.desc())
+Index("ix_chat_rooms_participant2", ChatRoom.participant2_id, ChatRoom.last_message_at.desc())
+
+class ChatRoomMember(Base):
+    """Per-participant read state of a room: the read watermark and the unread count
+    kept in step with it (see app.services.chat_reads)"""
+    __tablename__ = "chat_room_members"
+
+    room_id: Mapped[int] = mapped_column(Integer, ForeignKey('chat_rooms.id', ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[str] = mapped_column(String(100), ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
+    last_read_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    unread_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+
+# Unread badges: all rooms of a user
+Index("ix_chat_room_members_user_id", ChatRoomMember.user_id)
+
 class BlockedUser(Base):
     __tablename__ = "blocked_users"
 
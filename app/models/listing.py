@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import JSON, String, Integer, ForeignKey, Numeric, Text, DateTime, func
+from sqlalchemy import JSON, String, Integer, ForeignKey, Numeric, Text, DateTime, Index, func, text
 from datetime import datetime
 from typing import List as SAList, Optional
 from app.db.session import Base
@@ -18,7 +18,7 @@ class Listing(Base):
     images: Mapped[Optional[list[str]]] = mapped_column(JSON, nullable=True)  # store as list of URLs
     search_vector: Mapped[Optional[str]] = deferred(mapped_column(TSVECTOR, nullable=True))
 
-    status: Mapped[str] = mapped_column(String(20), index=True, default="ACTIVE")  # ACTIVE | SOLD | ARCHIVED
+    status: Mapped[str] = mapped_column(String(20), default="ACTIVE")  # ACTIVE | SOLD | ARCHIVED
     owner_id: Mapped[str] = mapped_column(ForeignKey("users.id"), index=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -42,3 +42,9 @@ class Listing(Base):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
+
+
+# Browse (no filter), filtering by status, and the ACTIVE-only search/trending paths
+Index("ix_listings_created_at", Listing.created_at.desc())
+Index("ix_listings_status_created_at", Listing.status, Listing.created_at.desc())
+Index("ix_listings_active_created_at", Listing.created_at.desc(), postgresql_where=text("status = 'ACTIVE'"))
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, Boolean, ForeignKey, DateTime, func, Text
+from sqlalchemy import Integer, String, Boolean, ForeignKey, DateTime, Index, func, Text, text
 from datetime import datetime
 from app.db.session import Base
 
@@ -7,7 +7,7 @@ class Notification(Base):
     __tablename__ = "notifications"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[str] = mapped_column(String(100), ForeignKey("users.id"), index=True, nullable=False)
+    user_id: Mapped[str] = mapped_column(String(100), ForeignKey("users.id"), nullable=False)
     title: Mapped[str] = mapped_column(String(255), nullable=False)
     message: Mapped[str] = mapped_column(Text, nullable=False)
     type: Mapped[str] = mapped_column(String(50), nullable=False)
@@ -16,3 +16,11 @@ class Notification(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
     user: Mapped["User"] = relationship("User", back_populates="notifications")
+
+
+# Newest-first list, and the unread-only list / unread count
+Index("ix_notifications_user_created", Notification.user_id, Notification.created_at.desc())
+Index(
+    "ix_notifications_user_unread", Notification.user_id, Notification.created_at.desc(),
+    postgresql_where=text("NOT is_read"),
+)
@@ -128,3 +128,14 @@ class SystemHealthOut(BaseModel):
     total_messages: int
     recent_activity: Dict[str, int]
     timestamp: datetime
+
+class SlowQueryOut(BaseModel):
+    fingerprint: str
+    statement: str
+    duration_ms: float
+    parameter_shapes: Any = None
+    route: Optional[str] = None
+    method: Optional[str] = None
+    captured_at: datetime
+    explain: Optional[str] = None
+    explain_error: Optional[str] = None
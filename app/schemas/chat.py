@@ -12,6 +12,7 @@ class ChatMessageCreate(ChatMessageBase):
 
 class ChatMessageOut(ChatMessageBase):
     id: int
+    room_id: Optional[int] = None
     listing_id: int
     sender_id: str
     receiver_id: str
@@ -22,6 +23,7 @@ class ChatMessageOut(ChatMessageBase):
     message_metadata: Optional[Dict[str, Any]] = None
     reply_to_id: Optional[int] = None
     read_at: Optional[datetime] = None
+    seq: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -37,6 +39,47 @@ class ChatRoomOut(BaseModel):
     class Config:
         from_attributes = True
 
+class ChatInboxPeer(BaseModel):
+    id: str
+    full_name: Optional[str] = None
+    profile_picture: Optional[str] = None
+    online: bool = False
+    last_seen: Optional[datetime] = None
+
+class ChatInboxListing(BaseModel):
+    id: int
+    title: str
+    thumbnail: Optional[str] = None
+
+class ChatInboxLastMessage(BaseModel):
+    id: int
+    sender_id: str
+    snippet: str
+    message_type: str = "text"
+    timestamp: datetime
+
+class ChatInboxRoomOut(BaseModel):
+    id: int
+    last_message_at: datetime
+    unread_count: int = 0
+    peer: ChatInboxPeer
+    listing: ChatInboxListing
+    last_message: Optional[ChatInboxLastMessage] = None
+
+class ChatInboxOut(BaseModel):
+    rooms: List[ChatInboxRoomOut]
+    has_more: bool
+    next_before_at: Optional[datetime] = None
+    next_before_id: Optional[int] = None
+
+class PresenceStatusOut(BaseModel):
+    user_id: str
+    online: bool
+    last_seen: Optional[datetime] = None
+
+class PresenceOut(BaseModel):
+    users: List[PresenceStatusOut]
+
 class MessageReactionOut(BaseModel):
     id: int
     message_id: int
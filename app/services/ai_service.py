@@ -2,11 +2,26 @@ import asyncio
 import json
 import logging
 from typing import Dict, List, Any
+import time
 import httpx
 from app.core.config import settings
+from app.core import metrics
+from app.core.tracing import current_span, start_span
 
 logger = logging.getLogger(__name__)
 
+AI_REQUEST_DURATION = metrics.histogram(
+    "ai_request_duration_seconds",
+    "ML service call latency including retries, by endpoint and outcome",
+    ("endpoint", "outcome"),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+AI_REQUEST_RETRIES = metrics.counter(
+    "ai_request_retries_total",
+    "ML service attempts that failed and were retried, by endpoint and reason",
+    ("endpoint", "reason"),
+)
+
 class AIServiceError(Exception):
     """Custom exception for AI service errors"""
     pass
@@ -21,7 +36,22 @@ class AIService:
 
     async def _make_ml_request(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Make request to ML service"""
+        start = time.perf_counter()
+        outcome = "error"
+        with start_span("ai.request", {"ai.endpoint": endpoint}, kind="client") as span:
+            try:
+                result = await self._request_with_retries(endpoint, payload)
+                outcome = "ok"
+                return result
+            finally:
+                span.set_attribute("ai.outcome", outcome)
+                AI_REQUEST_DURATION.observe(time.perf_counter() - start, endpoint, outcome)
+
+    async def _request_with_retries(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         headers = {"Content-Type": "application/json"}
+        span = current_span()
+        if span is not None:
+            headers["traceparent"] = span.traceparent
 
         for attempt in range(self.max_retries):
             try:
@@ -38,11 +68,13 @@ class AIService:
                 logger.warning(f"ML service timeout on attempt {attempt + 1}")
                 if attempt == self.max_retries - 1:
                     raise AIServiceError("ML service timeout after all retries")
+                AI_REQUEST_RETRIES.inc(endpoint, "timeout")
 
             except httpx.HTTPStatusError as e:
                 logger.error(f"ML service HTTP error: {e.response.status_code}")
                 if e.response.status_code == 429:  # Rate limit
                     if attempt < self.max_retries - 1:
+                        AI_REQUEST_RETRIES.inc(endpoint, "rate_limited")
                         await asyncio.sleep(self.retry_delay * (2 ** attempt))
                         continue
                 raise AIServiceError(f"ML service error: {e.response.status_code}")
@@ -51,6 +83,7 @@ class AIService:
                 logger.error(f"Unexpected ML service error: {str(e)}")
                 if attempt == self.max_retries - 1:
                     raise AIServiceError(f"ML service error: {str(e)}")
+                AI_REQUEST_RETRIES.inc(endpoint, "error")
 
             await asyncio.sleep(self.retry_delay)
 
@@ -0,0 +1,310 @@
+"""
+Pub/sub backplane for realtime events (chat rooms today).
+
+Every worker keeps its own websockets. An event is published once to the backplane,
+every worker subscribed to the channel receives it, and each one hands it to its
+local listeners, so two users connected to different workers or nodes still see each
+other. Delivery is at most once: a worker that loses its backplane connection misses
+what was published until it reconnects, and clients catch up from the message history.
+
+Backends (BROADCAST_BACKEND):
+  MEMORY    single process only; the default, and what tests use
+  POSTGRES  LISTEN/NOTIFY on the main database, no extra infrastructure; behind
+            PgBouncer (DB_PGBOUNCER) BROADCAST_URL must bypass it. Events over the
+            NOTIFY limit go through the broadcast_payloads table
+  REDIS     PUBLISH/SUBSCRIBE on any Redis-protocol server (BROADCAST_URL or REDIS_URL)
+"""
+import abc
+import json
+import anyio
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+from app.core.config import settings
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+Listener = Callable[[dict], Awaitable[None]]
+
+BROADCAST_MESSAGES = metrics.counter(
+    "broadcast_messages_total",
+    "Backplane events published by this worker and received by it for local delivery",
+    ("direction",),
+)
+
+
+class Broadcast(abc.ABC):
+    """Local listener registry; subclasses move the events between workers"""
+
+    def __init__(self):
+        self._listeners: Dict[str, Set[Listener]] = {}
+
+    async def connect(self) -> None:
+        pass
+
+    async def disconnect(self) -> None:
+        pass
+
+    async def subscribe(self, channel: str, listener: Listener) -> None:
+        listeners = self._listeners.setdefault(channel, set())
+        listeners.add(listener)
+        if len(listeners) == 1:
+            await self._listen(channel)
+
+    async def unsubscribe(self, channel: str, listener: Listener) -> None:
+        listeners = self._listeners.get(channel)
+        if not listeners:
+            return
+        listeners.discard(listener)
+        if not listeners:
+            del self._listeners[channel]
+            await self._unlisten(channel)
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: dict) -> None:
+        ...
+
+    async def _listen(self, channel: str) -> None:
+        pass
+
+    async def _unlisten(self, channel: str) -> None:
+        pass
+
+    async def _deliver(self, channel: str, message: dict) -> None:
+        listeners = self._listeners.get(channel)
+        if not listeners:
+            return
+        BROADCAST_MESSAGES.inc("received")
+        results = await asyncio.gather(*(listener(message) for listener in list(listeners)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Broadcast listener on {channel} failed: {result!r}")
+
+
+class InMemoryBroadcast(Broadcast):
+    """Delivers straight to this process's listeners"""
+
+    async def publish(self, channel: str, message: dict) -> None:
+        BROADCAST_MESSAGES.inc("published")
+        await self._deliver(channel, message)
+
+
+class PostgresBroadcast(Broadcast):
+    """LISTEN/NOTIFY over asyncpg.
+
+    All events share one NOTIFY channel and carry their logical channel in the payload:
+    a worker LISTENs once instead of once per room, and drops events for channels it
+    has no local listeners for. NOTIFY payloads are limited to 8000 bytes: a larger
+    event is stored in broadcast_payloads and only its id is notified, and receivers
+    read it back before delivering it.
+    """
+
+    MAX_PAYLOAD = 7900
+
+    # Store the event and notify its id in one statement, so the row is committed
+    # when the notification arrives; rows older than a minute have been read by then
+    PUBLISH_BY_REFERENCE_SQL = """
+        WITH stored AS (INSERT INTO broadcast_payloads (payload) VALUES ($3) RETURNING id),
+             expired AS (DELETE FROM broadcast_payloads WHERE created_at < now() - interval '1 minute')
+        SELECT pg_notify($1, json_build_object('c', $2::text, 'r', id)::text) FROM stored
+    """
+
+    def __init__(self, dsn: str, pg_channel: str = "app_broadcast", reconnect_delay: float = 1.0):
+        super().__init__()
+        self.dsn = dsn
+        self.pg_channel = pg_channel
+        self.reconnect_delay = reconnect_delay
+        self._listen_conn = None
+        self._publish_pool = None
+        self._inbox: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    async def connect(self) -> None:
+        import asyncpg
+
+        self._publish_pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=2)
+        self._inbox = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._run()), loop.create_task(self._pump())]
+
+    async def disconnect(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._listen_conn is not None:
+            await self._listen_conn.close()
+            self._listen_conn = None
+        if self._publish_pool is not None:
+            await self._publish_pool.close()
+            self._publish_pool = None
+
+    async def publish(self, channel: str, message: dict) -> None:
+        payload = json.dumps({"c": channel, "m": message}, default=str, separators=(",", ":"))
+        BROADCAST_MESSAGES.inc("published")
+        if len(payload.encode()) > self.MAX_PAYLOAD:
+            await self._publish_pool.execute(self.PUBLISH_BY_REFERENCE_SQL, self.pg_channel, channel, payload)
+            return
+        await self._publish_pool.execute("SELECT pg_notify($1, $2)", self.pg_channel, payload)
+
+    def _on_notify(self, connection, pid, pg_channel, payload) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Dropping malformed broadcast payload")
+            return
+        if event.get("c") in self._listeners:
+            self._inbox.put_nowait((event["c"], event.get("m"), event.get("r")))
+
+    async def _pump(self) -> None:
+        # One event at a time, so listeners see them in NOTIFY order
+        while True:
+            channel, message, ref = await self._inbox.get()
+            if ref is not None:
+                message = await self._load(ref)
+                if message is None:
+                    continue
+            await self._deliver(channel, message)
+
+    async def _load(self, ref: int) -> Optional[dict]:
+        """The event behind a by-reference notification"""
+        try:
+            payload = await self._publish_pool.fetchval("SELECT payload FROM broadcast_payloads WHERE id = $1", ref)
+        except Exception as e:
+            logger.warning(f"Could not load broadcast payload {ref}: {e}")
+            return None
+        if payload is None:
+            logger.warning(f"Broadcast payload {ref} is gone, dropping the event")
+            return None
+        return json.loads(payload)["m"]
+
+    async def _run(self) -> None:
+        """Hold the LISTEN connection open, reconnecting whenever it drops"""
+        import asyncpg
+
+        while True:
+            lost = asyncio.Event()
+            try:
+                self._listen_conn = await asyncpg.connect(self.dsn)
+                self._listen_conn.add_termination_listener(lambda conn: lost.set())
+                await self._listen_conn.add_listener(self.pg_channel, self._on_notify)
+                logger.info(f"Broadcast listening on Postgres channel {self.pg_channel}")
+                await lost.wait()
+                logger.warning("Broadcast LISTEN connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Broadcast LISTEN connection failed: {e}")
+            await asyncio.sleep(self.reconnect_delay)
+
+
+class RedisBroadcast(Broadcast):
+    """PUBLISH/SUBSCRIBE with one Redis channel per logical channel"""
+
+    def __init__(self, url: str, prefix: str = "broadcast:", reconnect_delay: float = 1.0):
+        super().__init__()
+        self.url = url
+        self.prefix = prefix
+        self.reconnect_delay = reconnect_delay
+        self._client = None
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()  # at least one channel is listened to
+
+    async def connect(self) -> None:
+        import redis.asyncio as redis  # optional dependency, only needed for this backend
+
+        self._client = redis.from_url(self.url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def disconnect(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def publish(self, channel: str, message: dict) -> None:
+        BROADCAST_MESSAGES.inc("published")
+        await self._client.publish(self.prefix + channel, json.dumps(message, default=str, separators=(",", ":")))
+
+    async def _listen(self, channel: str) -> None:
+        await self._pubsub.subscribe(self.prefix + channel)
+        self._subscribed.set()
+
+    async def _unlisten(self, channel: str) -> None:
+        if not self._listeners:
+            self._subscribed.clear()
+        await self._pubsub.unsubscribe(self.prefix + channel)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    # Nothing to read until the first channel is subscribed
+                    await self._subscribed.wait()
+                    continue
+                # Re-subscribes to every channel by itself after a reconnect
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is None or message["type"] != "message":
+                    continue
+                channel = message["channel"].decode()[len(self.prefix):]
+                await self._deliver(channel, json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Broadcast Redis subscription failed: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+
+
+def build_broadcast() -> Broadcast:
+    """Create the backplane selected by BROADCAST_BACKEND"""
+    if settings.BROADCAST_BACKEND == "POSTGRES":
+        if settings.DB_PGBOUNCER and not settings.BROADCAST_URL:
+            # LISTEN through a transaction-mode pooler registers on whichever server
+            # connection runs it, then nothing arrives: it needs a direct connection
+            raise RuntimeError("BROADCAST_BACKEND=POSTGRES with DB_PGBOUNCER requires BROADCAST_URL (a direct Postgres URL)")
+        dsn = settings.BROADCAST_URL or settings.SQLALCHEMY_DATABASE_URI.replace("postgresql+psycopg2://", "postgresql://", 1)
+        return PostgresBroadcast(dsn)
+    if settings.BROADCAST_BACKEND == "REDIS":
+        url = settings.BROADCAST_URL or settings.REDIS_URL
+        if not url:
+            raise RuntimeError("BROADCAST_BACKEND=REDIS requires BROADCAST_URL or REDIS_URL")
+        return RedisBroadcast(url)
+    return InMemoryBroadcast()
+
+
+broadcast = build_broadcast()
+
+
+_publishing: Set[asyncio.Task] = set()
+
+
+def _published(task: asyncio.Task) -> None:
+    _publishing.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Broadcast publish failed: {task.exception()}")
+
+
+def publish_from_thread(channel: str, message: dict) -> None:
+    """publish() for sync code: in an anyio worker thread (sync endpoints), or on the
+    event loop itself (a sync Session committed in an async endpoint)"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        # Can't wait for it without blocking the loop: publish in the background
+        task = loop.create_task(broadcast.publish(channel, message))
+        _publishing.add(task)
+        task.add_done_callback(_published)
+        return
+    try:
+        anyio.from_thread.run(broadcast.publish, channel, message)
+    except RuntimeError:
+        pass  # Not in a request's worker thread (scripts, CLI): no sockets to publish to
+    except Exception as e:
+        logger.warning(f"Broadcast publish on {channel} failed: {e}")
@@ -0,0 +1,95 @@
+"""
+The chat inbox: a user's rooms, newest conversation first, with everything the list
+shows in one query - peer, listing title and thumbnail, last message snippet and the
+unread count.
+
+Rooms are paged by keyset on (last_message_at, id). The user can be either
+participant, so each side is read from its own participant index (already in
+last_message_at order) and the two are merged; an OR over both columns would have to
+sort every room of the user on each page. The last message comes from a LATERAL
+lookup on ix_chat_messages_room_id - the highest id is the newest message, since ids
+are drawn under the room lock (app.services.message_ingest) - and the unread count
+from chat_room_members, so a page costs a few index probes per room however long the
+conversations are.
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import and_, func, select, true, tuple_, union_all
+from sqlalchemy.sql import Select
+from app.models.chat import ChatMessage, ChatRoom, ChatRoomMember
+from app.models.listing import Listing
+from app.models.user import User
+
+SNIPPET_LENGTH = 140
+
+
+def _side(user_id: str, mine, peer, before: Optional[Tuple[datetime, int]], limit: int) -> Select:
+    query = select(
+        ChatRoom.id, ChatRoom.listing_id, ChatRoom.last_message_at, peer.label("peer_id"),
+    ).where(mine == user_id, ChatRoom.last_message_at.is_not(None))
+    if before is not None:
+        query = query.where(tuple_(ChatRoom.last_message_at, ChatRoom.id) < tuple_(*before))
+    return query.order_by(ChatRoom.last_message_at.desc(), ChatRoom.id.desc()).limit(limit)
+
+
+def inbox_query(user_id: str, limit: int, before: Optional[Tuple[datetime, int]] = None) -> Select:
+    """One page of the inbox: up to `limit` rooms older than the `before` cursor.
+
+    Rooms without messages yet are left out; they are not conversations until the
+    first message.
+    """
+    rooms = union_all(
+        _side(user_id, ChatRoom.participant1_id, ChatRoom.participant2_id, before, limit),
+        # A room with oneself is already on the first side
+        _side(user_id, ChatRoom.participant2_id, ChatRoom.participant1_id, before, limit)
+        .where(ChatRoom.participant1_id != user_id),
+    ).subquery("rooms")
+
+    last_message = (
+        select(
+            ChatMessage.id, ChatMessage.sender_id, ChatMessage.message_type, ChatMessage.timestamp,
+            func.left(ChatMessage.content, SNIPPET_LENGTH).label("snippet"),
+        )
+        .where(ChatMessage.room_id == rooms.c.id, ChatMessage.deleted == False)  # noqa: E712
+        .order_by(ChatMessage.id.desc())
+        .limit(1)
+        .lateral("last_message")
+    )
+
+    return (
+        select(
+            rooms.c.id, rooms.c.last_message_at,
+            func.coalesce(ChatRoomMember.unread_count, 0).label("unread_count"),
+            User.id.label("peer_id"), User.full_name.label("peer_name"), User.profile_picture.label("peer_picture"),
+            Listing.id.label("listing_id"), Listing.title.label("listing_title"),
+            Listing.images[0].as_string().label("listing_thumbnail"),
+            last_message.c.id.label("last_message_id"), last_message.c.sender_id.label("last_message_sender_id"),
+            last_message.c.snippet.label("last_message_snippet"), last_message.c.message_type.label("last_message_type"),
+            last_message.c.timestamp.label("last_message_timestamp"),
+        )
+        .select_from(rooms)
+        .join(User, User.id == rooms.c.peer_id)
+        .join(Listing, Listing.id == rooms.c.listing_id)
+        .outerjoin(ChatRoomMember, and_(ChatRoomMember.room_id == rooms.c.id, ChatRoomMember.user_id == user_id))
+        .outerjoin(last_message, true())
+        .order_by(rooms.c.last_message_at.desc(), rooms.c.id.desc())
+        .limit(limit)
+    )
+
+
+def inbox_entry(row) -> dict:
+    """Shape one inbox_query row as a ChatInboxRoomOut"""
+    return {
+        "id": row.id,
+        "last_message_at": row.last_message_at,
+        "unread_count": row.unread_count,
+        "peer": {"id": row.peer_id, "full_name": row.peer_name, "profile_picture": row.peer_picture},
+        "listing": {"id": row.listing_id, "title": row.listing_title, "thumbnail": row.listing_thumbnail},
+        "last_message": None if row.last_message_id is None else {
+            "id": row.last_message_id,
+            "sender_id": row.last_message_sender_id,
+            "snippet": row.last_message_snippet,
+            "message_type": row.last_message_type,
+            "timestamp": row.last_message_timestamp,
+        },
+    }
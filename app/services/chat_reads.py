@@ -0,0 +1,82 @@
+"""
+Read receipts as a watermark per room and participant.
+
+Reading marks everything up to a message id in one statement, and the unread count
+in chat_room_members moves with it: new messages add to the receiver's count, the
+messages a read actually flips subtract from it. Badges are then a primary-key (or
+user_id index) read instead of a COUNT over chat_messages.
+
+A watermark is only meaningful because ids grow within a room in the order messages
+are sent, whichever path stores them (see app.services.message_ingest).
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import Integer, bindparam, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# Marks the receiver's unread messages up to the watermark and takes exactly those
+# off the count; the watermark never moves back (scrolling up re-reads old pages), nor
+# past the room's newest stored message - a receipt for an id that doesn't exist yet
+# would otherwise swallow every message up to it
+MARK_READ_SQL = text("""
+    WITH target AS (
+        SELECT LEAST(:up_to, COALESCE((SELECT MAX(id) FROM chat_messages WHERE room_id = :room_id), 0)) AS up_to
+    ), marked AS (
+        UPDATE chat_messages SET read_at = now()
+        WHERE room_id = :room_id AND receiver_id = :user_id AND id <= (SELECT up_to FROM target) AND read_at IS NULL
+        RETURNING 1
+    )
+    INSERT INTO chat_room_members AS m (room_id, user_id, last_read_message_id, unread_count)
+    VALUES (:room_id, :user_id, (SELECT up_to FROM target), 0)
+    ON CONFLICT (room_id, user_id) DO UPDATE SET
+        last_read_message_id = GREATEST(m.last_read_message_id, EXCLUDED.last_read_message_id),
+        unread_count = GREATEST(m.unread_count - (SELECT COUNT(*) FROM marked), 0)
+""")
+
+# Counts new messages as unread for their receiver. Messages already under the
+# receiver's watermark are stored as read and not counted (MARK_READ_SQL keeps the
+# watermark at stored messages, so this is a guard rather than the common case).
+ADD_UNREAD_SQL = text("""
+    WITH seen AS (
+        UPDATE chat_messages SET read_at = now()
+        WHERE id = ANY(:ids) AND read_at IS NULL AND id <= COALESCE((
+            SELECT last_read_message_id FROM chat_room_members WHERE room_id = :room_id AND user_id = :user_id
+        ), 0)
+        RETURNING 1
+    )
+    INSERT INTO chat_room_members AS m (room_id, user_id, unread_count)
+    VALUES (:room_id, :user_id, cardinality(:ids) - (SELECT COUNT(*) FROM seen))
+    ON CONFLICT (room_id, user_id) DO UPDATE SET unread_count = m.unread_count + EXCLUDED.unread_count
+""").bindparams(bindparam("ids", type_=ARRAY(Integer)))
+
+UNREAD_SQL = text("SELECT room_id, unread_count FROM chat_room_members WHERE user_id = :user_id AND unread_count > 0")
+
+
+def unread_additions(rows: Iterable[dict]) -> List[dict]:
+    """ADD_UNREAD_SQL parameters for newly inserted messages, one set per room and receiver"""
+    ids: Dict[Tuple[int, str], List[int]] = defaultdict(list)
+    for row in rows:
+        ids[(row["room_id"], row["receiver_id"])].append(row["id"])
+    return [{"room_id": room_id, "user_id": user_id, "ids": message_ids} for (room_id, user_id), message_ids in ids.items()]
+
+
+async def mark_read(db: AsyncSession, room_id: int, user_id: str, up_to: int) -> None:
+    """Mark the user's messages in the room read up to message id `up_to` (caller commits)"""
+    await db.execute(MARK_READ_SQL, {"room_id": room_id, "user_id": user_id, "up_to": up_to})
+
+
+async def add_unread(db: AsyncSession, rows: Iterable[dict]) -> None:
+    for params in unread_additions(rows):
+        await db.execute(ADD_UNREAD_SQL, params)
+
+
+def add_unread_sync(db: Session, rows: Iterable[dict]) -> None:
+    for params in unread_additions(rows):
+        db.execute(ADD_UNREAD_SQL, params)
+
+
+async def unread_counts(db: AsyncSession, user_id: str) -> Dict[int, int]:
+    """Unread messages per room for the user's badges"""
+    return {room_id: count for room_id, count in (await db.execute(UNREAD_SQL, {"user_id": user_id})).all()}
@@ -0,0 +1,103 @@
+"""
+Resuming a chat room after a reconnect.
+
+Events that change a room's history - new messages, edits, deletes, reactions - take
+the room's next sequence number (chat_rooms.last_seq) and carry it as "seq". A client
+that reconnects with the last seq it processed as resume_from gets what it missed:
+
+  memory    from this worker's ring buffer of recent events per room, when it holds
+            every seq since resume_from. It only sees rooms with a local socket and the
+            backplane is at most once, so it is checked for gaps rather than trusted.
+  database  otherwise, the current state of every message changed since then
+            (chat_messages.seq is the seq of the last event that touched the message)
+  reload    more than CHAT_REPLAY_DB_LIMIT messages changed: refetch the history instead
+
+Every seq is taken in the transaction that stores its event (new messages get theirs
+in their write-behind batch), so the database never lags chat_rooms.last_seq.
+
+Replayed frames look like the live ones. The socket is subscribed before the replay is
+read, so live events can overlap it: clients dedupe by seq and upsert messages by id.
+"""
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core import metrics
+from app.models.chat import ChatMessage, ChatRoom, MessageReaction
+from app.schemas.chat import ChatMessageOut
+
+REPLAYS = metrics.counter(
+    "chat_replays_total",
+    "Room resumes after a reconnect, by where the missed events came from",
+    ("source",),
+)
+
+
+class ReplayBuffer:
+    """The last events of each recently active room, as (seq, frame)"""
+
+    def __init__(self, events_per_room: int, max_rooms: int):
+        self.events_per_room = events_per_room
+        self.max_rooms = max_rooms
+        self._rooms: "OrderedDict[int, Deque[Tuple[int, dict]]]" = OrderedDict()
+
+    def record(self, room: int, seq: int, frame: dict) -> None:
+        events = self._rooms.get(room)
+        if events is None:
+            events = self._rooms[room] = deque(maxlen=self.events_per_room)
+            if len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room)
+        events.append((seq, frame))
+
+    def since(self, room: int, after: int, latest: int) -> Optional[List[dict]]:
+        """Frames for seqs after+1..latest in order, or None unless every one is held"""
+        if latest <= after:
+            return []
+        if latest - after > self.events_per_room:
+            return None
+        events = dict(self._rooms.get(room, ()))
+        missed = range(after + 1, latest + 1)
+        if any(seq not in events for seq in missed):
+            return None
+        return [events[seq] for seq in missed]
+
+
+async def replay(db: AsyncSession, room: int, after: int) -> Tuple[str, List[dict], int]:
+    """(source, frames, seq the frames bring it up to) for a client that has processed up to `after`"""
+    latest = await db.scalar(select(ChatRoom.last_seq).where(ChatRoom.id == room)) or 0
+    frames = replay_buffer.since(room, after, latest)
+    if frames is not None:
+        REPLAYS.inc("memory")
+        return "memory", frames, latest
+
+    messages = (await db.scalars(
+        select(ChatMessage).where(ChatMessage.room_id == room, ChatMessage.seq > after)
+        .order_by(ChatMessage.seq).limit(settings.CHAT_REPLAY_DB_LIMIT + 1)
+    )).all()
+    if len(messages) > settings.CHAT_REPLAY_DB_LIMIT:
+        REPLAYS.inc("reload")
+        return "reload", [], latest
+
+    reactions = {}
+    if messages:
+        for reaction in await db.scalars(
+            select(MessageReaction).where(MessageReaction.message_id.in_([msg.id for msg in messages]))
+        ):
+            reactions.setdefault(reaction.message_id, []).append({"user_id": reaction.user_id, "reaction": reaction.reaction})
+
+    frames = []
+    for msg in messages:
+        if msg.deleted:
+            frames.append({"delete_message": msg.id, "seq": msg.seq})
+        else:
+            frame = ChatMessageOut.model_validate(msg).model_dump(mode="json")
+            frame["reactions"] = reactions.get(msg.id, [])
+            frames.append(frame)
+    REPLAYS.inc("database")
+    return "database", frames, latest
+
+
+replay_buffer = ReplayBuffer(settings.CHAT_REPLAY_EVENTS_PER_ROOM, settings.CHAT_REPLAY_ROOMS)
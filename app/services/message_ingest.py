@@ -0,0 +1,216 @@
+"""
+Write-behind persistence for chat messages.
+
+Senders don't wait for the database: a message is timestamped and queued, and written
+with the others of its batch every CHAT_INGEST_FLUSH_MS or as soon as
+CHAT_INGEST_BATCH_SIZE messages are waiting. A batch is one transaction: per room one
+UPDATE of chat_rooms that takes the batch's seqs, draws its message ids and moves
+last_message_at forward, then one multi-row INSERT and the receivers' unread counts,
+and a single COMMIT. Numbering under the room row lock keeps seqs and ids in send
+order within a room across workers, and the commit rate is per batch, not per message.
+
+Once the batch has committed its rows are handed to the listeners (the chat router
+broadcasts them) and the futures returned by submit() resolve with them; that is the
+sender's durable ack. A message is broadcast, acked and visible in the history
+endpoints together, a few milliseconds after it was sent. Per worker.
+"""
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import insert, text
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.core.config import settings
+from app.core import metrics
+from app.db.session import AsyncSessionLocal
+from app.services import chat_reads
+from app.models.chat import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# The room's next `n` seqs and `n` message ids, both taken while the room row is locked
+NUMBER_MESSAGES_SQL = text("""
+    UPDATE chat_rooms SET last_seq = last_seq + :n, last_message_at = GREATEST(last_message_at, :at)
+    WHERE id = :room_id
+    RETURNING last_seq,
+              ARRAY(SELECT nextval(pg_get_serial_sequence('chat_messages', 'id')) FROM generate_series(1, :n))
+""")
+
+Listener = Callable[[List[dict]], Awaitable[None]]
+
+INGEST_BATCH_SIZE = metrics.histogram(
+    "chat_ingest_batch_messages",
+    "Messages written per write-behind flush",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500, 1000),
+)
+INGEST_FLUSH = metrics.histogram(
+    "chat_ingest_flush_seconds",
+    "Time to write and commit one batch of chat messages, by outcome",
+    ("outcome",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+class MessageIngestor:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        batch_size: int,
+        flush_interval: float,
+        max_pending: int,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()  # something is pending
+        self._full = asyncio.Event()  # a whole batch is pending; don't wait for the interval
+        self._drained = asyncio.Event()  # a flush took a batch off the queue
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Future] = None
+        self._listeners: List[Listener] = []
+
+    def add_listener(self, listener: Listener) -> None:
+        """Awaited with the rows of every committed batch, in seq order within a room"""
+        self._listeners.append(listener)
+
+    async def submit(self, data: dict) -> asyncio.Future:
+        """Timestamp and queue a message.
+
+        Returns a future that resolves with the complete row, id and seq included, once
+        it is committed, or raises if it could not be written.
+        """
+        while len(self._pending) >= self.max_pending:
+            # Backpressure: wait for a flush to make room instead of growing without bound;
+            # other senders may take it first, so check again
+            self._drained.clear()
+            await self._drained.wait()
+        row = {
+            "reply_to_id": None,
+            "message_type": "text",
+            "message_metadata": None,
+            **data,
+            "timestamp": datetime.now(timezone.utc),
+            "edited": False,
+            "deleted": False,
+            "read_at": None,
+        }
+        saved = asyncio.get_running_loop().create_future()
+        self._pending.append((row, saved))
+        self._wakeup.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        return saved
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write whatever is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._flushing is not None:
+            await asyncio.wait({self._flushing})
+        while self._pending:
+            await self._flush()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if not self._full.is_set():
+                # Let the batch fill up for one interval
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            # Shielded: cancelling the loop on shutdown must not drop a batch mid-write
+            self._flushing = asyncio.ensure_future(self._flush())
+            try:
+                await asyncio.shield(self._flushing)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Chat message flush failed")
+
+    async def _flush(self) -> None:
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        self._drained.set()
+        if len(self._pending) < self.batch_size:
+            self._full.clear()
+        if not self._pending:
+            self._wakeup.clear()
+        if not batch:
+            return
+
+        INGEST_BATCH_SIZE.observe(len(batch))
+        start = time.perf_counter()
+        try:
+            await self._write([row for row, _ in batch])
+        except (IntegrityError, DataError) as e:
+            INGEST_FLUSH.observe(time.perf_counter() - start, "error")
+            # One bad row (e.g. a reply_to_id that doesn't exist) fails the whole INSERT:
+            # write the rows one by one so only the bad ones are rejected
+            logger.warning(f"Chat batch of {len(batch)} failed ({e}), retrying row by row")
+            for row, saved in batch:
+                try:
+                    await self._write([row])
+                except Exception as row_error:
+                    if not saved.done():
+                        saved.set_exception(row_error)
+                else:
+                    await self._saved([(row, saved)])
+            return
+        except Exception as e:
+            INGEST_FLUSH.observe(time.perf_counter() - start, "error")
+            # The database failed, not the data: a retry per row would only add load
+            logger.error(f"Chat batch of {len(batch)} could not be written: {e}")
+            for _, saved in batch:
+                if not saved.done():
+                    saved.set_exception(e)
+            return
+
+        INGEST_FLUSH.observe(time.perf_counter() - start, "ok")
+        await self._saved(batch)
+
+    async def _saved(self, batch: List[Tuple[dict, asyncio.Future]]) -> None:
+        rows = [row for row, _ in batch]
+        for listener in self._listeners:
+            try:
+                await listener(rows)
+            except Exception as e:
+                logger.warning(f"Chat ingest listener failed: {e!r}")
+        for row, saved in batch:
+            if not saved.done():
+                saved.set_result(row)
+
+    async def _write(self, rows: List[dict]) -> None:
+        by_room: Dict[int, List[dict]] = {}
+        for row in rows:
+            by_room.setdefault(row["room_id"], []).append(row)
+
+        async with self.session_factory() as db:
+            # Rooms in id order, so two workers' batches lock them in the same order
+            for room_id in sorted(by_room):
+                room_rows = by_room[room_id]
+                last_seq, ids = (await db.execute(NUMBER_MESSAGES_SQL, {
+                    "room_id": room_id, "n": len(room_rows), "at": max(row["timestamp"] for row in room_rows),
+                })).one()
+                # Numbered again if the batch is retried row by row
+                for seq, message_id, row in zip(range(last_seq - len(room_rows) + 1, last_seq + 1), sorted(ids), room_rows):
+                    row["seq"], row["id"] = seq, message_id
+            await db.execute(insert(ChatMessage), rows)
+            await chat_reads.add_unread(db, rows)
+            await db.commit()
+
+
+message_ingestor = MessageIngestor(
+    AsyncSessionLocal,
+    batch_size=settings.CHAT_INGEST_BATCH_SIZE,
+    flush_interval=settings.CHAT_INGEST_FLUSH_MS / 1000,
+    max_pending=settings.CHAT_INGEST_MAX_PENDING,
+)
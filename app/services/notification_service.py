@@ -1,11 +1,56 @@
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from app.models.notification import Notification
 from app.models.user import User
+from app.services.broadcast import publish_from_thread
 from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Notifications added to a session, and their payloads once flushed; pushed on commit
+_PENDING_PUSH = "notifications_to_push"
+_FLUSHED_PUSH = "notification_payloads_to_push"
+
+
+def user_channel(user_id: str) -> str:
+    """Backplane channel of a user's per-user websocket (notifications)"""
+    return f"user:{user_id}"
+
+
+@event.listens_for(Session, "after_flush")
+def _snapshot_pushes(session, flush_context) -> None:
+    # After commit the rows are expired and the session can't load them, so take the
+    # payload as soon as the INSERT has given the notification its id
+    pending = session.info.get(_PENDING_PUSH)
+    if not pending:
+        return
+    flushed = session.info.setdefault(_FLUSHED_PUSH, [])
+    for notification in [n for n in pending if n.id is not None]:
+        pending.remove(notification)
+        state = notification.__dict__
+        created_at = state.get("created_at")
+        flushed.append((notification.user_id, {
+            "id": notification.id,
+            "title": state.get("title"),
+            "message": state.get("message"),
+            "type": state.get("type"),
+            "related_id": state.get("related_id"),
+            "created_at": created_at.isoformat() if created_at is not None else None,
+        }))
+
+
+@event.listens_for(Session, "after_commit")
+def _push_committed(session) -> None:
+    for user_id, payload in session.info.pop(_FLUSHED_PUSH, []):
+        publish_from_thread(user_channel(user_id), {"data": {"notification": payload}})
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_pushes(session, previous_transaction) -> None:
+    session.info.pop(_PENDING_PUSH, None)
+    session.info.pop(_FLUSHED_PUSH, None)
+
 class NotificationService:
     @staticmethod
     def create_notification(
@@ -14,19 +59,29 @@ class NotificationService:
         title: str,
         message: str,
         notification_type: str,
-        related_id: Optional[int] = None
+        related_id: Optional[int] = None,
+        commit: bool = True
     ) -> Notification:
-        """Create a new notification for a user"""
+        """Create a new notification for a user.
+
+        With commit=False the notification is only added to the session, to be written
+        with the caller's transaction (see app.db.uow.UnitOfWork). Either way it is
+        pushed to the user's per-user websockets once committed.
+        """
+        notification = Notification(
+            user_id=user_id,
+            title=title,
+            message=message,
+            type=notification_type,
+            related_id=related_id
+        )
+        db.info.setdefault(_PENDING_PUSH, []).append(notification)
+        if not commit:
+            db.add(notification)
+            return notification
         try:
             logger.info(f"Creating notification for user {user_id}: {title}")
             
-            notification = Notification(
-                user_id=user_id,
-                title=title,
-                message=message,
-                type=notification_type,
-                related_id=related_id
-            )
             db.add(notification)
             db.commit()
             db.refresh(notification)
@@ -39,7 +94,7 @@ class NotificationService:
             raise
 
     @staticmethod
-    def notify_listing_created(db: Session, listing, owner_id: str):
+    def notify_listing_created(db: Session, listing, owner_id: str, commit: bool = True):
         """Notify when a new listing is created"""
         return NotificationService.create_notification(
             db=db,
@@ -47,11 +102,12 @@ class NotificationService:
             title="Listing Created Successfully",
             message=f"Your listing '{listing.title}' has been created and is now live!",
             notification_type="listing_created",
-            related_id=listing.id
+            related_id=listing.id,
+            commit=commit
         )
     
     @staticmethod
-    def notify_listing_updated(db: Session, listing, owner_id: str):
+    def notify_listing_updated(db: Session, listing, owner_id: str, commit: bool = True):
         """Notify when a listing is updated"""
         return NotificationService.create_notification(
             db=db,
@@ -59,11 +115,12 @@ class NotificationService:
             title="Listing Updated",
             message=f"Your listing '{listing.title}' has been updated successfully!",
             notification_type="listing_updated",
-            related_id=listing.id
+            related_id=listing.id,
+            commit=commit
         )
     
     @staticmethod
-    def notify_new_favorite(db: Session, listing, favorited_by_user_id: str):
+    def notify_new_favorite(db: Session, listing, favorited_by_user_id: str, commit: bool = True):
         """Notify listing owner when someone favorites their listing"""
         return NotificationService.create_notification(
             db=db,
@@ -71,11 +128,12 @@ class NotificationService:
             title="Someone Liked Your Listing!",
             message=f"A user has added your listing '{listing.title}' to their favorites!",
             notification_type="new_favorite",
-            related_id=listing.id
+            related_id=listing.id,
+            commit=commit
         )
     
     @staticmethod
-    def notify_verification_status(db: Session, user_id: str, status: str):
+    def notify_verification_status(db: Session, user_id: str, status: str, commit: bool = True):
         """Notify user about verification status change"""
         if status == "APPROVED":
             title = "Account Verified!"
@@ -93,11 +151,12 @@ class NotificationService:
             title=title,
             message=message,
             notification_type="verification_status",
-            related_id=None
+            related_id=None,
+            commit=commit
         )
 
     @staticmethod
-    def notify_report_reviewed(db: Session, reporter_id: str, report_id: int, status: str, audit_log: str = None):
+    def notify_report_reviewed(db: Session, reporter_id: str, report_id: int, status: str, audit_log: str = None, commit: bool = True):
         """Notify reporter when their report has been reviewed by admin"""
         logger.info(f"Sending report review notification to user {reporter_id} for report {report_id} with status {status}")
         
@@ -120,5 +179,6 @@ class NotificationService:
             title=title,
             message=message,
             notification_type="report_reviewed",
-            related_id=report_id
+            related_id=report_id,
+            commit=commit
         )
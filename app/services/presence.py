@@ -0,0 +1,190 @@
+"""
+Who is online, and when everyone else was last seen.
+
+Each worker counts its own sockets per user. When a user's first socket on a worker
+opens, or its last one closes, the worker publishes the change on the backplane's
+"presence" channel; every worker (itself included) applies it to the same registry:
+user -> workers holding a socket, and user -> last seen. A user is online while any
+worker holds a socket for them. The registry is plain dicts of ids and timestamps.
+
+Workers also publish a heartbeat. A worker that misses PRESENCE_WORKER_TIMEOUT worth of
+them is presumed dead and its users go offline, last seen at its last heartbeat. A
+worker that starts asks the others to announce their online users again; last-seen
+times from before it started are not replayed, so it reports them as unknown until
+the user's next change. A heartbeat from a worker the registry doesn't know (it was
+presumed dead but was only slow, or its announcements were lost) asks that worker to
+announce again. Last-seen entries older than PRESENCE_LAST_SEEN_TTL are pruned.
+"""
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from app.core.config import settings
+from app.core import metrics
+from app.services.broadcast import Broadcast, broadcast
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_CHANNEL = "presence"
+ANNOUNCE_CHUNK = 100  # user ids per event, well under the NOTIFY payload limit
+
+Listener = Callable[[str, dict], None]
+
+
+class Presence:
+    def __init__(self, backplane: Broadcast, heartbeat_interval: float, worker_timeout: float, last_seen_ttl: float):
+        self.backplane = backplane
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_timeout = worker_timeout
+        self.last_seen_ttl = last_seen_ttl
+        self.worker_id = uuid.uuid4().hex
+        self._local: Dict[str, int] = {}  # user -> sockets on this worker
+        self._online: Dict[str, Set[str]] = {}  # user -> workers with a socket
+        self._last_seen: Dict[str, float] = {}  # user -> when their last socket closed
+        self._workers: Dict[str, float] = {}  # worker -> last heartbeat
+        self._listeners: List[Listener] = []
+        self._task: Optional[asyncio.Task] = None
+        self._announced_at = 0.0
+
+    def add_listener(self, listener: Listener) -> None:
+        """Called with (user_id, status) whenever a user goes online or offline"""
+        self._listeners.append(listener)
+
+    async def start(self) -> None:
+        await self.backplane.subscribe(PRESENCE_CHANNEL, self._on_event)
+        await self._publish({"hello": self.worker_id})
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self._publish({"bye": self.worker_id, "at": time.time()})
+        except Exception as e:
+            logger.warning(f"Presence goodbye failed: {e}")
+        await self.backplane.unsubscribe(PRESENCE_CHANNEL, self._on_event)
+
+    async def connected(self, user_id: str) -> None:
+        self._local[user_id] = self._local.get(user_id, 0) + 1
+        if self._local[user_id] == 1:
+            await self._publish({"w": self.worker_id, "on": [user_id]})
+
+    async def disconnected(self, user_id: str) -> None:
+        count = self._local.get(user_id, 0) - 1
+        if count > 0:
+            self._local[user_id] = count
+            return
+        self._local.pop(user_id, None)
+        await self._publish({"w": self.worker_id, "off": [user_id], "at": time.time()})
+
+    def status(self, user_id: str) -> dict:
+        online = bool(self._online.get(user_id))
+        last_seen = None if online else self._last_seen.get(user_id)
+        return {
+            "user_id": user_id,
+            "online": online,
+            "last_seen": datetime.fromtimestamp(last_seen, timezone.utc) if last_seen is not None else None,
+        }
+
+    def lookup(self, user_ids: Iterable[str]) -> Dict[str, dict]:
+        """Bulk status, straight from memory"""
+        return {user_id: self.status(user_id) for user_id in user_ids}
+
+    def online_count(self) -> int:
+        return len(self._online)
+
+    async def _publish(self, message: dict) -> None:
+        await self.backplane.publish(PRESENCE_CHANNEL, {"data": message})
+
+    async def _on_event(self, event: dict) -> None:
+        data = event["data"]
+        now = time.time()
+        if "w" in data:
+            self._workers[data["w"]] = now
+            for user_id in data.get("on", ()):
+                self._set_online(user_id, data["w"])
+            for user_id in data.get("off", ()):
+                self._set_offline(user_id, data["w"], data.get("at", now))
+        elif "beat" in data:
+            if data["beat"] not in self._workers and data["beat"] != self.worker_id:
+                # Dropped for missed heartbeats: its users went offline here
+                await self._publish({"resend": data["beat"]})
+            self._workers[data["beat"]] = now
+        elif "resend" in data:
+            # Every other worker asks; answer once per heartbeat
+            if data["resend"] == self.worker_id and now - self._announced_at > self.heartbeat_interval:
+                await self._announce()
+        elif "hello" in data:
+            self._workers[data["hello"]] = now
+            if data["hello"] != self.worker_id:
+                await self._announce()
+        elif "bye" in data:
+            self._drop_worker(data["bye"], data.get("at", now))
+
+    def _set_online(self, user_id: str, worker: str) -> None:
+        workers = self._online.setdefault(user_id, set())
+        was_online = bool(workers)
+        workers.add(worker)
+        if not was_online:
+            self._changed(user_id)
+
+    def _set_offline(self, user_id: str, worker: str, at: float) -> None:
+        workers = self._online.get(user_id)
+        if not workers or worker not in workers:
+            return
+        workers.discard(worker)
+        if not workers:
+            del self._online[user_id]
+            self._last_seen[user_id] = at
+            self._changed(user_id)
+
+    def _drop_worker(self, worker: str, at: float) -> None:
+        self._workers.pop(worker, None)
+        for user_id in [user_id for user_id, workers in self._online.items() if worker in workers]:
+            self._set_offline(user_id, worker, at)
+
+    def _changed(self, user_id: str) -> None:
+        status = self.status(user_id)
+        for listener in self._listeners:
+            try:
+                listener(user_id, status)
+            except Exception as e:
+                logger.warning(f"Presence listener failed: {e!r}")
+
+    async def _announce(self) -> None:
+        # A new worker is listening, or one lost track of us: tell it who is online here
+        self._announced_at = time.time()
+        users = list(self._local)
+        for i in range(0, len(users), ANNOUNCE_CHUNK):
+            await self._publish({"w": self.worker_id, "on": users[i:i + ANNOUNCE_CHUNK]})
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._publish({"beat": self.worker_id})
+                now = time.time()
+                for worker, beat in list(self._workers.items()):
+                    if worker != self.worker_id and now - beat > self.worker_timeout:
+                        logger.warning(f"Presence: worker {worker} stopped sending heartbeats")
+                        self._drop_worker(worker, beat)
+                for user_id, seen in list(self._last_seen.items()):
+                    if now - seen > self.last_seen_ttl:
+                        del self._last_seen[user_id]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Presence heartbeat failed: {e}")
+
+
+presence = Presence(
+    broadcast,
+    heartbeat_interval=settings.PRESENCE_HEARTBEAT_INTERVAL,
+    worker_timeout=settings.PRESENCE_WORKER_TIMEOUT,
+    last_seen_ttl=settings.PRESENCE_LAST_SEEN_TTL,
+)
+
+metrics.gauge_func("presence_online_users", "Users with an open websocket on any worker", presence.online_count)
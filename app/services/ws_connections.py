@@ -0,0 +1,310 @@
+"""
+Outbound side of this worker's websockets.
+
+Every socket gets a bounded queue of encoded frames and its own writer task. Nothing
+that produces events (a sender's receive loop, the broadcast pump, a durable ack)
+awaits a client: it enqueues and moves on, so a slow or stalled client only ever
+holds up itself. A broadcast is encoded once and the same text frame is queued for
+every local socket of the channel.
+
+A connection can be in several channels: the per-user socket (multiplexed=True) joins
+its user channel and each room it subscribes to. Room events reach it tagged with the
+room id, so it gets its own encoding of the event - still once per event, not per socket.
+
+A client that lets its queue fill up is a slow consumer, handled by
+WS_SLOW_CONSUMER_POLICY:
+  CLOSE  close it with 1013 (try again later); it reconnects and catches up from
+         the message history. The default: the client knows it missed something.
+  DROP   discard its oldest queued frame to make room for the new one
+A socket whose send fails or takes longer than WS_SEND_TIMEOUT is reaped: its writer
+stops, it is taken out of the fan-out and closed.
+
+Every WS_PING_INTERVAL each per-user socket is sent {"ping": <unix time>}. Clients
+answer with {"pong": ...} (any frame counts); one that has sent nothing for
+WS_IDLE_TIMEOUT is closed with 1001, so half-open connections don't linger until a
+send fails. Per-room sockets keep their old protocol, without pings: their half-open
+connections are closed by websocket protocol pings (uvicorn --ws-ping-interval and
+--ws-ping-timeout), which clients answer without any code.
+"""
+import json
+import time
+import uuid
+import asyncio
+import logging
+from functools import partial
+from typing import Dict, Optional, Set
+from fastapi import WebSocket, status
+from app.core.config import settings
+from app.core import metrics
+from app.services.broadcast import Broadcast, broadcast
+from app.services.chat_replay import ReplayBuffer, replay_buffer
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMERS = metrics.counter(
+    "chat_ws_slow_consumers_total",
+    "Frames that found a websocket's send queue full, by the action taken",
+    ("action",),
+)
+SOCKETS_REAPED = metrics.counter(
+    "chat_ws_reaped_total",
+    "Websockets closed by the server: sending failed or timed out, or the client went idle",
+    ("reason",),
+)
+
+
+def encode(data: dict) -> str:
+    # What WebSocket.send_json would send
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class Connection:
+    """One websocket's outbound queue and the task writing it to the socket"""
+
+    def __init__(self, manager: "ConnectionManager", websocket: WebSocket, multiplexed: bool):
+        self.id = uuid.uuid4().hex
+        self.manager = manager
+        self.websocket = websocket
+        self.multiplexed = multiplexed
+        self.channels: Set[str] = set()
+        self.watching: Set[str] = set()  # users whose presence changes it receives
+        self.last_seen = time.monotonic()
+        self.queue: asyncio.Queue = asyncio.Queue(manager.queue_size)
+        self.closed = False
+        self._writer = asyncio.get_running_loop().create_task(self._write())
+
+    def touch(self) -> None:
+        """The client sent a frame: it is still there"""
+        self.last_seen = time.monotonic()
+
+    def send_json(self, data: dict) -> None:
+        self.send_text(encode(data))
+
+    def send_text(self, text: str) -> None:
+        """Queue a frame; never waits for the client"""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            if self.manager.slow_consumer_policy == "DROP":
+                SLOW_CONSUMERS.inc("dropped")
+                self.queue.get_nowait()
+                self.queue.put_nowait(text)
+            else:
+                SLOW_CONSUMERS.inc("closed")
+                logger.warning(f"Closing slow websocket consumer {self.id} ({self.queue.qsize()} frames queued)")
+                self.abort(status.WS_1013_TRY_AGAIN_LATER)
+
+    async def _write(self) -> None:
+        while True:
+            text = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), self.manager.send_timeout)
+            except asyncio.TimeoutError:
+                SOCKETS_REAPED.inc("send_timeout")
+                self.abort(status.WS_1013_TRY_AGAIN_LATER)
+                return
+            except Exception as e:
+                # Disconnected under us; the receive loop sees it too and unregisters
+                SOCKETS_REAPED.inc("send_error")
+                logger.info(f"Websocket send to {self.id} failed: {e!r}")
+                self.abort(None)
+                return
+
+    def abort(self, code: Optional[int]) -> None:
+        """Stop sending, leave the fan-out, and close the socket (with `code`, if given)"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        for channel in self.channels:
+            self.manager.channels.get(channel, set()).discard(self)
+        for user_id in self.watching:
+            self.manager._unwatch(self, user_id)
+        if code is not None:
+            # Closing makes the receive loop end, which unregisters the connection
+            self.manager._spawn(self._close(code))
+
+    async def _close(self, code: int) -> None:
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), self.manager.send_timeout)
+        except Exception:
+            pass  # Already gone
+
+
+class ConnectionManager:
+    """This worker's sockets by channel, subscribed to the backplane once per channel.
+
+    Room events are published as {"room": <room id>, "data": ..., "exclude": <connection id>}
+    and other events as {"data": ...}. Room events with a "seq" are also kept in
+    `history` for clients resuming the room.
+    """
+
+    def __init__(
+        self,
+        backplane: Broadcast,
+        queue_size: int,
+        send_timeout: float,
+        slow_consumer_policy: str,
+        ping_interval: float,
+        idle_timeout: float,
+        history: Optional[ReplayBuffer] = None,
+    ):
+        self.backplane = backplane
+        self.history = history
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_consumer_policy = slow_consumer_policy
+        self.connections: Set[Connection] = set()
+        self.channels: Dict[str, Set[Connection]] = {}
+        self._listeners: Dict[str, partial] = {}
+        self.watchers: Dict[str, Set[Connection]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+
+    def stop(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    def connect(self, websocket: WebSocket, multiplexed: bool = False) -> Connection:
+        """Register an accepted websocket; it receives nothing until it joins a channel"""
+        conn = Connection(self, websocket, multiplexed)
+        self.connections.add(conn)
+        return conn
+
+    async def join(self, conn: Connection, channel: str) -> None:
+        if conn.closed or channel in conn.channels:
+            return
+        conn.channels.add(channel)
+        self.channels.setdefault(channel, set()).add(conn)
+        if channel not in self._listeners:
+            self._listeners[channel] = partial(self._fan_out, channel)
+            await self.backplane.subscribe(channel, self._listeners[channel])
+
+    async def leave(self, conn: Connection, channel: str) -> None:
+        conn.channels.discard(channel)
+        self.channels.get(channel, set()).discard(conn)
+        await self._release(channel)
+
+    async def disconnect(self, conn: Connection) -> None:
+        conn.abort(None)
+        self.connections.discard(conn)
+        for channel in list(conn.channels):
+            await self.leave(conn, channel)
+
+    def watch(self, conn: Connection, user_id: str) -> None:
+        """Have `conn` receive presence changes of the user (see send_to_watchers)"""
+        if conn.closed:
+            return
+        conn.watching.add(user_id)
+        self.watchers.setdefault(user_id, set()).add(conn)
+
+    def unwatch(self, conn: Connection, user_id: str) -> None:
+        conn.watching.discard(user_id)
+        self._unwatch(conn, user_id)
+
+    def _unwatch(self, conn: Connection, user_id: str) -> None:
+        watchers = self.watchers.get(user_id)
+        if watchers is not None:
+            watchers.discard(conn)
+            if not watchers:
+                del self.watchers[user_id]
+
+    def send_to_watchers(self, user_id: str, data: dict) -> None:
+        watchers = self.watchers.get(user_id)
+        if not watchers:
+            return
+        text = encode(data)
+        for conn in list(watchers):
+            conn.send_text(text)
+
+    async def _heartbeat(self) -> None:
+        # One task for all of this worker's sockets rather than a timer per socket
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            now = time.monotonic()
+            ping = encode({"ping": int(time.time())})
+            for conn in list(self.connections):
+                if not conn.multiplexed:
+                    continue  # only the per-user protocol has pings
+                if now - conn.last_seen > self.idle_timeout:
+                    SOCKETS_REAPED.inc("idle")
+                    conn.abort(status.WS_1001_GOING_AWAY)
+                else:
+                    conn.send_text(ping)
+
+    async def _release(self, channel: str) -> None:
+        # Last local socket gone: stop receiving the channel on this worker
+        if not self.channels.get(channel):
+            self.channels.pop(channel, None)
+            listener = self._listeners.pop(channel, None)
+            if listener is not None:
+                await self.backplane.unsubscribe(channel, listener)
+
+    async def _fan_out(self, channel: str, event: dict) -> None:
+        if self.history is not None and "seq" in event:
+            self.history.record(event["room"], event["seq"], event["data"])
+        conns = self.channels.get(channel)
+        if not conns:
+            return
+        exclude = event.get("exclude")
+        plain = tagged = None
+        for conn in list(conns):
+            if conn.id == exclude:
+                continue
+            if conn.multiplexed and "room" in event:
+                if tagged is None:
+                    tagged = encode({"room": event["room"], **event["data"]})
+                conn.send_text(tagged)
+            else:
+                if plain is None:
+                    plain = encode(event["data"])
+                conn.send_text(plain)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def queued_frames(self) -> int:
+        return sum(conn.queue.qsize() for conn in list(self.connections))
+
+    def max_queue_depth(self) -> int:
+        return max((conn.queue.qsize() for conn in list(self.connections)), default=0)
+
+
+connections = ConnectionManager(
+    broadcast,
+    queue_size=settings.WS_SEND_QUEUE_SIZE,
+    send_timeout=settings.WS_SEND_TIMEOUT,
+    slow_consumer_policy=settings.WS_SLOW_CONSUMER_POLICY,
+    ping_interval=settings.WS_PING_INTERVAL,
+    idle_timeout=settings.WS_IDLE_TIMEOUT,
+    history=replay_buffer,
+)
+
+metrics.gauge_func(
+    "chat_ws_connections", "Open chat websocket connections, per-room and per-user",
+    lambda: {
+        ("user",): sum(1 for conn in list(connections.connections) if conn.multiplexed),
+        ("room",): sum(1 for conn in list(connections.connections) if not conn.multiplexed),
+    },
+    ("kind",),
+)
+metrics.gauge_func(
+    "chat_ws_rooms", "Chat rooms with at least one open websocket",
+    lambda: sum(1 for channel in list(connections.channels) if channel.startswith("chat:")),
+)
+metrics.gauge_func("chat_ws_send_queue_frames", "Frames waiting in websocket send queues", connections.queued_frames)
+metrics.gauge_func(
+    "chat_ws_send_queue_max_depth", "Longest websocket send queue on this worker", connections.max_queue_depth,
+)
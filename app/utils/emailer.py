@@ -2,7 +2,9 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart # Import MIMEMultipart for proper email construction
 from app.core.config import settings
+from app.core.tracing import traced
 
+@traced("email.send")
 def send_email(to_email: str, subject: str, body: str) -> None:
     # Check if necessary email settings are configured
     if not settings.MAIL_SERVER or not settings.MAIL_USERNAME or not settings.MAIL_PASSWORD:
@@ -3,6 +3,7 @@ import uuid
 from typing import Tuple
 from fastapi import UploadFile
 from app.core.config import settings
+from app.core.tracing import start_span, traced
 import boto3  # type: ignore
 from botocore.config import Config  # type: ignore
 
@@ -34,6 +35,13 @@ def get_s3_client():
     )
 
 
+def upload_to_s3(fileobj, key: str) -> None:
+    """Stream a file object to the configured S3 bucket under `key`."""
+    with start_span("storage.s3_upload", {"storage.bucket": settings.S3_BUCKET, "storage.key": key}, kind="client"):
+        get_s3_client().upload_fileobj(fileobj, settings.S3_BUCKET, key)
+
+
+@traced("storage.save_upload")
 def save_upload(file: UploadFile, subdir: str = "uploads") -> str:
     """
     Save a file either to local storage or S3 depending on STORAGE_BACKEND.
@@ -46,8 +54,7 @@ def save_upload(file: UploadFile, subdir: str = "uploads") -> str:
     print(f"[DEBUG] Storage backend: {settings.STORAGE_BACKEND}")
 
     if settings.STORAGE_BACKEND == "S3":
-        s3 = get_s3_client()
-        s3.upload_fileobj(file.file, settings.S3_BUCKET, key)
+        upload_to_s3(file.file, key)
         print(f"[DEBUG] Uploaded to S3: {key}")
     else:
         base = settings.UPLOAD_DIR or "./uploads"
@@ -76,6 +83,7 @@ def save_upload(file: UploadFile, subdir: str = "uploads") -> str:
     return public_url
 
 
+@traced("storage.save_upload")
 def save_upload_with_key(file: UploadFile, subdir: str = "uploads") -> Tuple[str, str]:
     """
     Save file and return both (key, public_url).
@@ -84,8 +92,7 @@ def save_upload_with_key(file: UploadFile, subdir: str = "uploads") -> Tuple[str
     key = gen_object_key(subdir, file.filename)
 
     if settings.STORAGE_BACKEND == "S3":
-        s3 = get_s3_client()
-        s3.upload_fileobj(file.file, settings.S3_BUCKET, key)
+        upload_to_s3(file.file, key)
     else:
         base = settings.UPLOAD_DIR or "./uploads"
         abs_path = os.path.join(base, key)
@@ -0,0 +1,88 @@
+"""
+Throughput of the listings browse query through the sync (psycopg2, threadpool) and
+async (asyncpg, event loop) session paths, in a single process - i.e. one uvicorn
+worker each, so the comparison is at equal worker counts.
+
+Both handlers run the same two statements as GET /api/v1/listings (count + page).
+Requests are driven through the ASGI interface with N concurrent clients; an
+optional server-side delay (pg_sleep) stands in for network/DB latency, which is
+where the threadpool (40 threads, pool_size 5 + 10 overflow) starts to queue.
+
+Needs a reachable PostgreSQL in DATABASE_URL with the app's schema.
+Usage: python scripts/bench_async_db.py [requests] [concurrency] [delay_ms]
+"""
+import sys
+import os
+import time
+import asyncio
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app.api.deps import AsyncDbDep, get_db
+from app.models.listing import Listing
+
+logging.disable(logging.CRITICAL)
+
+
+def build_app(delay_ms: float) -> FastAPI:
+    app = FastAPI()
+    delay = text("SELECT pg_sleep(:s)").bindparams(s=delay_ms / 1000)
+
+    @app.get("/sync")
+    def sync_listings(db: Session = Depends(get_db)):
+        if delay_ms:
+            db.execute(delay)
+        total = db.scalar(select(func.count()).select_from(Listing))
+        items = db.scalars(select(Listing).order_by(Listing.created_at.desc()).limit(5)).all()
+        return {"total": total, "count": len(items)}
+
+    @app.get("/async")
+    async def async_listings(db: AsyncDbDep):
+        if delay_ms:
+            await db.execute(delay)
+        total = await db.scalar(select(func.count()).select_from(Listing))
+        items = (await db.scalars(select(Listing).order_by(Listing.created_at.desc()).limit(5))).all()
+        return {"total": total, "count": len(items)}
+
+    return app
+
+
+async def drive(app: FastAPI, path: str, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(20):  # warm-up: open pool connections, fill statement caches
+            (await client.get(path)).raise_for_status()
+
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                (await client.get(path)).raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+
+def main() -> None:
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    delay_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+    app = build_app(delay_ms)
+    print(f"{requests} requests, {concurrency} concurrent clients, {delay_ms}ms simulated DB latency")
+    for path in ("/sync", "/async"):
+        rps = asyncio.run(drive(app, path, requests, concurrency))
+        print(f"{path:<7} {rps:10.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
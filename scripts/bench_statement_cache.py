@@ -0,0 +1,122 @@
+"""
+Per-call Python overhead of the hot lookups: the old Query/select() forms against
+the cached lambda statements in app/db/statements.py.
+
+"build" needs no database: it times what happens before the compiled-SQL cache is
+consulted on every call (constructing the statement and generating its cache key),
+which is the part lambda_stmt removes. "execute" runs each form through a Session
+against DATABASE_URL, so the difference shows up next to a real round trip; it is
+skipped when the database is unreachable.
+
+Usage: python scripts/bench_statement_cache.py [iterations]
+"""
+import sys
+import os
+import time
+import logging
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.db import statements
+from app.db.session import SessionLocal
+from app.models.chat import ChatRoom
+from app.models.listing import Listing
+from app.models.user import User
+
+logging.disable(logging.CRITICAL)
+
+
+def query_forms(db: Session):
+    """The lookups as the endpoints wrote them before the statement cache"""
+    return {
+        "user by id": lambda: db.query(User).filter(User.id == "bench-user").limit(1),
+        "listing by id": lambda: db.query(Listing).filter(Listing.id == 1).limit(1),
+        "chat room": lambda: db.query(ChatRoom).filter(
+            ChatRoom.listing_id == 1,
+            ((ChatRoom.participant1_id == "a") & (ChatRoom.participant2_id == "b")) |
+            ((ChatRoom.participant1_id == "b") & (ChatRoom.participant2_id == "a"))
+        ).limit(1),
+    }
+
+
+def select_forms():
+    return {
+        "user by id": lambda: select(User).where(User.id == "bench-user").limit(1),
+        "listing by id": lambda: select(Listing).where(Listing.id == 1).limit(1),
+        "chat room": lambda: select(ChatRoom).where(
+            ChatRoom.listing_id == 1,
+            ((ChatRoom.participant1_id == "a") & (ChatRoom.participant2_id == "b")) |
+            ((ChatRoom.participant1_id == "b") & (ChatRoom.participant2_id == "a"))
+        ).limit(1),
+    }
+
+
+def cached_forms():
+    return {
+        "user by id": lambda: statements.user_by_id("bench-user"),
+        "listing by id": lambda: statements.listing_by_id(1),
+        "chat room": lambda: statements.chat_room_for(1, "a", "b"),
+    }
+
+
+def per_call_us(fn, iterations: int) -> float:
+    for _ in range(min(iterations, 100)):
+        fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def report(title: str, rows: dict) -> None:
+    print(f"\n{title}")
+    print(f"{'':<15}{'query()':>12}{'select()':>12}{'cached':>12}{'saved':>10}")
+    for name, (query_us, select_us, cached_us) in rows.items():
+        print(f"{name:<15}{query_us:>10.1f}us{select_us:>10.1f}us{cached_us:>10.1f}us{query_us - cached_us:>8.1f}us")
+
+
+def bench_build(iterations: int) -> None:
+    db = Session()
+    queries, selects, cached = query_forms(db), select_forms(), cached_forms()
+    report("build (statement + cache key, no DB)", {
+        name: (
+            per_call_us(lambda: queries[name]()._statement_20()._generate_cache_key(), iterations),
+            per_call_us(lambda: selects[name]()._generate_cache_key(), iterations),
+            per_call_us(lambda: cached[name]()._generate_cache_key(), iterations),
+        )
+        for name in cached
+    })
+
+
+def bench_execute(iterations: int) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(select(1))
+    except Exception as e:
+        print(f"\nexecute: skipped, database unreachable ({str(e).splitlines()[0]})")
+        return
+    try:
+        queries, selects, cached = query_forms(db), select_forms(), cached_forms()
+        report("execute (through a Session, one round trip each)", {
+            name: (
+                per_call_us(lambda: queries[name]().first(), iterations),
+                per_call_us(lambda: db.scalar(selects[name]()), iterations),
+                per_call_us(lambda: db.scalar(cached[name]()), iterations),
+            )
+            for name in cached
+        })
+    finally:
+        db.close()
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    bench_build(iterations)
+    bench_execute(max(iterations // 10, 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Statement-budget check for the endpoints that are easy to regress into N+1s.
+
+Seeds the same synthetic rows as check_query_plans.py inside a transaction, calls the
+endpoints through TestClient with their session bound to that transaction, and checks
+the X-DB-Queries / X-DB-N-Plus-One headers against each endpoint's budget. Everything
+is rolled back at the end; point it at a scratch database anyway.
+
+Needs the schema at alembic head (`alembic upgrade head`) and ENV other than
+production (the headers are not sent there).
+Exits non-zero when any endpoint goes over budget, so it can run in CI.
+
+Usage: DATABASE_URL=postgresql://... python scripts/check_query_budgets.py [scale]
+"""
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.api.deps import get_current_admin, get_read_db
+from app.db.instrumentation import assert_query_budget
+from app.db.session import engine
+from app.main import app
+from app.models.user import User
+from check_query_plans import seed
+
+# (path, max statements): the admin dependency is overridden, so no auth lookups count
+BUDGETS = [
+    ("/api/v1/admin/stats", 14),
+    ("/api/v1/admin/listings?page_size=50", 2),
+    ("/api/v1/admin/listings?status=ACTIVE&category=books", 2),
+]
+
+
+def check(client: TestClient, path: str, max_queries: int) -> bool:
+    response = client.get(path)
+    used = response.headers.get("x-db-queries", "-")
+    try:
+        assert response.status_code == 200, f"GET {path} returned {response.status_code}: {response.text[:300]}"
+        assert_query_budget(response, max_queries)
+    except AssertionError as e:
+        print(f"FAIL {path:<56} queries={used}")
+        print(f"     {e}")
+        return False
+    print(f"ok   {path:<56} queries={used} budget={max_queries}")
+    return True
+
+
+def main() -> None:
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            sample = seed(conn, scale)
+            admin = User(id=sample["user"], email="admin@plan.test", is_admin=True)
+
+            def read_db():
+                db = Session(bind=conn, autoflush=False)
+                try:
+                    yield db
+                finally:
+                    db.close()
+
+            app.dependency_overrides[get_read_db] = read_db
+            app.dependency_overrides[get_current_admin] = lambda: admin
+            try:
+                client = TestClient(app)
+                results = [check(client, path, budget) for path, budget in BUDGETS]
+            finally:
+                app.dependency_overrides.clear()
+        finally:
+            trans.rollback()
+    failed = results.count(False)
+    print(f"\n{len(results) - failed}/{len(results)} endpoints within their statement budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
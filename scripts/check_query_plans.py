@@ -0,0 +1,197 @@
+"""
+Plan-regression check for the hot queries.
+
+Seeds synthetic rows (users, listings, chat rooms/messages/members, notifications, reviews)
+inside a transaction, ANALYZEs, then EXPLAINs the queries the endpoints run and
+checks that each one is answered from the index it was tuned for rather than a
+sequential scan. Everything is rolled back at the end, but point it at a scratch
+database anyway: the seed takes row locks and bloats the tables until vacuum.
+
+Needs the schema at alembic head (`alembic upgrade head`).
+Exits non-zero when any plan regresses, so it can run in CI.
+
+Usage: DATABASE_URL=postgresql://... python scripts/check_query_plans.py [scale]
+"""
+import sys
+import os
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select, update
+
+from app.db.session import engine
+from app.models.chat import ChatMessage, ChatRoom, ChatRoomMember
+from app.models.listing import Listing
+from app.models.notification import Notification
+from app.models.review import Review
+from app.models.user import User
+from app.services.chat_inbox import inbox_query
+
+CATEGORIES = ["books", "electronics", "furniture", "clothing", "sports", "notes", "bikes", "other"]
+STATUSES = ["ACTIVE"] * 3 + ["SOLD", "ARCHIVED"]
+
+
+def seed(conn, scale: int) -> dict:
+    rnd = random.Random(42)
+    now = datetime.now(timezone.utc)
+
+    def ago() -> datetime:
+        return now - timedelta(minutes=rnd.randrange(60 * 24 * 365))
+
+    users = [f"plan_user_{i}" for i in range(20 * scale)]
+    conn.execute(insert(User), [
+        {"id": uid, "email": f"{uid}@plan.test", "hashed_password": "x", "university_name": rnd.choice(["A", "B", "C"])}
+        for uid in users
+    ])
+
+    listing_ids = conn.execute(insert(Listing).returning(Listing.id), [
+        {
+            "title": f"item {i}", "description": "synthetic", "category": rnd.choice(CATEGORIES),
+            "price": rnd.randrange(1, 500), "status": rnd.choice(STATUSES), "owner_id": rnd.choice(users),
+            "created_at": ago(),
+        }
+        for i in range(200 * scale)
+    ]).scalars().all()
+
+    rooms = set()
+    while len(rooms) < 50 * scale:
+        a, b = rnd.sample(users, 2)
+        rooms.add((rnd.choice(listing_ids), min(a, b), max(a, b)))
+    rooms = list(rooms)
+    room_ids = conn.execute(insert(ChatRoom).returning(ChatRoom.id, sort_by_parameter_order=True), [
+        {"listing_id": l, "participant1_id": a, "participant2_id": b, "last_message_at": ago()} for l, a, b in rooms
+    ]).scalars().all()
+
+    messages = []
+    for seq in range(500 * scale):
+        i = rnd.randrange(len(rooms))
+        listing_id, a, b = rooms[i]
+        sender, receiver = (a, b) if rnd.random() < 0.5 else (b, a)
+        messages.append({
+            "room_id": room_ids[i], "listing_id": listing_id, "sender_id": sender, "receiver_id": receiver, "content": "hi",
+            "timestamp": ago(), "read_at": None if rnd.random() < 0.05 else now, "seq": seq,
+        })
+    conn.execute(insert(ChatMessage), messages)
+    conn.execute(insert(ChatRoomMember), [
+        {"room_id": rid, "user_id": user, "unread_count": rnd.randrange(3)}
+        for rid, (_, a, b) in zip(room_ids, rooms) for user in (a, b)
+    ])
+
+    conn.execute(insert(Notification), [
+        {
+            "user_id": rnd.choice(users), "title": "t", "message": "m", "type": "system",
+            "is_read": rnd.random() > 0.1, "created_at": ago(),
+        }
+        for _ in range(500 * scale)
+    ])
+    conn.execute(insert(Review), [
+        {"reviewer_id": rnd.choice(users), "reviewed_id": rnd.choice(users), "rating": rnd.randint(1, 5)}
+        for _ in range(50 * scale)
+    ])
+
+    for table in ("users", "listings", "chat_rooms", "chat_messages", "chat_room_members", "notifications", "reviews"):
+        conn.exec_driver_sql(f"ANALYZE {table}")
+
+    listing_id, a, b = rooms[0]
+    return {"user": a, "peer": b, "listing_id": listing_id, "room_id": room_ids[0], "now": now}
+
+
+def hot_queries(s: dict):
+    """(description, statement, indexes that may serve it) - mirrors the endpoint queries"""
+    return [
+        ("listings browse", select(Listing).order_by(Listing.created_at.desc()).limit(5),
+         {"ix_listings_created_at"}),
+        ("search, default ACTIVE filter",
+         select(Listing).where(Listing.status == "ACTIVE").order_by(Listing.created_at.desc()).limit(10),
+         {"ix_listings_active_created_at", "ix_listings_status_created_at"}),
+        ("admin listings by status",
+         select(Listing).where(Listing.status == "SOLD").order_by(Listing.created_at.desc()).limit(20),
+         {"ix_listings_status_created_at"}),
+        ("trending categories",
+         select(Listing.category, func.count(Listing.id)).where(
+             Listing.created_at >= s["now"] - timedelta(days=7), Listing.status == "ACTIVE"
+         ).group_by(Listing.category),
+         {"ix_listings_active_created_at", "ix_listings_status_created_at"}),
+        ("chat history",
+         select(ChatMessage).where(
+             ChatMessage.room_id == s["room_id"], ChatMessage.deleted == False  # noqa: E712
+         ).order_by(ChatMessage.id.desc()).limit(51),
+         {"ix_chat_messages_room_id"}),
+        ("chat history, before_id",
+         select(ChatMessage).where(
+             ChatMessage.room_id == s["room_id"], ChatMessage.id < 2**31 - 1, ChatMessage.deleted == False  # noqa: E712
+         ).order_by(ChatMessage.id.desc()).limit(51),
+         {"ix_chat_messages_room_id"}),
+        ("chat resume from seq",
+         select(ChatMessage).where(ChatMessage.room_id == s["room_id"], ChatMessage.seq > 2**31 - 100)
+         .order_by(ChatMessage.seq).limit(501),
+         {"ix_chat_messages_room_seq"}),
+        ("mark room read up to a message",
+         update(ChatMessage).where(
+             ChatMessage.room_id == s["room_id"], ChatMessage.receiver_id == s["user"],
+             ChatMessage.id <= 2**31 - 1, ChatMessage.read_at.is_(None),
+         ).values(read_at=s["now"]),
+         {"ix_chat_messages_room_unread", "ix_chat_messages_room_id"}),
+        ("chat rooms of a user",
+         select(ChatRoom).where(
+             (ChatRoom.participant1_id == s["user"]) | (ChatRoom.participant2_id == s["user"])
+         ).order_by(ChatRoom.last_message_at.desc().nullslast()),
+         {"ix_chat_rooms_participant1", "ix_chat_rooms_participant2"}),
+        ("chat inbox page", inbox_query(s["user"], 21),
+         {"ix_chat_rooms_participant1", "ix_chat_rooms_participant2"}),
+        ("notifications list",
+         select(Notification).where(Notification.user_id == s["user"])
+         .order_by(Notification.created_at.desc()).limit(50),
+         {"ix_notifications_user_created"}),
+        ("notifications unread count",
+         select(func.count()).select_from(Notification).where(
+             Notification.user_id == s["user"], Notification.is_read == False  # noqa: E712
+         ),
+         {"ix_notifications_user_unread", "ix_notifications_user_created"}),
+        ("reviews of a user", select(Review).where(Review.reviewed_id == s["user"]),
+         {"ix_reviews_reviewed_id"}),
+    ]
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def check(conn, description: str, stmt, expected: set) -> bool:
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(plan_nodes(plan[0]["Plan"]))
+    used = {node["Index Name"] for node in nodes if "Index Name" in node}
+    seq_scans = {node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"}
+    ok = bool(used & expected) and not seq_scans
+    detail = f"indexes={sorted(used) or '-'}" + (f" seq_scan={sorted(seq_scans)}" if seq_scans else "")
+    print(f"{'ok  ' if ok else 'FAIL'} {description:<32} {detail}")
+    if not ok:
+        print("     expected one of", sorted(expected))
+        print("     " + json.dumps(plan[0]["Plan"], indent=2).replace("\n", "\n     "))
+    return ok
+
+
+def main() -> None:
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            sample = seed(conn, scale)
+            results = [check(conn, *query) for query in hot_queries(sample)]
+        finally:
+            trans.rollback()
+    failed = results.count(False)
+    print(f"\n{len(results) - failed}/{len(results)} plans use their indexes")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
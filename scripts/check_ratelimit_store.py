@@ -0,0 +1,137 @@
+"""
+Behaviour check for the shared-store rate limiter.
+
+- GCRA_RESERVE_SCRIPT: the reservation semantics (grants, partial batches, denials that
+  leave the bucket untouched) against InMemoryStore, and against the Lua script in a
+  real Redis when REDIS_URL is set, so the two can't drift apart.
+- SharedStoreBackend: two workers sharing one store never grant more than the budget,
+  and leased units are spent without a store round trip.
+- Fallback: an unreachable store is answered by the local limiter and retried after
+  `retry_after`.
+
+Exits non-zero when any check fails, so it can run in CI.
+
+Usage: [REDIS_URL=redis://...] python scripts/check_ratelimit_store.py
+"""
+import sys
+import os
+import asyncio
+import logging
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.ratelimit import GCRA_RESERVE_SCRIPT, InMemoryStore, SharedStoreBackend
+
+
+class CountingStore(InMemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.evals = 0
+
+    async def eval(self, script: str, numkeys: int, *args):
+        self.evals += 1
+        return await super().eval(script, numkeys, *args)
+
+
+async def reserve(store, key: str, want: int, cost: int = 1, calls: int = 10, period: float = 10.0):
+    granted, remaining, reset_after, retry_after = await store.eval(
+        GCRA_RESERVE_SCRIPT, 1, key, period / calls, period, want, cost
+    )
+    return int(granted), int(remaining), float(reset_after), float(retry_after)
+
+
+async def script_semantics(store, prefix: str) -> list:
+    """(description, ok) pairs; 10 calls per 10 s, so one unit refills per second"""
+    results = []
+
+    key = prefix + "single"
+    grants = [(await reserve(store, key, want=1))[0] for _ in range(10)]
+    denied = await reserve(store, key, want=1)
+    results.append(("one unit at a time, up to the budget", grants == [1] * 10))
+    results.append(("denied once the budget is spent", denied[0] == 0 and 0 < denied[3] <= 1.0))
+
+    key = prefix + "batch"
+    first, second, third = [await reserve(store, key, want=4) for _ in range(3)]
+    results.append(("batches of 4 reserved whole", first[:2] == (4, 6) and second[:2] == (4, 2)))
+    results.append(("last batch cut to what is left", third[:2] == (2, 0)))
+
+    key = prefix + "cost"
+    for _ in range(3):
+        await reserve(store, key, want=3, cost=3)
+    too_big = await reserve(store, key, want=3, cost=3)
+    still_one = await reserve(store, key, want=1)
+    results.append(("cost above what is left is denied", too_big[0] == 0))
+    results.append(("a denial leaves the bucket untouched", still_one[0] == 1))
+    return results
+
+
+async def leases() -> list:
+    store = CountingStore()
+    workers = [SharedStoreBackend(store, calls=20, period=60, batch_size=5, lease_seconds=60) for _ in range(2)]
+    first = await workers[0].hit("client")
+    allowed = [first.allowed]
+    for i in range(1, 20):
+        allowed.append((await workers[i % 2].hit("client")).allowed)
+    evals_for_budget = store.evals
+    over = [(await workers[i % 2].hit("client")).allowed for i in range(10)]
+    return [
+        ("whole budget granted across two workers", all(allowed)),
+        ("one store round trip per batch of 5", evals_for_budget == 4),
+        ("remaining counts the store and the lease", first.remaining == 19),
+        ("nothing granted beyond the shared budget", not any(over)),
+    ]
+
+
+async def fallback() -> list:
+    store = CountingStore()
+    store.available = False
+    backend = SharedStoreBackend(store, calls=3, period=60, batch_size=1, retry_after=0.2)
+    local = [(await backend.hit("client")).allowed for _ in range(4)]
+    evals_while_down = store.evals
+    store.available = True
+    await asyncio.sleep(0.25)
+    await backend.hit("client")
+    return [
+        ("local limiter answers while the store is down", local == [True, True, True, False]),
+        ("store not retried before retry_after", evals_while_down == 1),
+        ("store used again after retry_after", store.evals == 2),
+    ]
+
+
+async def main() -> int:
+    logging.basicConfig(level=logging.ERROR)  # the fallback warning is expected
+    sections = [
+        ("InMemoryStore", await script_semantics(InMemoryStore(), "ratelimit:check:")),
+        ("leases", await leases()),
+        ("fallback", await fallback()),
+    ]
+
+    redis_url = os.environ.get("REDIS_URL")
+    if redis_url:
+        import redis.asyncio as redis
+
+        client = redis.from_url(redis_url)
+        prefix = f"ratelimit:check:{uuid.uuid4().hex}:"
+        try:
+            sections.append(("Redis Lua", await script_semantics(client, prefix)))
+        finally:
+            keys = [key async for key in client.scan_iter(match=prefix + "*")]
+            if keys:
+                await client.delete(*keys)
+            await client.aclose()
+    else:
+        print("(REDIS_URL not set: Lua script not checked against Redis)\n")
+
+    failed = 0
+    for section, results in sections:
+        for description, ok in results:
+            failed += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {section:<14} {description}")
+    total = sum(len(results) for _, results in sections)
+    print(f"\n{total - failed}/{total} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))